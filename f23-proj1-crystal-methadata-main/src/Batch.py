@@ -0,0 +1,350 @@
+import sys
+import json
+import time
+import shlex
+import sqlite3
+import contextlib
+
+from Connection import Connection
+from Login import Login
+from Feed import Feed
+from Search import Search
+from Follow import Follow
+from ComposeTweet import ComposeTweet
+from Trending import Trending
+from FollowGraph import FollowGraph
+from Lists import Lists
+from Thread import Thread
+from QueryLog import QueryLog
+
+
+class Batch:
+    """Runs shell commands from a script or a JSONL stream instead of prompting.
+
+    Every line is one command, either as a JSON object, eg.
+        {"cmd": "compose", "text": "hello #world", "reply_to": 12}
+    or as a script line, eg.
+        compose hello #world
+    Each command goes through the same Login/ComposeTweet/Follow/Feed/Search code as the
+    shell (with their messages silenced) and prints one JSON line with its result.
+    """
+    # script-line command -> the JSON fields its arguments fill, in order; a field
+    # starting with * takes the rest of the line
+    SCRIPT_ARGUMENTS = {
+        "login": ["usr", "pwd"],
+        "logout": [],
+        "compose": ["*text"],
+        "reply": ["reply_to", "*text"],
+        "retweet": ["tid"],
+        "follow": ["usr"],
+        "unfollow": ["usr"],
+        "followmany": ["*users"],
+        "followlist": ["lname"],
+        "feed": ["page", "page_size"],
+        "searchtweets": ["*keywords"],
+        "searchusers": ["keyword", "page", "page_size"],
+        "profile": ["usr", "page", "page_size"],
+        "trending": ["period", "k"],
+        "recommend": ["page", "page_size"],
+        "lists": [],
+        "createlist": ["lname"],
+        "listadd": ["lname", "*users"],
+        "listremove": ["lname", "*users"],
+        "listfeed": ["lname", "page", "page_size"],
+        "thread": ["tid", "page", "page_size"],
+    }
+
+    @staticmethod
+    def parse(line: str) -> dict:
+        """Reads one command line
+
+        Args:
+            line (str): a JSON object or a script line
+
+        Returns:
+            dict: the command, with its name under "cmd" (None for a blank line or # comment)
+        """
+        line = line.strip()
+        if line == "" or line.startswith("#"):
+            return None
+        if line.startswith("{"):
+            command = json.loads(line)
+            if not isinstance(command, dict) or "cmd" not in command:
+                raise ValueError("expected an object with a \"cmd\"")
+            return command
+
+        name, _, rest = line.partition(" ")
+        if name not in Batch.SCRIPT_ARGUMENTS:
+            raise ValueError(f"unknown command '{name}'")
+        command = {"cmd": name}
+        for field in Batch.SCRIPT_ARGUMENTS[name]:
+            rest = rest.strip()
+            if rest == "":
+                break
+            if field.startswith("*"):
+                command[field[1:]] = rest
+                break
+            value, _, rest = rest.partition(" ")
+            command[field] = value
+        return command
+
+
+    @staticmethod
+    def page(pager, page: int) -> [dict]:
+        """Moves a pager to a page, returning its rows
+
+        Args:
+            pager (Pager): the pager, on its first page
+            page (int): the 1-based page number
+
+        Returns:
+            list[dict]: the rows (none if past the last page)
+        """
+        while pager.page_number < page:
+            if not pager.next():
+                return []
+        return pager.rows
+
+
+    @staticmethod
+    def execute(command: dict) -> dict:
+        """Runs one command as the currently logged-in user. Does not catch errors.
+
+        Args:
+            command (dict): the parsed command
+
+        Returns:
+            dict: the result of the command
+
+        Raises:
+            ValueError: if the command is unknown, malformed or not allowed
+            PermissionError: if not logged in, or the login fails
+        """
+        name = command["cmd"]
+        if name not in Batch.SCRIPT_ARGUMENTS:
+            raise ValueError(f"unknown command '{name}'")
+        if name != "login" and Login.userID is None:
+            raise PermissionError("not logged in")
+        page = int(command.get("page", 1))
+        page_size = int(command.get("page_size", 5))
+
+        if name == "login":
+            usr = int(command["usr"])
+            if not Login.authenticate_user(usr, str(command["pwd"])):
+                raise PermissionError("login credentials do not match")
+            Login.userID = usr
+            return {"usr": usr, "name": Login.name}
+        elif name == "logout":
+            Login.userID = None
+            Login.name = None
+            return {}
+        elif name in ("compose", "reply"):
+            text = str(command.get("text", ""))
+            replyTo = command.get("reply_to")
+            if replyTo is not None:
+                replyTo = int(replyTo)
+                if not Connection.contains(ComposeTweet.TWEET_EXISTS_QUERY, (replyTo,)):
+                    raise ValueError(f"parent tweet {replyTo} does not exist")
+            if text == "":
+                raise ValueError("empty tweet text")
+            return {"tid": ComposeTweet.postTweet(text, replyTo)}
+        elif name == "retweet":
+            tid = int(command["tid"])
+            if not Connection.contains(ComposeTweet.TWEET_EXISTS_QUERY, (tid,)):
+                raise ValueError(f"tweet {tid} does not exist")
+            if Connection.contains(ComposeTweet.RETWEET_EXISTS_QUERY, (tid, Login.userID)):
+                raise ValueError(f"tweet {tid} already retweeted")
+            ComposeTweet.addRetweetToDB(tid)
+            return {"tid": tid}
+        elif name == "follow":
+            usr = int(command["usr"])
+            if usr == Login.userID or not Connection.contains(Follow.NAME_QUERY, (usr,)):
+                raise ValueError(f"cannot follow user {usr}")
+            return {"usr": usr, "followed": Follow.follow(usr)}
+        elif name == "unfollow":
+            usr = int(command["usr"])
+            if not Connection.contains(Follow.NAME_QUERY, (usr,)):
+                raise ValueError(f"user {usr} does not exist")
+            return {"usr": usr, "unfollowed": Follow.unfollow(usr)}
+        elif name == "followmany":
+            users = command.get("users", [])
+            if isinstance(users, str):
+                users = users.split()
+            return {"followed": Follow.follow_many([int(usr) for usr in users])}
+        elif name == "followlist":
+            lname = str(command["lname"])
+            if not Connection.contains(Follow.LIST_EXISTS_QUERY, (lname,)):
+                raise ValueError(f"list '{lname}' does not exist")
+            return {"lname": lname, "followed": Follow.follow_list(lname)}
+        elif name == "lists":
+            owned, memberOf = Lists.get_lists(Login.userID)
+            return {"owned": [{"lname": lname, "members": members} for lname, members in owned],
+                    "member_of": [{"lname": lname, "owner": owner, "owner_name": ownerName}
+                                  for lname, owner, ownerName in memberOf]}
+        elif name == "createlist":
+            lname = str(command.get("lname", "")).strip()
+            if lname == "" or len(lname.split()) != 1:
+                raise ValueError("expected one list name")
+            if Lists.owner(lname) is not None:
+                raise ValueError(f"list '{lname}' already exists")
+            Lists.create(lname)
+            return {"lname": lname}
+        elif name in ("listadd", "listremove"):
+            lname = str(command["lname"])
+            owner = Lists.owner(lname)
+            if owner is None:
+                raise ValueError(f"list '{lname}' does not exist")
+            if owner != Login.userID:
+                raise PermissionError(f"list '{lname}' belongs to another user")
+            users = command.get("users", [])
+            if isinstance(users, str):
+                users = users.split()
+            users = [int(usr) for usr in users]
+            if name == "listadd":
+                return {"lname": lname, "added": Lists.add_members(lname, users)}
+            return {"lname": lname, "removed": Lists.remove_members(lname, users)}
+        elif name == "listfeed":
+            lname = str(command["lname"])
+            if Lists.owner(lname) is None:
+                raise ValueError(f"list '{lname}' does not exist")
+            pager = Lists.list_feed_pager(lname, page_size)
+            return {"lname": lname, "page": page, "tweets": Batch.page(pager, page)}
+        elif name == "thread":
+            tid = int(command["tid"])
+            chain = Thread.ancestors(tid)
+            if len(chain) == 0:
+                raise ValueError(f"tweet {tid} does not exist")
+            pager = Thread.replies_pager(tid, page_size)
+            return {"tid": tid, "ancestors": chain[:-1], "tweet": chain[-1],
+                    "page": page, "replies": Batch.page(pager, page)}
+        elif name == "feed":
+            pager = Feed.feed_pager(Login.userID, page_size)
+            return {"page": page, "tweets": Batch.page(pager, page)}
+        elif name == "searchtweets":
+            keywords = command.get("keywords", "")
+            if isinstance(keywords, list):
+                keywords = " ".join(shlex.quote(keyword) for keyword in keywords)
+            keywords, order = Search.parse_keywords(keywords)
+            if len(keywords) == 0:
+                raise ValueError("no keywords")
+            pager = Search.tweet_search_pager(keywords, order, page_size)
+            return {"page": page, "tweets": Batch.page(pager, page)}
+        elif name == "searchusers":
+            keyword = str(command.get("keyword", "")).strip()
+            if keyword == "" or len(keyword.split()) != 1:
+                raise ValueError("expected one keyword")
+            pager = Search.user_search_pager(keyword, page_size)
+            return {"page": page, "users": Batch.page(pager, page)}
+        elif name == "trending":
+            period = str(command.get("period", "day"))
+            trending = Trending.top(period, int(command.get("k", 10)))
+            return {"period": period, "hashtags": [
+                {"term": term, "score": round(score, 3), "mentions": mentions}
+                for term, score, mentions in trending]}
+        elif name == "recommend":
+            pager = FollowGraph.recommendation_pager(Login.userID, page_size=page_size)
+            return {"page": page, "users": Batch.page(pager, page)}
+        else:  # profile
+            usr = int(command["usr"])
+            Connection.cursor.execute(Search.PROFILE_QUERY, (usr,))
+            result = Connection.cursor.fetchone()
+            if result is None:
+                raise ValueError(f"user {usr} does not exist")
+            tweets, followers, following = Search.get_user_stats(usr)
+            pager = Search.user_tweets_pager(usr, int(command.get("page_size", 3)))
+            return {"usr": usr, "name": result[0], "city": result[1], "tweets": tweets,
+                    "followers": followers, "following": following,
+                    "page": page, "recent": Batch.page(pager, page)}
+
+
+    @staticmethod
+    def run(lines, output=None, transaction: bool = False) -> bool:
+        """Runs a stream of commands, writing one JSON result line per command.
+            Logs out before and after.
+
+        Args:
+            lines (iterable[str]): the command lines
+            output (file, optional): where to write results. Defaults to stdout.
+            transaction (bool, optional): run all the commands in one transaction,
+                stopping and rolling everything back at the first error. Defaults to False.
+
+        Returns:
+            bool: True if every command succeeded
+        """
+        assert Connection.is_connected()
+        output = output or sys.stdout
+        groupSize, groupDelay = Connection.group_size, Connection.group_delay
+        if transaction:
+            Connection.set_group_commit(sys.maxsize, float("inf"))
+        Login.userID = None
+        Login.name = None
+
+        count = failed = 0
+        held = []  # results reported ok whose writes group commit has not committed yet
+        started = time.perf_counter()
+        for number, line in enumerate(lines, 1):
+            result = {"line": number}
+            try:
+                command = Batch.parse(line)
+                if command is None:
+                    continue
+                result["cmd"] = command["cmd"]
+                QueryLog.tag(command["cmd"])
+                pending = Connection.pending
+                with contextlib.redirect_stdout(None):
+                    result["result"] = Batch.execute(command)
+                result["ok"] = True
+                if Connection.pending == 0:
+                    held = []
+                elif Connection.pending > pending:
+                    held.append(result)
+            except sqlite3.Error as error:
+                # the commands since the last commit are gone with the transaction
+                Connection.rollback()
+                result.update(ok=False, error=f"database error: {error}")
+                if not transaction:
+                    for lost in held:
+                        output.write(json.dumps({"line": lost["line"], "cmd": lost["cmd"], "ok": False,
+                                                 "error": f"rolled back by line {number}"}) + "\n")
+                    failed += len(held)
+                    held = []
+            except (ValueError, TypeError, KeyError, PermissionError) as error:
+                result.update(ok=False, error=str(error) or type(error).__name__)
+
+            count += 1
+            failed += not result["ok"]
+            output.write(json.dumps(result, default=str) + "\n")
+            if transaction and not result["ok"]:
+                Connection.rollback()
+                break
+
+        if transaction and failed == 0:
+            Connection.flush()
+        Connection.set_group_commit(groupSize, groupDelay)
+        Login.userID = None
+        Login.name = None
+
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed > 0 else 0.0
+        summary = f"{count} commands, {failed} failed, {elapsed:.2f}s ({rate:.0f} commands/sec)"
+        if transaction:
+            summary += ", committed" if failed == 0 else ", rolled back"
+        print(summary, file=sys.stderr)
+        return failed == 0
+
+
+    @staticmethod
+    def run_file(path: str, transaction: bool = False) -> bool:
+        """Runs the commands in a script/JSONL file (or stdin for '-')
+
+        Args:
+            path (str): the file
+            transaction (bool, optional): run all the commands in one transaction. Defaults to False.
+
+        Returns:
+            bool: True if every command succeeded
+        """
+        if path == "-":
+            return Batch.run(sys.stdin, transaction=transaction)
+        with open(path) as file:
+            return Batch.run(file, transaction=transaction)
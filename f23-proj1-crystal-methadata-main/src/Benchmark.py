@@ -0,0 +1,481 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import string
+import datetime
+import tempfile
+import statistics
+import contextlib
+from Connection import Connection
+from Setup import Setup
+from Login import Login
+from ComposeTweet import ComposeTweet
+from Feed import Feed
+from Follow import Follow
+from FollowGraph import FollowGraph
+from Search import Search
+from Test import Test
+from Timeline import Timeline
+from UserCache import UserCache
+
+
+class Benchmark:
+    # the hot paths timed by run_suite, in report order
+    OPERATIONS = ["feed", "feed_next", "search_tweets", "search_tweets_relevance",
+                  "search_users", "compose", "follow"]
+    DEFAULT_SIZES = [(1000, 10000), (10000, 100000)]
+
+    @staticmethod
+    def profile_writes(num_tweets: int = 2000, group_size: int = 1) -> {str: float}:
+        """Measures tweet publishing throughput under every connection profile.
+            Each profile gets a fresh db file, and every tweet is published (and
+            committed) through ComposeTweet.addTweetToTweetsDB as in the shell.
+
+        Args:
+            num_tweets (int, optional): # of tweets to publish per profile. Defaults to 2000.
+            group_size (int, optional): group commit size (1 = commit every tweet). Defaults to 1.
+
+        Returns:
+            dict[str, float]: profile name -> tweets/sec
+        """
+        results = {}
+        for profile in Connection.PROFILES:
+            with tempfile.TemporaryDirectory() as tmp:
+                Connection.connect(os.path.join(tmp, "bench.db"), profile)
+                Setup.define_tables()
+                Connection.cursor.execute(
+                    "INSERT INTO users VALUES (1, 'pwd', 'Bench', 'bench@example.com', 'City', 0)")
+                Connection.connection.commit()
+                Login.userID = 1
+                Connection.set_group_commit(group_size)
+
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(None):
+                    for tid in range(1, num_tweets + 1):
+                        ComposeTweet.addTweetToTweetsDB(tid, f"tweet {tid} #bench #tag{tid % 10}", None)
+                    Connection.flush()
+                elapsed = time.perf_counter() - start
+
+                Connection.set_group_commit(1)
+
+                Login.userID = None
+                Connection.close()
+            results[profile] = num_tweets / elapsed
+            print(f"{profile:>10}: {results[profile]:10.1f} tweets/sec ({elapsed:.2f}s, group commit {group_size})")
+        return results
+
+
+    @staticmethod
+    def split_hashtags(text: str) -> [str]:
+        """The original per-character hashtag scan, kept as the baseline for
+            profile_hashtags (repeated hashtags are listed again)
+
+        Args:
+            text (str): the tweet text
+
+        Returns:
+            list[str]: the hashtag terms, in order of appearance
+        """
+        hashtags = []
+        for word in text.split():
+            if word[0].startswith("#"):
+                for i in range(1, len(word)):
+                    if word[i] in string.punctuation:
+                        word = word[:i]
+                        break
+                hashtags.append(word[1:].lower())
+        return hashtags
+
+
+    @staticmethod
+    def profile_hashtags(num_texts: int = 100000, seed: int = 0) -> {str: float}:
+        """Times hashtag extraction over synthetic tweet texts: the original scan,
+            ComposeTweet.extractHashTags per text, and ComposeTweet.extractHashTagsBatch.
+            Checks that all three find the same hashtags first.
+
+        Args:
+            num_texts (int, optional): # of texts to generate. Defaults to 100000.
+            seed (int, optional): random seed. Defaults to 0.
+
+        Returns:
+            dict[str, float]: method -> texts/sec
+        """
+        rng = random.Random(seed)
+        words = Test.WORDS + ["#" + word for word in Test.WORDS[:20]] + \
+            ["#Tag!", "#x.y", "#", "##dup", "#UPPER", "#mixed_case", "#caf\u00e9", "end,#1"]
+        texts = [" ".join(rng.choices(words, k=rng.randint(3, 20))) for _ in range(num_texts)]
+        tweets = list(enumerate(texts))
+
+        expected = [list(dict.fromkeys(Benchmark.split_hashtags(text))) for text in texts]
+        assert [ComposeTweet.extractHashTags(text) for text in texts] == expected
+        mentions, terms = ComposeTweet.extractHashTagsBatch(tweets)
+        assert mentions == [(tid, term) for tid, terms in enumerate(expected) for term in terms]
+        assert set(terms) == set(term for _, term in mentions)
+
+        methods = {
+            "split loop": lambda: [Benchmark.split_hashtags(text) for text in texts],
+            "compiled": lambda: [ComposeTweet.extractHashTags(text) for text in texts],
+            "compiled batch": lambda: ComposeTweet.extractHashTagsBatch(tweets),
+        }
+        results = {}
+        for name, method in methods.items():
+            elapsed = min(Benchmark.time_call(method) for _ in range(3))
+            results[name] = num_texts / elapsed
+            print(f"{name:>15}: {results[name]:12.0f} texts/sec "
+                  f"({results[name] / results['split loop']:.2f}x)")
+        return results
+
+
+    @staticmethod
+    def profile_graph(num_users: int = 640000, iterations: int = 200, seed: int = 0,
+                      data_dir: str = None) -> {str: dict}:
+        """Compares FollowGraph with the equivalent SQL queries on a synthetic follow graph
+            (~16 follows per user, so ~10M edges for the default size). Checks that both
+            give the same answers for a sample of users first.
+
+        Args:
+            num_users (int, optional): # of users to generate. Defaults to 640000.
+            iterations (int, optional): # of timed calls per operation. Defaults to 200.
+            seed (int, optional): random seed for the graph and the calls. Defaults to 0.
+            data_dir (str, optional): where to keep the generated db. Defaults to a temp dir.
+
+        Returns:
+            dict[str, dict]: "<operation> graph|sql" -> see Benchmark.summarize
+        """
+        tmp = tempfile.mkdtemp() if data_dir is None else None
+        path = os.path.join(data_dir or tmp, f"graph-{num_users}-s{seed}.db")
+        try:
+            started = time.perf_counter()
+            Benchmark.prepare_db(path, num_users, 0, seed)
+            print(f"Generated/opened {path} ({time.perf_counter() - started:.1f}s)")
+            Connection.connect(path)
+            elapsed = FollowGraph.load()
+            memory = sum(len(values) * values.itemsize for values in (
+                FollowGraph.out_offsets, FollowGraph.out_neighbors,
+                FollowGraph.in_offsets, FollowGraph.in_neighbors))
+            print(f"Loaded {FollowGraph.edges} edges in {elapsed:.1f}s ({memory / 2 ** 20:.0f} MiB)")
+
+            rng = random.Random(seed)
+            users = [rng.randint(1, num_users) for _ in range(iterations + 10)]
+            others = [rng.randint(1, num_users) for _ in range(iterations + 10)]
+
+            def sql(query: str, params) -> list:
+                Connection.cursor.execute(query, params)
+                return [row[0] for row in Connection.cursor.fetchall()]
+
+            def sql_recommend(usr: int) -> list:
+                Connection.cursor.execute(FollowGraph.RECOMMEND_QUERY, {"usr": usr, "k": 10})
+                return [tuple(row) for row in Connection.cursor.fetchall()]
+
+            for usr, other in zip(users[:50], others[:50]):
+                assert list(FollowGraph.followees(usr)) == sql(FollowGraph.FOLLOWEES_QUERY, (usr,))
+                assert list(FollowGraph.followers(usr)) == sql(FollowGraph.FOLLOWERS_QUERY, (usr,))
+                assert FollowGraph.follows(usr, other) == Connection.contains(FollowGraph.FOLLOWS_QUERY, (usr, other))
+                assert FollowGraph.recommend(usr) == sql_recommend(usr)
+
+            operations = {
+                "followees graph": lambda idx: FollowGraph.followees(users[idx]),
+                "followees sql": lambda idx: sql(FollowGraph.FOLLOWEES_QUERY, (users[idx],)),
+                "followers graph": lambda idx: FollowGraph.followers(users[idx]),
+                "followers sql": lambda idx: sql(FollowGraph.FOLLOWERS_QUERY, (users[idx],)),
+                "mutual graph": lambda idx: FollowGraph.is_mutual(users[idx], others[idx]),
+                "mutual sql": lambda idx: Connection.contains(FollowGraph.FOLLOWS_QUERY, (users[idx], others[idx]))
+                    and Connection.contains(FollowGraph.FOLLOWS_QUERY, (others[idx], users[idx])),
+                "recommend graph": lambda idx: FollowGraph.recommend(users[idx]),
+                "recommend sql": lambda idx: sql_recommend(users[idx]),
+            }
+            results = {name: Benchmark.time_operation(operation, iterations)
+                       for name, operation in operations.items()}
+            Benchmark.print_results(f"{FollowGraph.edges} edges", results)
+            return results
+        finally:
+            FollowGraph.unload()
+            if Connection.is_connected():
+                Connection.close()
+            if tmp is not None:
+                shutil.rmtree(tmp, ignore_errors=True)
+
+
+    @staticmethod
+    def time_call(function) -> float:
+        """Times one call of a function
+
+        Args:
+            function (callable): called without arguments
+
+        Returns:
+            float: seconds taken
+        """
+        start = time.perf_counter()
+        function()
+        return time.perf_counter() - start
+
+
+    @staticmethod
+    def summarize(samples: [float], elapsed: float) -> {str: float}:
+        """Computes the latency percentiles and throughput of a timed operation
+
+        Args:
+            samples (list[float]): seconds taken by each call
+            elapsed (float): seconds taken by all the calls together
+
+        Returns:
+            dict[str, float]: count, p50/p95/p99/mean in ms, and ops/sec
+        """
+        if len(samples) > 1:
+            cuts = statistics.quantiles(samples, n=100, method='inclusive')
+        else:
+            cuts = samples * 99
+        return {
+            "count": len(samples),
+            "p50_ms": cuts[49] * 1000,
+            "p95_ms": cuts[94] * 1000,
+            "p99_ms": cuts[98] * 1000,
+            "mean_ms": statistics.fmean(samples) * 1000,
+            "ops_per_sec": len(samples) / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+    @staticmethod
+    def time_operation(operation, iterations: int, warmup: int = 5) -> {str: float}:
+        """Calls an operation repeatedly, timing each call
+
+        Args:
+            operation (callable): called with the iteration number
+            iterations (int): # of timed calls
+            warmup (int, optional): # of untimed calls made first. Defaults to 5.
+
+        Returns:
+            dict[str, float]: see Benchmark.summarize
+        """
+        for idx in range(warmup):
+            operation(idx)
+        samples = []
+        started = time.perf_counter()
+        for idx in range(iterations):
+            start = time.perf_counter()
+            operation(warmup + idx)
+            samples.append(time.perf_counter() - start)
+        return Benchmark.summarize(samples, time.perf_counter() - started)
+
+
+    @staticmethod
+    def prepare_db(path: str, num_users: int, num_tweets: int, seed: int) -> None:
+        """Generates a synthetic db at path, unless it already exists
+
+        Args:
+            path (str): the db file
+            num_users (int): # of users to generate
+            num_tweets (int): # of tweets to generate
+            seed (int): random seed passed to Test.generate_data
+        """
+        if os.path.exists(path):
+            return
+        Connection.connect(path, "bulk-load")
+        Setup.define_tables()
+        with contextlib.redirect_stdout(None):
+            Test.generate_data(num_users, num_tweets, seed)
+        Connection.close()
+
+
+    @staticmethod
+    def run_size(path: str, iterations: int, seed: int = 0, profile: str = None,
+                 timeline: bool = False) -> {str: dict}:
+        """Times every operation in OPERATIONS against one db, headlessly: the same
+            Feed/Search/ComposeTweet/Follow code the shell runs, minus the prompts.
+            Compose and follow write to the db.
+
+        Args:
+            path (str): the db file (must already have users and tweets)
+            iterations (int): # of timed calls per operation
+            seed (int, optional): random seed picking users and keywords. Defaults to 0.
+            profile (str, optional): connection profile. Defaults to Connection.DEFAULT_PROFILE.
+            timeline (bool, optional): rebuild the fan-out timeline first. Defaults to False.
+
+        Returns:
+            dict[str, dict]: operation -> see Benchmark.summarize
+        """
+        rng = random.Random(seed)
+        Connection.connect(path, profile)
+        UserCache.clear()
+        if timeline:
+            Timeline.rebuild()
+        elif Timeline.is_enabled():
+            Timeline.drop()
+
+        Connection.cursor.execute("SELECT usr FROM users")
+        users = [row[0] for row in Connection.cursor.fetchall()]
+        Connection.cursor.execute("SELECT term FROM hashtags")
+        terms = [row[0] for row in Connection.cursor.fetchall()] or Test.WORDS
+        count = iterations + 10
+        readers = [rng.choice(users) for _ in range(count)]
+        words = [rng.choice(Test.WORDS) if idx % 2 == 0 else rng.choice(terms)
+                 for idx in range(count)]
+        names = [rng.choice(Test.SYLLABLES + Test.CITIES).lower() for _ in range(count)]
+        writers = [rng.choice(users) for _ in range(count)]
+        follows = [(rng.choice(users), rng.choice(users)) for _ in range(count)]
+
+        def compose(idx: int) -> None:
+            Login.userID = writers[idx]
+            ComposeTweet.postTweet(f"benchmark {idx} #{terms[idx % len(terms)]}")
+
+        def follow(idx: int) -> None:
+            Login.userID, flwee = follows[idx]
+            if flwee != Login.userID:
+                Follow.follow(flwee)
+
+        operations = {
+            "feed": lambda idx: Feed.feed_pager(readers[idx]),
+            "feed_next": lambda idx: Feed.feed_pager(readers[idx]).next(),
+            "search_tweets": lambda idx: Search.tweet_search_pager([words[idx]], 'date'),
+            "search_tweets_relevance": lambda idx: Search.tweet_search_pager([words[idx]], 'relevance'),
+            "search_users": lambda idx: Search.user_search_pager(names[idx]),
+            "compose": compose,
+            "follow": follow,
+        }
+        results = {}
+        with contextlib.redirect_stdout(None):
+            for name in Benchmark.OPERATIONS:
+                results[name] = Benchmark.time_operation(operations[name], iterations)
+            Connection.flush()
+        Login.userID = None
+        Connection.close()
+        return results
+
+
+    @staticmethod
+    def run_suite(sizes: [(int, int)] = None, iterations: int = 200, seed: int = 0,
+                  profile: str = None, timeline: bool = False, data_dir: str = None) -> dict:
+        """Benchmarks the hot paths against synthetic dbs of several sizes.
+            Each size is generated once into data_dir (if given, and reused by later
+            runs with the same seed) and copied, so every run starts from the same data.
+
+        Args:
+            sizes (list[tuple[int, int]], optional): (# of users, # of tweets) per db.
+                Defaults to DEFAULT_SIZES.
+            iterations (int, optional): # of timed calls per operation. Defaults to 200.
+            seed (int, optional): random seed for the data and the calls. Defaults to 0.
+            profile (str, optional): connection profile. Defaults to Connection.DEFAULT_PROFILE.
+            timeline (bool, optional): read feeds from the fan-out timeline. Defaults to False.
+            data_dir (str, optional): where to keep the generated dbs. Defaults to a temp dir.
+
+        Returns:
+            dict: the run's settings, and "results" mapping "<users>x<tweets>" -> operation -> stats
+        """
+        sizes = sizes or Benchmark.DEFAULT_SIZES
+        run = {
+            "created": datetime.datetime.now().isoformat(timespec='seconds'),
+            "iterations": iterations,
+            "seed": seed,
+            "profile": profile or Connection.DEFAULT_PROFILE,
+            "timeline": timeline,
+            "results": {},
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            for num_users, num_tweets in sizes:
+                label = f"{num_users}x{num_tweets}"
+                source = os.path.join(data_dir or tmp, f"bench-{label}-s{seed}.db")
+                print(f"{label}: generating data...", flush=True)
+                Benchmark.prepare_db(source, num_users, num_tweets, seed)
+                path = os.path.join(tmp, "run.db")
+                shutil.copyfile(source, path)
+                print(f"{label}: running {iterations} iterations per operation...", flush=True)
+                run["results"][label] = Benchmark.run_size(path, iterations, seed, profile, timeline)
+                os.remove(path)
+                Benchmark.print_results(label, run["results"][label])
+        return run
+
+
+    @staticmethod
+    def print_results(label: str, results: {str: dict}) -> None:
+        """Prints the stats of one db size as a table
+
+        Args:
+            label (str): the db size
+            results (dict[str, dict]): operation -> see Benchmark.summarize
+        """
+        print(f"{'':<24} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/sec':>10}   ({label})")
+        for name, stats in results.items():
+            print(f"{name:<24} {stats['p50_ms']:9.3f} {stats['p95_ms']:9.3f} "
+                  f"{stats['p99_ms']:9.3f} {stats['ops_per_sec']:10.1f}")
+        print()
+
+
+    @staticmethod
+    def compare(old: dict, new: dict, threshold: float = 0.1) -> bool:
+        """Compares two runs of run_suite, printing the change in p95 latency and
+            throughput of every operation both runs measured
+
+        Args:
+            old (dict): the baseline run
+            new (dict): the run to check
+            threshold (float, optional): relative slowdown (of p95, or of ops/sec) that
+                counts as a regression. Defaults to 0.1.
+
+        Returns:
+            bool: True if nothing regressed
+        """
+        regressions = 0
+        for label, results in new["results"].items():
+            baseline = old["results"].get(label)
+            if baseline is None:
+                print(f"{label}: not in the baseline, skipped")
+                continue
+            print(f"{'':<24} {'p95 ms':>19} {'change':>8} {'ops/sec':>21} {'change':>8}   ({label})")
+            for name, stats in results.items():
+                if name not in baseline:
+                    continue
+                before = baseline[name]
+                latency = stats["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] > 0 else 0.0
+                throughput = stats["ops_per_sec"] / before["ops_per_sec"] - 1 if before["ops_per_sec"] > 0 else 0.0
+                regressed = latency > threshold or throughput < -threshold
+                regressions += regressed
+                print(f"{name:<24} {before['p95_ms']:9.3f}{stats['p95_ms']:10.3f} {latency:+8.1%} "
+                      f"{before['ops_per_sec']:10.1f}{stats['ops_per_sec']:11.1f} {throughput:+8.1%}"
+                      f"{'   REGRESSION' if regressed else ''}")
+            print()
+        print(f"{regressions} regression(s) over {threshold:.0%}.")
+        return regressions == 0
+
+
+if __name__ == "__main__":
+    def flag_value(flag: str, default=None):
+        if flag in sys.argv and sys.argv.index(flag) < len(sys.argv) - 1:
+            return sys.argv[sys.argv.index(flag) + 1]
+        return default
+
+    try:
+        if len(sys.argv) > 1 and sys.argv[1] == "suite":
+            sizes = None
+            if flag_value("--sizes") is not None:
+                sizes = [tuple(int(n) for n in size.split("x"))
+                         for size in flag_value("--sizes").split(",")]
+                assert all(len(size) == 2 for size in sizes)
+            profile = flag_value("--profile")
+            assert profile is None or profile in Connection.PROFILES
+            run = Benchmark.run_suite(sizes, int(flag_value("-i", 200)), int(flag_value("--seed", 0)),
+                                      profile, "--timeline" in sys.argv, flag_value("--data-dir"))
+            output = flag_value("-o")
+            if output is not None:
+                with open(output, "w") as file:
+                    json.dump(run, file, indent=2)
+                print(f"Results saved to {output}")
+        elif len(sys.argv) > 1 and sys.argv[1] == "hashtags":
+            Benchmark.profile_hashtags(int(flag_value("-n", 100000)), int(flag_value("--seed", 0)))
+        elif len(sys.argv) > 1 and sys.argv[1] == "graph":
+            Benchmark.profile_graph(int(flag_value("--users", 640000)), int(flag_value("-i", 200)),
+                                    int(flag_value("--seed", 0)), flag_value("--data-dir"))
+        elif len(sys.argv) > 3 and sys.argv[1] == "compare":
+            with open(sys.argv[2]) as file:
+                old = json.load(file)
+            with open(sys.argv[3]) as file:
+                new = json.load(file)
+            sys.exit(0 if Benchmark.compare(old, new, float(flag_value("--threshold", 0.1))) else 1)
+        else:
+            Benchmark.profile_writes(int(flag_value("-n", 2000)), int(flag_value("-g", 1)))
+    except (ValueError, AssertionError):
+        print("Invalid command-line arguments!")
+        os._exit(1)
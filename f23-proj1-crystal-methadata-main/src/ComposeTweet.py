@@ -1,4 +1,5 @@
 import os
+import re
 import string
 import datetime
 
@@ -6,26 +7,16 @@ from Connection import Connection
 from Login import Login
 from Test import Test
 from Setup import Setup
+from Timeline import Timeline
+from UserCache import UserCache
+from Sequence import Sequence
+from Trending import Trending
+from Thread import Thread
 
 
 class ComposeTweet:
-    @staticmethod
-    def countTweets() -> int:
-        """Counts the number of tweets and finds maximum tid
-
-        Returns:
-            int: maximum tid, or 0 if there are no tweets
-        """
-        assert Connection.is_connected()
-        query = "SELECT MAX(tid) FROM tweets"
-        Connection.cursor.execute(query)
-        entry = Connection.cursor.fetchone()
-
-        if entry[0] is None:
-            return 0
-        else:
-            return entry[0]
-
+    TWEET_EXISTS_QUERY = "SELECT tid FROM tweets WHERE tid = ?;"
+    RETWEET_EXISTS_QUERY = "SELECT tid FROM retweets WHERE tid = ? AND usr = ?;"
 
     @staticmethod
     def createTweet(replyTo: int = None) -> None:
@@ -38,7 +29,7 @@ class ComposeTweet:
         # checks if it is a tweet or reply (checks if tweet being replied to exists)
         if replyTo == None:
             tweet = input("Enter tweet message: ")
-        elif Connection.contains("SELECT tid FROM tweets WHERE tid = ?;", (replyTo,)):
+        elif Connection.contains(ComposeTweet.TWEET_EXISTS_QUERY, (replyTo,)):
             tweet = input("Enter reply: ")
         else:
             print("Parent tweet does not exist.\n")
@@ -48,8 +39,23 @@ class ComposeTweet:
             print("Empty tweet text. Cancelling compose.\n")
             return
 
-        tid = ComposeTweet.countTweets() + 1  # the tid for new tweet/reply
+        ComposeTweet.postTweet(tweet, replyTo)
+
+
+    @staticmethod
+    def postTweet(tweet: str, replyTo: int = None) -> int:
+        """Publishes a tweet/reply by the currently logged-in user under a new tweet id
+
+        Args:
+            tweet (str): the content of the tweet
+            replyTo (int, optional): the tid of the (existing) tweet to reply to. Defaults to None.
+
+        Returns:
+            int: the new tweet id
+        """
+        tid = Sequence.next_id('tweets')  # the tid for new tweet/reply
         ComposeTweet.addTweetToTweetsDB(tid, tweet, replyTo)
+        return tid
 
 
     @staticmethod
@@ -59,7 +65,7 @@ class ComposeTweet:
         Args:
             tid (int): the tweet id to retweet
         """
-        if Connection.contains("SELECT tid FROM retweets WHERE tid = ? AND usr = ?;", (tid, Login.userID)): 
+        if Connection.contains(ComposeTweet.RETWEET_EXISTS_QUERY, (tid, Login.userID)): 
             print("You have already retweeted this tweet.")
         else:
             ComposeTweet.addRetweetToDB(tid)
@@ -68,7 +74,8 @@ class ComposeTweet:
    
     @staticmethod
     def addTweetToTweetsDB(tid: int, tweet: str, replyTo: int) -> None:
-        """Adds a new tweet to the tweets table in the db
+        """Adds a new tweet to the tweets table in the db, along with its hashtags
+            and mentions, in a single transaction
 
         Args:
             tid (int): the new tweet id
@@ -76,79 +83,104 @@ class ComposeTweet:
             replyTo (int): the tid of tweet to reply to (None if not replying)
         """
         assert Connection.is_connected()
+        tdate = datetime.date.today()
         insert_query = "INSERT INTO tweets (tid, writer, tdate, text, replyto) VALUES (?, ?, ?, ?, ?)"
         Connection.cursor.execute(
-            insert_query, (tid, Login.userID, datetime.date.today(), tweet, replyTo))
-        Connection.connection.commit()
+            insert_query, (tid, Login.userID, tdate, tweet, replyTo))
+        Timeline.fan_out_tweet(tid, Login.userID, tdate)
+        hashtags = ComposeTweet.findHashTags(tid, tweet)
+        Connection.commit()
+        UserCache.invalidate('counts', Login.userID)
+        Trending.record(hashtags, tdate)
+        if replyTo is not None:
+            Thread.reply_posted(replyTo)
 
         if replyTo == None:
             print("Your tweet has successfully been posted!")
         else:
             print("Your reply has successfully been posted!")
 
-        ComposeTweet.findHashTags(tid, tweet)
-
 
     @staticmethod
-    def findHashTags(tid: int, text: str) -> None:
-        """Finds all the hashtags in a new tweet text, adding to the db as necessary
+    def findHashTags(tid: int, text: str) -> [str]:
+        """Finds all the hashtags in a new tweet text, adding to the db as necessary.
+            Does not commit.
 
         Args:
             tid (int): the tweet id of the new tweet
             text (str): the text that is checked for any hashtags
+
+        Returns:
+            list[str]: the hashtag terms found
         """
-        words = text.split()
-        hashtags = []
-        for word in words:
-            if word[0].startswith("#"):
-                for i in range(1, len(word)):
-                    # will process characters after '#' before any punctuations
-                    # assumptions is that hashtags are alphanumeric
-                    if word[i] in string.punctuation:
-                        word = word[:i]
-                        break
-                hashtags.append(word[1:].lower())
+        hashtags = ComposeTweet.extractHashTags(text)
         if len(hashtags) > 0:
-            for hashtag in hashtags:
-                ComposeTweet.addHashtagsToHashtagsDB(hashtag)
-                ComposeTweet.addHashtagsToMentionsDB(tid, hashtag)
+            ComposeTweet.addHashtagsToHashtagsDB(hashtags)
+            ComposeTweet.addHashtagsToMentionsDB(tid, hashtags)
+        return hashtags
+
 
+    # a word starting with '#' and the characters after it up to the first punctuation mark
+    # (the term may be empty, eg. for "#!"); the same words str.split() would give
+    HASHTAG_PATTERN = re.compile(r"(?<!\S)#([^\s" + re.escape(string.punctuation) + r"]*)")
 
     @staticmethod
-    def addHashtagsToHashtagsDB(hashtag: str) -> None:
-        """Adds new hashtag term to hashtags table
+    def extractHashTags(text: str) -> [str]:
+        """Finds the hashtags in a tweet text: each word starting with '#', up to its first
+            punctuation mark, lowercased. A hashtag used more than once is listed once.
 
         Args:
-            hashtag (str): term to add
+            text (str): the tweet text
+
+        Returns:
+            list[str]: the hashtag terms (without '#'), in order of first appearance
         """
-        assert Connection.is_connected()
-        # Check if the hashtag exists in DB
-        query = "SELECT term FROM hashtags WHERE term = ?;"
-        containsDuplicate = Connection.contains(query, (hashtag,))
+        return list(dict.fromkeys(map(str.lower, ComposeTweet.HASHTAG_PATTERN.findall(text))))
 
-        if not containsDuplicate:  # hashtag does not exist
-            insert_query = "INSERT INTO hashtags (term) VALUES (?);"
-            Connection.cursor.execute(insert_query, (hashtag,))
 
-        Connection.connection.commit()
+    @staticmethod
+    def extractHashTagsBatch(tweets: [(int, str)]) -> ([(int, str)], [str]):
+        """Finds the hashtags of many tweets at once, eg. for a bulk load
+
+        Args:
+            tweets (list[tuple[int, str]]): the tid and text of each tweet
+
+        Returns:
+            tuple: the (tid, term) mentions, each once per tweet, and the distinct terms
+                of the whole batch
+        """
+        findall = ComposeTweet.HASHTAG_PATTERN.findall
+        mentions = []
+        for tid, text in tweets:
+            if "#" in text:  # skips most texts without running the pattern
+                mentions.extend((tid, term) for term in dict.fromkeys(map(str.lower, findall(text))))
+        return mentions, list(dict.fromkeys(term for _, term in mentions))
 
 
     @staticmethod
-    def addHashtagsToMentionsDB(tid: int, hashtag: str) -> None:
-        """Adds new hashtag term and the tweet id to mentions table
+    def addHashtagsToHashtagsDB(hashtags: [str]) -> None:
+        """Adds new hashtag terms to hashtags table, skipping existing ones. Does not commit.
 
         Args:
-            tid (int): the tweet id
-            hashtag (str): the hashtag term found in the tweet
+            hashtags (list[str]): terms to add
         """
         assert Connection.is_connected()
-        query = "SELECT tid, term FROM mentions WHERE tid = ? AND term = ?;"
-        containsDuplicate = Connection.contains(query, (tid, hashtag))
+        insert_query = "INSERT OR IGNORE INTO hashtags (term) VALUES (?);"
+        Connection.cursor.executemany(insert_query, [(hashtag,) for hashtag in hashtags])
+
+
+    @staticmethod
+    def addHashtagsToMentionsDB(tid: int, hashtags: [str]) -> None:
+        """Adds hashtag terms and the tweet id to mentions table, skipping repeated terms.
+            Does not commit.
 
-        if not (containsDuplicate):  # tweet doesn't contain the same hashtag
-            insert_query = 'INSERT INTO mentions (tid, term) VALUES (?, ?);'
-            Connection.cursor.execute(insert_query, (tid, hashtag))
-        Connection.connection.commit()
+        Args:
+            tid (int): the tweet id
+            hashtags (list[str]): the hashtag terms found in the tweet
+        """
+        assert Connection.is_connected()
+        insert_query = "INSERT OR IGNORE INTO mentions (tid, term) VALUES (?, ?);"
+        Connection.cursor.executemany(insert_query, [(tid, hashtag) for hashtag in hashtags])
 
     
     @staticmethod
@@ -159,9 +191,11 @@ class ComposeTweet:
             tid (int): the tweet id to retweet
         """
         assert Connection.is_connected()
+        rdate = datetime.date.today()
         insert_query = "INSERT INTO retweets (usr, tid, rdate) VALUES (?, ?, ?)"
-        Connection.cursor.execute(insert_query, (Login.userID, tid, datetime.date.today()))
-        Connection.connection.commit()
+        Connection.cursor.execute(insert_query, (Login.userID, tid, rdate))
+        Timeline.fan_out_retweet(Login.userID, tid, rdate)
+        Connection.commit()
 
 
 def test() -> None:
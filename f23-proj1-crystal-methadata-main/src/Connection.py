@@ -1,9 +1,58 @@
+import os
+import time
 import sqlite3
+import urllib.parse
+from QueryLog import QueryLog
+from ThreadLocal import ThreadLocal
 
 
-class Connection:
-    connection = None
-    cursor = None
+class Connection(metaclass=ThreadLocal):
+    # every thread has its own connection (and group commit state), eg. the server's workers
+    THREAD_LOCAL = {
+        "connection": None,
+        "cursor": None,
+        "profile": None,
+        "pending": 0,
+        "pending_since": None,
+    }
+
+    # performance profiles: pragma -> value, applied in this order on connect
+    PROFILES = {
+        # WAL with an fsync on every commit; small cache, no mmap
+        "durable": {
+            "journal_mode": "WAL",
+            "synchronous": "FULL",
+            "cache_size": -8000,          # KiB (negative = size instead of pages)
+            "mmap_size": 0,
+            "temp_store": "DEFAULT",
+            "busy_timeout": 5000,         # ms
+        },
+        # WAL only fsyncs at checkpoints; commits stay atomic, the last few may be
+        # lost on power failure (never on an application crash)
+        "balanced": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "cache_size": -65536,
+            "mmap_size": 268435456,       # bytes
+            "temp_store": "MEMORY",
+            "busy_timeout": 5000,
+        },
+        # for loading data that can be regenerated: no fsyncs, in-memory journal
+        "bulk-load": {
+            "journal_mode": "MEMORY",
+            "synchronous": "OFF",
+            "cache_size": -262144,
+            "mmap_size": 1073741824,
+            "temp_store": "MEMORY",
+            "busy_timeout": 5000,
+        },
+    }
+    DEFAULT_PROFILE = "durable"  # "balanced" and "bulk-load" trade durability for speed, opt-in only
+
+    # group commit: when group_size > 1, commit() only commits every group_size calls
+    # (or once group_delay seconds have passed since the first pending one)
+    group_size = 1
+    group_delay = 0.05
 
     @staticmethod
     def is_connected() -> bool:
@@ -16,16 +65,138 @@ class Connection:
 
 
     @staticmethod
-    def connect(path: str) -> None:
+    def connect(path: str, profile: str = None) -> None:
         """Initializes the db connection
 
         Args:
             path (str): filepath to the db to connect to
+            profile (str, optional): name of the performance profile (see PROFILES)
+                to apply. Defaults to DEFAULT_PROFILE.
+        """
+        if profile is None:
+            profile = Connection.DEFAULT_PROFILE
+        Connection.bind(Connection.open(path, profile), profile)
+
+
+    @staticmethod
+    def open(path: str, profile: str, read_only: bool = False,
+             shared: bool = False) -> sqlite3.Connection:
+        """Opens and configures a new db connection, without making it the current one
+
+        Args:
+            path (str): filepath to the db to connect to
+            profile (str): name of the performance profile (see PROFILES) to apply
+            read_only (bool, optional): open the file read-only; the journal mode is
+                left to the writers. Defaults to False.
+            shared (bool, optional): allow using the connection from other threads
+                (one at a time, eg. from a ConnectionPool). Defaults to False.
+
+        Returns:
+            sqlite3.Connection: the connection
+        """
+        assert profile in Connection.PROFILES
+        if read_only:
+            uri = "file:" + urllib.parse.quote(os.path.abspath(path)) + "?mode=ro"
+            connection = sqlite3.connect(uri, uri=True, check_same_thread=not shared)
+        else:
+            connection = sqlite3.connect(path, check_same_thread=not shared)
+        cursor = connection.cursor()
+        cursor.executescript(' PRAGMA foreign_keys=ON; ')
+        for pragma, value in Connection.PROFILES[profile].items():
+            if read_only and pragma == "journal_mode":
+                continue
+            cursor.execute(f"PRAGMA {pragma}={value};")
+            cursor.fetchall()
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON;")
+        connection.commit()
+        return connection
+
+
+    @staticmethod
+    def bind(connection: sqlite3.Connection, profile: str) -> None:
+        """Makes an open connection the current thread's connection
+
+        Args:
+            connection (sqlite3.Connection): the connection (None to unbind)
+            profile (str): the profile it was opened with
+        """
+        Connection.connection = connection
+        # with QueryLog on, every statement run through the cursor is timed
+        Connection.cursor = None if connection is None else connection.cursor(
+            QueryLog.Cursor if QueryLog.enabled else sqlite3.Cursor)
+        Connection.profile = profile
+        Connection.pending = 0
+        Connection.pending_since = None
+
+
+    @staticmethod
+    def settings() -> {str: object}:
+        """Reads back the pragmas set by the active profile
+
+        Returns:
+            dict[str, object]: pragma -> current value
+        """
+        assert Connection.is_connected()
+        settings = {}
+        for pragma in Connection.PROFILES[Connection.profile]:
+            Connection.cursor.execute(f"PRAGMA {pragma};")
+            settings[pragma] = Connection.cursor.fetchone()[0]
+        return settings
+
+
+    @staticmethod
+    def set_group_commit(size: int, delay: float = 0.05) -> None:
+        """Configures group commit, flushing anything pending first
+
+        Args:
+            size (int): # of commit() calls to batch into one real commit (1 disables it)
+            delay (float, optional): max seconds a commit may be held back,
+                checked on the next commit() call. Defaults to 0.05.
+        """
+        Connection.flush()
+        Connection.group_size = max(size, 1)
+        Connection.group_delay = delay
+
+
+    @staticmethod
+    def commit() -> None:
+        """Commits the current transaction, or with group commit enabled, counts it as
+            pending and only commits (a single fsync) once the group is full or old enough
         """
-        Connection.connection = sqlite3.connect(path)
-        Connection.cursor = Connection.connection.cursor()
-        Connection.cursor.executescript(' PRAGMA foreign_keys=ON; ')
-        Connection.connection.commit()
+        assert Connection.is_connected()
+        if Connection.group_size <= 1:
+            Connection.connection.commit()
+            return
+
+        Connection.pending += 1
+        if Connection.pending_since is None:
+            Connection.pending_since = time.monotonic()
+        if Connection.pending >= Connection.group_size or \
+                time.monotonic() - Connection.pending_since >= Connection.group_delay:
+            Connection.flush()
+
+
+    @staticmethod
+    def flush() -> None:
+        """Commits any writes held back by group commit"""
+        if Connection.connection is not None and Connection.pending > 0:
+            Connection.connection.commit()
+        Connection.pending = 0
+        Connection.pending_since = None
+
+
+    @staticmethod
+    def rollback() -> None:
+        """Rolls back the current transaction, including any writes held back by group commit
+            (dropping the follow graph, which already has the follows among them)"""
+        assert Connection.is_connected()
+        Connection.connection.rollback()
+        if Connection.pending > 0:
+            from FollowGraph import FollowGraph
+            FollowGraph.unload()
+        Connection.pending = 0
+        Connection.pending_since = None
 
 
     @staticmethod
@@ -52,6 +223,10 @@ class Connection:
     @staticmethod
     def close() -> None:
         """Closes the connection to the database"""
+        Connection.flush()
+        if isinstance(Connection.cursor, QueryLog.Cursor):
+            QueryLog.finish(Connection.cursor)
         Connection.connection.close()
         Connection.connection = None
         Connection.cursor = None
+        Connection.profile = None
@@ -0,0 +1,230 @@
+import sys
+import time
+import queue
+import threading
+import contextlib
+
+from Connection import Connection
+
+
+class ConnectionPool:
+    """A fixed set of db connections shared by many threads.
+
+    There are `size` read-only connections, handed out by reader(), and a single writer
+    connection, handed out by writer() one thread at a time (SQLite only allows one
+    writer anyway, and waiting on a lock is cheaper than on SQLITE_BUSY). While a
+    thread holds a handle it is also bound as that thread's Connection.connection, so
+    the existing static methods run on it unchanged. Each checkout also gets its own
+    cursor, which nested calls using Connection.cursor do not disturb.
+    """
+    path = None
+    profile = None
+    size = 0
+    timeout = 30.0  # seconds to wait for a connection
+
+    readers = None          # queue of idle read-only connections
+    writer_connection = None
+    writer_lock = threading.Lock()
+    stats_lock = threading.Lock()
+    wait_stats = {}         # 'reader'/'writer' -> [checkouts, total wait, max wait, timeouts]
+
+    @staticmethod
+    def open(path: str, profile: str = None, size: int = 8, timeout: float = 30.0) -> None:
+        """Opens the pool's connections, closing any previous pool
+
+        Args:
+            path (str): filepath to the db (not :memory:, readers open it separately)
+            profile (str, optional): connection profile. Defaults to Connection.DEFAULT_PROFILE.
+            size (int, optional): # of read-only connections. Defaults to 8.
+            timeout (float, optional): seconds a checkout waits before TimeoutError. Defaults to 30.
+        """
+        assert path != ":memory:" and size > 0
+        ConnectionPool.close()
+        ConnectionPool.path = path
+        ConnectionPool.profile = profile or Connection.DEFAULT_PROFILE
+        ConnectionPool.size = size
+        ConnectionPool.timeout = timeout
+
+        # the writer goes first, so the file exists and has its journal mode before readers open it
+        ConnectionPool.writer_connection = Connection.open(path, ConnectionPool.profile, shared=True)
+        ConnectionPool.readers = queue.LifoQueue()  # reuse the warmest connection first
+        for _ in range(size):
+            ConnectionPool.readers.put(
+                Connection.open(path, ConnectionPool.profile, read_only=True, shared=True))
+        ConnectionPool.reset_stats()
+
+
+    @staticmethod
+    def close() -> None:
+        """Closes every connection of the pool (all handles must have been returned)"""
+        if ConnectionPool.writer_connection is not None:
+            ConnectionPool.writer_connection.close()
+            ConnectionPool.writer_connection = None
+        while ConnectionPool.readers is not None and not ConnectionPool.readers.empty():
+            ConnectionPool.readers.get_nowait().close()
+        ConnectionPool.readers = None
+
+
+    @staticmethod
+    def is_open() -> bool:
+        """Determines whether the pool has been opened
+
+        Returns:
+            bool: True if reader()/writer() can be used
+        """
+        return ConnectionPool.writer_connection is not None
+
+
+    @staticmethod
+    def record_wait(kind: str, waited: float, timed_out: bool = False) -> None:
+        """Adds a checkout to the wait statistics
+
+        Args:
+            kind (str): 'reader' or 'writer'
+            waited (float): seconds the checkout waited
+            timed_out (bool, optional): whether it gave up. Defaults to False.
+        """
+        with ConnectionPool.stats_lock:
+            entry = ConnectionPool.wait_stats.setdefault(kind, [0, 0.0, 0.0, 0])
+            entry[0] += not timed_out
+            entry[1] += waited
+            entry[2] = max(entry[2], waited)
+            entry[3] += timed_out
+
+
+    @staticmethod
+    @contextlib.contextmanager
+    def bound(connection):
+        """Binds a connection to the current thread for the duration of a with block,
+            restoring the thread's previous connection afterwards
+
+        Args:
+            connection (sqlite3.Connection): the connection
+
+        Yields:
+            sqlite3.Cursor: a cursor of its own on the connection
+        """
+        previous = (Connection.connection, Connection.cursor, Connection.profile,
+                    Connection.pending, Connection.pending_since)
+        Connection.bind(connection, ConnectionPool.profile)
+        try:
+            yield connection.cursor()
+        finally:
+            (Connection.connection, Connection.cursor, Connection.profile,
+             Connection.pending, Connection.pending_since) = previous
+
+
+    @staticmethod
+    @contextlib.contextmanager
+    def reader():
+        """Checks out a read-only connection for a with block, eg.
+            with ConnectionPool.reader() as cursor: ...
+            Inside a writer() block, the writer is used instead (to see its own writes).
+
+        Yields:
+            sqlite3.Cursor: a cursor of its own on the connection
+
+        Raises:
+            TimeoutError: if no connection was free within the pool's timeout
+        """
+        assert ConnectionPool.is_open()
+        if Connection.connection is ConnectionPool.writer_connection:
+            yield Connection.connection.cursor()
+            return
+
+        start = time.perf_counter()
+        try:
+            connection = ConnectionPool.readers.get(timeout=ConnectionPool.timeout)
+        except queue.Empty:
+            ConnectionPool.record_wait('reader', time.perf_counter() - start, timed_out=True)
+            raise TimeoutError("timed out waiting for a read-only connection")
+        ConnectionPool.record_wait('reader', time.perf_counter() - start)
+        try:
+            with ConnectionPool.bound(connection) as cursor:
+                yield cursor
+        finally:
+            if connection.in_transaction:
+                connection.rollback()  # end the read snapshot
+            ConnectionPool.readers.put(connection)
+
+
+    @staticmethod
+    @contextlib.contextmanager
+    def writer():
+        """Checks out the writer connection for a with block, committing at the end
+            (including writes held back by group commit), or rolling back on an exception
+
+        Yields:
+            sqlite3.Cursor: a cursor of its own on the connection
+
+        Raises:
+            TimeoutError: if the writer was not free within the pool's timeout
+        """
+        assert ConnectionPool.is_open()
+        connection = ConnectionPool.writer_connection
+        if Connection.connection is connection:  # nested: the outer block commits
+            yield connection.cursor()
+            return
+
+        start = time.perf_counter()
+        if not ConnectionPool.writer_lock.acquire(timeout=ConnectionPool.timeout):
+            ConnectionPool.record_wait('writer', time.perf_counter() - start, timed_out=True)
+            raise TimeoutError("timed out waiting for the writer connection")
+        ConnectionPool.record_wait('writer', time.perf_counter() - start)
+        try:
+            with ConnectionPool.bound(connection) as cursor:
+                try:
+                    yield cursor
+                    Connection.flush()
+                    connection.commit()
+                except BaseException:
+                    Connection.rollback()
+                    raise
+        finally:
+            ConnectionPool.writer_lock.release()
+
+
+    @staticmethod
+    def reset_stats() -> None:
+        """Zeroes the wait statistics"""
+        with ConnectionPool.stats_lock:
+            ConnectionPool.wait_stats = {'reader': [0, 0.0, 0.0, 0], 'writer': [0, 0.0, 0.0, 0]}
+
+
+    @staticmethod
+    def stats() -> {str: dict}:
+        """Gets the checkout statistics
+
+        Returns:
+            dict[str, dict]: 'reader'/'writer' -> checkouts, mean/max wait (ms) and timeouts,
+                plus the # of idle read-only connections under 'idle_readers'
+        """
+        with ConnectionPool.stats_lock:
+            stats = {
+                kind: {
+                    "checkouts": checkouts,
+                    "mean_wait_ms": 1000 * total / (checkouts + timeouts) if checkouts + timeouts > 0 else 0.0,
+                    "max_wait_ms": 1000 * longest,
+                    "timeouts": timeouts,
+                }
+                for kind, (checkouts, total, longest, timeouts) in ConnectionPool.wait_stats.items()
+            }
+        stats["idle_readers"] = ConnectionPool.readers.qsize() if ConnectionPool.readers is not None else 0
+        return stats
+
+
+    @staticmethod
+    def print_stats(file=None) -> None:
+        """Prints the checkout statistics
+
+        Args:
+            file (file, optional): where to print. Defaults to stdout.
+        """
+        stats = ConnectionPool.stats()
+        print(f"Connection pool: {ConnectionPool.size} readers ({stats['idle_readers']} idle) + 1 writer",
+              file=file or sys.stdout)
+        for kind in ("reader", "writer"):
+            entry = stats[kind]
+            print(f"  {kind}: {entry['checkouts']} checkouts, {entry['mean_wait_ms']:.2f} ms mean wait, "
+                  f"{entry['max_wait_ms']:.2f} ms max wait, {entry['timeouts']} timeouts",
+                  file=file or sys.stdout)
@@ -1,15 +1,54 @@
+import json
+import heapq
+import itertools
+
 from Connection import Connection
 from Login import Login
 from Search import Search
+from Pager import Pager
+from Timeline import Timeline
+
+
+class FeedPager(Pager):
+    """A Pager over a user's live feed that finds each page with Feed.stream instead of
+    FEED_QUERY, then reads just the page's rows."""
+
+    def __init__(self, usr: int, page_size: int) -> None:
+        """Opens the feed of a user, loading its first page
+
+        Args:
+            usr (int): the user id of the feed's owner
+            page_size (int): # of tweets per page
+        """
+        self.usr = usr
+        super().__init__(Feed.FEED_QUERY, (usr, usr), Feed.FEED_KEYS, page_size,
+                         hydrate=Search.hydrate_tweets)
+
+
+    def fetch(self, after: tuple) -> ([str], [tuple]):
+        """Merges the keys of the page after a key, then reads their rows
+
+        Args:
+            after (tuple): the key of the last row before the page (None for page 1)
+
+        Returns:
+            tuple: the column names, and up to page_size + 1 rows (key columns last)
+        """
+        stream = Feed.stream(self.usr, after, self.page_size + 2)
+        try:
+            keys = list(itertools.islice(stream, self.page_size + 1))
+        finally:
+            stream.close()
+        Connection.cursor.execute(Feed.FEED_ROWS_QUERY, (json.dumps(keys),))
+        rows = Connection.cursor.fetchall()
+        column_names = [description[0] for description in Connection.cursor.description]
+        return column_names + [f"_key{idx}" for idx in range(len(self.keys))], \
+            [row + tuple(key) for row, key in zip(rows, keys)]
 
 
 class Feed:
-    @staticmethod
-    def show_feed() -> None:
-        """Finds the tweets/retweets of those the user is following, then produces a feed to interact with."""
-        assert Connection.is_connected()
-        assert Login.userID is not None
-        feedQuery = """
+    # tweets and retweets of everyone the user (?) follows, newest first
+    FEED_QUERY = """
             SELECT name, tid, writer, tdate, text, replyto, NULL as retweeter
             FROM users u, tweets t, follows f
             WHERE u.usr = t.writer
@@ -21,17 +60,192 @@ class Feed:
             WHERE u.usr = t.writer
                 AND t.tid = rt.tid
                 AND rt.usr = f.flwee
-                AND f.flwer = ?
-            ORDER BY t.tdate DESC"""
+                AND f.flwer = ?"""
+    # feed order; a tweet can show up once per retweeter, so the retweeter breaks ties
+    FEED_KEYS = ["tdate", "tid", "IFNULL(retweeter, 0)"]
+
+    # the same feed merged in Python (see Feed.stream). A source is one followee's tweets
+    # or retweets, read newest first from its index, from the key a page starts after:
+    # the first few rows of every source come from one HEADS query (the rows back to the
+    # date of each source's (:offset + 1)-th newest one), the rest from a cursor per source.
+    AUTHOR_HEADS_QUERY = """
+            SELECT f.flwee, w.tdate, w.tid, 0
+            FROM follows f, tweets w
+            WHERE f.flwer = :usr
+                AND w.writer = f.flwee
+                AND (w.tdate, w.tid) <= (:date, :tid)
+                AND w.tdate >= IFNULL((
+                    SELECT y.tdate FROM tweets y
+                    WHERE y.writer = f.flwee
+                        AND (y.tdate, y.tid) <= (:date, :tid)
+                    ORDER BY y.tdate DESC, y.tid DESC
+                    LIMIT 1 OFFSET :offset), '')
+            ORDER BY f.flwee, w.tdate DESC, w.tid DESC"""
+    RETWEET_HEADS_QUERY = """
+            SELECT f.flwee, r.rdate, r.tid, r.usr
+            FROM follows f, retweets r
+            WHERE f.flwer = :usr
+                AND r.usr = f.flwee
+                AND (r.rdate, r.tid) <= (:date, :tid)
+                AND r.rdate >= IFNULL((
+                    SELECT y.rdate FROM retweets y
+                    WHERE y.usr = f.flwee
+                        AND (y.rdate, y.tid) <= (:date, :tid)
+                    ORDER BY y.rdate DESC, y.tid DESC
+                    LIMIT 1 OFFSET :offset), '')
+            ORDER BY f.flwee, r.rdate DESC, r.tid DESC"""
+    AUTHOR_TWEETS_QUERY = """
+            SELECT tdate, tid, 0 FROM tweets
+            WHERE writer = ? AND (tdate, tid) <= (?, ?)
+            ORDER BY tdate DESC, tid DESC"""
+    USER_RETWEETS_QUERY = """
+            SELECT rdate, tid, usr FROM retweets
+            WHERE usr = ? AND (rdate, tid) <= (?, ?)
+            ORDER BY rdate DESC, tid DESC"""
+    # the feed rows of a JSON array of feed keys, in the array's order
+    FEED_ROWS_QUERY = """
+            SELECT u.name, t.tid, t.writer, json_extract(k.value, '$[0]') AS tdate, t.text, t.replyto,
+                NULLIF(json_extract(k.value, '$[2]'), 0) AS retweeter
+            FROM json_each(?) k, tweets t, users u
+            WHERE t.tid = json_extract(k.value, '$[1]')
+                AND u.usr = t.writer
+            ORDER BY k.key"""
+    LAST_KEY = ("9999-12-31", 2 ** 63 - 1)  # (tdate, tid) after every feed row
+
+    @staticmethod
+    def source(query: str, followee: int, head: [tuple], depth: int):
+        """Reads one source newest first: its head, then (if the head may not be all of
+            it) the rest through a cursor on its index, opened only once the head runs out
 
-        Connection.cursor.execute(feedQuery, (Login.userID, Login.userID))
-        results = Connection.cursor.fetchall()
+        Args:
+            query (str): AUTHOR_TWEETS_QUERY or USER_RETWEETS_QUERY
+            followee (int): the followee whose tweets/retweets these are
+            head (list[tuple]): the source's first keys, from a HEADS query
+            depth (int): # of keys the HEADS query read per source (at least)
 
-        column_names = [description[0]
-                        for description in Connection.cursor.description]
+        Yields:
+            tuple: the source's keys, newest first
+        """
+        yield from head
+        if len(head) < depth:
+            return
+        last = head[-1]
+        cursor = Connection.connection.cursor(type(Connection.cursor))  # timed by QueryLog too
+        try:
+            cursor.execute(query, (followee, last[0], last[1]))
+            for key in cursor:
+                if key < last:  # (tdate, tid) is unique within a source
+                    yield key
+        finally:
+            cursor.close()
+
+
+    @staticmethod
+    def stream(usr: int, after: tuple = None, depth: int = 16):
+        """Merges a user's feed lazily with a heap, newest first. Every source (each
+            followee's tweets, each followee's retweets) is read in feed order from its
+            index, and only as far as the rows taken so far need.
+
+        Args:
+            usr (int): the user id of the feed's owner
+            after (tuple, optional): the key to start after. Defaults to the start of the feed.
+            depth (int, optional): # of keys to read up front per source (eg. a page and
+                a bit). Defaults to 16.
+
+        Yields:
+            tuple: the key of each feed row (tdate, tid, retweeter or 0), in FEED_KEYS order
+        """
+        assert Connection.is_connected()
+        date, tid = Feed.LAST_KEY if after is None else (after[0], after[1])
+        params = {"usr": usr, "date": date, "tid": tid, "offset": depth - 1}
+        sources = []
+        for headsQuery, query in ((Feed.AUTHOR_HEADS_QUERY, Feed.AUTHOR_TWEETS_QUERY),
+                                  (Feed.RETWEET_HEADS_QUERY, Feed.USER_RETWEETS_QUERY)):
+            Connection.cursor.execute(headsQuery, params)
+            for followee, rows in itertools.groupby(Connection.cursor.fetchall(), key=lambda row: row[0]):
+                head = [row[1:] for row in rows]
+                sources.append(Feed.source(query, followee, head, depth))
 
-        Search.parse_results(results, column_names, 5, [
-            "scrollup", "scrolldown", "viewinfo", "reply", "retweet"], 'tweet')
+        merged = heapq.merge(*sources, reverse=True)
+        try:
+            for key in merged:
+                # rows with the start's (tdate, tid) may still come before it
+                if after is None or key < tuple(after):
+                    yield key
+        finally:
+            for source in sources:
+                source.close()
+
+
+    @staticmethod
+    def feed_pager(usr: int, page_size: int = 5) -> Pager:
+        """Opens the feed of a user, loading its first page
+
+        Args:
+            usr (int): the user id of the feed's owner
+            page_size (int, optional): # of tweets per page. Defaults to 5.
+
+        Returns:
+            Pager: the feed
+        """
+        assert Connection.is_connected()
+        if Timeline.is_enabled():
+            return Pager(Timeline.TIMELINE_QUERY, (usr,) * 3, Feed.FEED_KEYS, page_size,
+                         hydrate=Search.hydrate_tweets)
+        return FeedPager(usr, page_size)
+
+
+    @staticmethod
+    def check_merge(num_pages: int = 3, max_reported: int = 10) -> bool:
+        """Compares every user's merged feed against FEED_QUERY, printing mismatches:
+            all of its keys, and the rows of its first few pages
+
+        Args:
+            num_pages (int, optional): # of pages of rows to compare per user. Defaults to 3.
+            max_reported (int, optional): # of mismatched users to print. Defaults to 10.
+
+        Returns:
+            bool: True if every user's merged feed matches
+        """
+        assert Connection.is_connected()
+        order = ", ".join(f"{key} DESC" for key in Feed.FEED_KEYS)
+        Connection.cursor.execute("SELECT usr FROM users")
+        users = [row[0] for row in Connection.cursor.fetchall()]
+
+        mismatched = 0
+        for usr in users:
+            Connection.cursor.execute(f"SELECT * FROM ({Feed.FEED_QUERY}) ORDER BY {order}", (usr, usr))
+            expected = Connection.cursor.fetchall()
+            keys = list(Feed.stream(usr))
+
+            pager = FeedPager(usr, 5)
+            rows = []
+            for _ in range(num_pages):
+                columns = list(pager.rows[0])[:7] if len(pager.rows) > 0 else []
+                rows.extend(tuple(row[column] for column in columns) for row in pager.rows)
+                if not pager.next():
+                    break
+
+            if keys != [(row[3], row[1], row[6] or 0) for row in expected] or rows != expected[:len(rows)] \
+                    or len(rows) != min(len(expected), num_pages * pager.page_size):
+                mismatched += 1
+                if mismatched <= max_reported:
+                    print(f"User {usr}: {len(keys)} merged keys for {len(expected)} feed rows, "
+                          f"{sum(row != other for row, other in zip(rows, expected))} of the first "
+                          f"{len(rows)} rows differ")
+
+        print(f"{len(users) - mismatched} of {len(users)} merged feeds match the feed query.")
+        return mismatched == 0
+
+
+    @staticmethod
+    def show_feed() -> None:
+        """Finds the tweets/retweets of those the user is following, then produces a feed to interact with."""
+        assert Connection.is_connected()
+        assert Login.userID is not None
+        pager = Feed.feed_pager(Login.userID)
+        Search.interact(pager, [
+            "scrollup", "scrolldown", "viewinfo", "reply", "retweet", "thread"], 'tweet')
 
 
 if __name__ == "__main__":
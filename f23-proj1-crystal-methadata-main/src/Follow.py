@@ -1,26 +1,125 @@
 from Login import Login
 from Connection import Connection
+import json
 import datetime
+from Timeline import Timeline
+from UserCache import UserCache
+from FollowGraph import FollowGraph
 
 
 class Follow():
+    # follows are written and deleted through the (flwer, flwee) primary key
+    FOLLOW_QUERY = "INSERT OR IGNORE INTO follows (flwer, flwee, start_date) VALUES (?, ?, ?)"
+    UNFOLLOW_QUERY = "DELETE FROM follows WHERE flwer = ? AND flwee = ?"
+    NAME_QUERY = "SELECT name FROM users WHERE usr = ?"
+
+    # for following many users at once, each ? after the first being a JSON array of ids
+    USERS_EXIST_QUERY = "SELECT usr FROM users WHERE usr IN (SELECT value FROM json_each(?))"
+    FOLLOWING_QUERY = "SELECT flwee FROM follows WHERE flwer = ? AND flwee IN (SELECT value FROM json_each(?))"
+    LIST_EXISTS_QUERY = "SELECT lname FROM lists WHERE lname = ?"
+    LIST_MEMBERS_QUERY = "SELECT member FROM includes WHERE lname = ?"
+
     @staticmethod
-    def follow(flwee: int) -> None:
+    def follow(flwee: int) -> bool:
         """Records the currently logged-in user following someone else
 
         Args:
             flwee (int): the user id of the user to follow
+
+        Returns:
+            bool: True if the user was not already followed
         """
         assert Connection.is_connected()
-        query = "SELECT flwer FROM follows, users WHERE flwer = ? AND flwee = ?"
-        if (Connection.contains(query, (Login.userID, flwee))):  # already follows the user
+        Connection.cursor.execute(Follow.FOLLOW_QUERY, (Login.userID, flwee, datetime.date.today()))
+        if Connection.cursor.rowcount == 0:  # already follows the user
             print("You already follow " + Follow.getName(flwee))
+            print()
+            return False
         else:
-            Connection.cursor.execute("INSERT INTO follows VALUES(?,?,?)",
-                                      (Login.userID, flwee, datetime.date.today()))
+            Timeline.add_follow(Login.userID, flwee)
+            UserCache.invalidate('counts', Login.userID, flwee)
             print("You started following " + Follow.getName(flwee))
-            Connection.connection.commit()
+            Connection.commit()
+            FollowGraph.change(Login.userID, flwee, True)
+        print()
+        return True
+
+
+    @staticmethod
+    def unfollow(flwee: int) -> bool:
+        """Records the currently logged-in user no longer following someone
+
+        Args:
+            flwee (int): the user id of the user to unfollow
+
+        Returns:
+            bool: True if the user was followed
+        """
+        assert Connection.is_connected()
+        Connection.cursor.execute(Follow.UNFOLLOW_QUERY, (Login.userID, flwee))
+        if Connection.cursor.rowcount == 0:
+            print("You do not follow " + Follow.getName(flwee))
+            print()
+            return False
+        else:
+            Timeline.remove_follow(Login.userID, flwee)
+            UserCache.invalidate('counts', Login.userID, flwee)
+            print("You stopped following " + Follow.getName(flwee))
+            Connection.commit()
+            FollowGraph.change(Login.userID, flwee, False)
+        print()
+        return True
+
+
+    @staticmethod
+    def follow_many(flwees: [int]) -> [int]:
+        """Records the currently logged-in user following many users, in one transaction.
+            Unknown users, the user themselves and users already followed are skipped.
+
+        Args:
+            flwees (list[int]): the user ids of the users to follow
+
+        Returns:
+            list[int]: the user ids newly followed, in the given order
+        """
+        assert Connection.is_connected()
+        candidates = list(dict.fromkeys(flwee for flwee in flwees if flwee != Login.userID))
+        if len(candidates) == 0:
+            return []
+        ids = json.dumps(candidates)
+        Connection.cursor.execute(Follow.USERS_EXIST_QUERY, (ids,))
+        known = set(row[0] for row in Connection.cursor.fetchall())
+        Connection.cursor.execute(Follow.FOLLOWING_QUERY, (Login.userID, ids))
+        following = set(row[0] for row in Connection.cursor.fetchall())
+        new = [flwee for flwee in candidates if flwee in known and flwee not in following]
+
+        today = datetime.date.today()
+        Connection.cursor.executemany(Follow.FOLLOW_QUERY, [(Login.userID, flwee, today) for flwee in new])
+        for flwee in new:
+            Timeline.add_follow(Login.userID, flwee)
+        UserCache.invalidate('counts', Login.userID, *new)
+        Connection.commit()
+        for flwee in new:
+            FollowGraph.change(Login.userID, flwee, True)
+        print(f"You started following {len(new)} user{'s' if len(new) != 1 else ''}")
         print()
+        return new
+
+
+    @staticmethod
+    def follow_list(lname: str) -> [int]:
+        """Records the currently logged-in user following every member of a list,
+            in one transaction
+
+        Args:
+            lname (str): the name of the (existing) list
+
+        Returns:
+            list[int]: the user ids newly followed
+        """
+        assert Connection.is_connected()
+        Connection.cursor.execute(Follow.LIST_MEMBERS_QUERY, (lname,))
+        return Follow.follow_many([row[0] for row in Connection.cursor.fetchall()])
 
 
     @staticmethod
@@ -33,8 +132,12 @@ class Follow():
         Returns:
             str: the name of the user
         """
+        name = UserCache.get('name', usr)
+        if name is not None:
+            return name
+
         assert Connection.is_connected()
-        Connection.cursor.execute("SELECT name FROM users WHERE usr = ?",
-                                  (usr, ))
+        Connection.cursor.execute(Follow.NAME_QUERY, (usr, ))
         result = Connection.cursor.fetchone()
+        UserCache.put('name', usr, result[0])
         return result[0]
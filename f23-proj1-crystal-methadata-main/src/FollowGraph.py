@@ -0,0 +1,409 @@
+import json
+import time
+import heapq
+import bisect
+import itertools
+import threading
+from array import array
+from collections import Counter
+
+from Connection import Connection
+from Login import Login
+from Pager import Pager
+
+
+class FollowGraph:
+    """In-memory copy of the follows table in compressed sparse row (CSR) form.
+
+    Each direction is two flat arrays: the ids a user follows (or is followed by) are
+    neighbors[offsets[usr]:offsets[usr + 1]], sorted, with user ids used directly as row
+    numbers. Follows/unfollows committed by this process after loading are kept in small
+    per-user delta sets on top of the arrays. Once the deltas grow past COMPACT_RATIO of
+    the graph, the graph is marked stale and rebuilt from the db on a background thread
+    (meanwhile it is served as before), then swapped in with the changes made during the
+    rebuild replayed on top. Changes made by other processes only show up after a reload.
+    It is shared by all threads.
+    """
+    COMPACT_RATIO = 0.01  # changes since loading (fraction of the edges) before a rebuild
+    COMPACT_MIN = 10000
+
+    OUT_DEGREES_QUERY = "SELECT flwer, COUNT(*) FROM follows GROUP BY flwer"
+    OUT_EDGES_QUERY = "SELECT flwee FROM follows ORDER BY flwer, flwee"
+    IN_DEGREES_QUERY = "SELECT flwee, COUNT(*) FROM follows GROUP BY flwee"
+    IN_EDGES_QUERY = "SELECT flwer FROM follows ORDER BY flwee, flwer"
+    MAX_USER_QUERY = "SELECT IFNULL(MAX(usr), 0) FROM users"
+    DB_FILE_QUERY = "SELECT file FROM pragma_database_list WHERE name = 'main'"
+
+    # the same answers straight from the db (see Benchmark.profile_graph)
+    FOLLOWEES_QUERY = "SELECT flwee FROM follows WHERE flwer = ? ORDER BY flwee"
+    FOLLOWERS_QUERY = "SELECT flwer FROM follows WHERE flwee = ? ORDER BY flwer"
+    FOLLOWS_QUERY = "SELECT flwer FROM follows WHERE flwer = ? AND flwee = ?"
+    RECOMMEND_QUERY = """
+            SELECT f2.flwee, COUNT(*) AS followed_by
+            FROM follows f1, follows f2
+            WHERE f1.flwer = :usr
+                AND f2.flwer = f1.flwee
+                AND f2.flwee != :usr
+                AND NOT EXISTS (SELECT * FROM follows f3 WHERE f3.flwer = :usr AND f3.flwee = f2.flwee)
+            GROUP BY f2.flwee
+            ORDER BY followed_by DESC, f2.flwee
+            LIMIT :k"""
+
+    # users in the order of a JSON array of [usr, followed_by] pairs
+    RECOMMENDED_USERS_QUERY = """
+            SELECT u.usr, u.name, u.city, json_extract(r.value, '$[1]') AS followed_by, r.key AS rank
+            FROM json_each(?) r, users u
+            WHERE u.usr = json_extract(r.value, '$[0]')"""
+    RECOMMENDED_USERS_KEYS = ["rank"]
+
+    loaded = False
+    edges = 0
+    out_offsets = out_neighbors = in_offsets = in_neighbors = None
+    # changes since loading: usr -> set of the other ends of the edges added/removed
+    added_out, added_in, removed_out, removed_in = {}, {}, {}, {}
+    changes = 0
+    generation = 0  # bumped whenever the arrays are replaced or freed
+    stale = False   # a background rebuild is running
+    replay = []     # (flwer, flwee, following) of the changes made during the rebuild
+    lock = threading.RLock()
+
+    @staticmethod
+    def build(degrees_query: str, edges_query: str, num_rows: int, typecode: str) -> (array, array):
+        """Reads one direction of the graph into CSR arrays
+
+        Args:
+            degrees_query (str): OUT_DEGREES_QUERY or IN_DEGREES_QUERY
+            edges_query (str): OUT_EDGES_QUERY or IN_EDGES_QUERY
+            num_rows (int): # of rows (highest user id + 1)
+            typecode (str): array typecode of the neighbor ids
+
+        Returns:
+            tuple[array, array]: the offsets (num_rows + 1 of them) and the neighbors
+        """
+        cursor = Connection.connection.cursor()
+        counts = array('q', bytes(8 * (num_rows + 1)))
+        cursor.execute(degrees_query)
+        for usr, degree in cursor:
+            counts[usr + 1] = degree
+        offsets = array('q', itertools.accumulate(counts))
+
+        neighbors = array(typecode)
+        cursor.execute(edges_query)
+        while True:
+            rows = cursor.fetchmany(100000)
+            if len(rows) == 0:
+                break
+            neighbors.extend([row[0] for row in rows])
+        cursor.close()
+        return offsets, neighbors
+
+
+    @staticmethod
+    def read() -> tuple:
+        """Reads both directions of the graph from one snapshot of the db
+
+        Returns:
+            tuple: the out offsets and neighbors, then the in offsets and neighbors
+        """
+        assert Connection.is_connected()
+        began = not Connection.connection.in_transaction  # else already one snapshot
+        if began:
+            Connection.cursor.execute("BEGIN")
+        try:
+            Connection.cursor.execute(FollowGraph.MAX_USER_QUERY)
+            numRows = Connection.cursor.fetchone()[0] + 1
+            typecode = 'i' if numRows < 2 ** 31 else 'q'
+            return FollowGraph.build(FollowGraph.OUT_DEGREES_QUERY, FollowGraph.OUT_EDGES_QUERY,
+                                     numRows, typecode) + \
+                FollowGraph.build(FollowGraph.IN_DEGREES_QUERY, FollowGraph.IN_EDGES_QUERY,
+                                  numRows, typecode)
+        finally:
+            if began:
+                Connection.connection.rollback()  # end the read snapshot
+
+
+    @staticmethod
+    def swap(graph: tuple) -> None:
+        """Replaces the arrays with freshly read ones, dropping the deltas. Call with the lock held.
+
+        Args:
+            graph (tuple): what read returned
+        """
+        FollowGraph.out_offsets, FollowGraph.out_neighbors, \
+            FollowGraph.in_offsets, FollowGraph.in_neighbors = graph
+        FollowGraph.edges = len(FollowGraph.out_neighbors)
+        FollowGraph.added_out, FollowGraph.added_in = {}, {}
+        FollowGraph.removed_out, FollowGraph.removed_in = {}, {}
+        FollowGraph.changes = 0
+        FollowGraph.generation += 1
+        FollowGraph.stale = False
+        FollowGraph.loaded = True
+
+
+    @staticmethod
+    def load() -> float:
+        """(Re)loads the whole graph from the db, dropping the deltas
+
+        Returns:
+            float: seconds taken
+        """
+        started = time.perf_counter()
+        graph = FollowGraph.read()
+        with FollowGraph.lock:
+            FollowGraph.swap(graph)
+        return time.perf_counter() - started
+
+
+    @staticmethod
+    def rebuild(path: str, profile: str, generation: int) -> None:
+        """Reloads the graph on a connection of its own (run on a background thread), then
+            swaps it in and replays the changes made since the rebuild started. Gives up
+            if the graph was replaced or freed in the meantime.
+
+        Args:
+            path (str): filepath to the db
+            profile (str): the performance profile to open it with
+            generation (int): the generation of the graph being rebuilt
+        """
+        try:
+            Connection.bind(Connection.open(path, profile, read_only=True), profile)
+            try:
+                graph = FollowGraph.read()
+            finally:
+                Connection.close()
+        except Exception:
+            graph = None  # keep serving the deltas; the next change tries again
+
+        with FollowGraph.lock:
+            if FollowGraph.generation != generation:
+                return
+            replay, FollowGraph.replay = FollowGraph.replay, []
+            if graph is None:
+                FollowGraph.stale = False
+                return
+            FollowGraph.swap(graph)
+            # a change is in the snapshot or replayed (applying it twice does nothing)
+            for flwer, flwee, following in replay:
+                FollowGraph.apply(flwer, flwee, following)
+
+
+    @staticmethod
+    def ensure_loaded() -> None:
+        """Loads the graph on first use"""
+        with FollowGraph.lock:
+            if not FollowGraph.loaded:
+                FollowGraph.load()
+
+
+    @staticmethod
+    def unload() -> None:
+        """Frees the graph (eg. when switching dbs); it is reloaded on next use"""
+        with FollowGraph.lock:
+            FollowGraph.loaded = False
+            FollowGraph.generation += 1
+            FollowGraph.stale = False
+            FollowGraph.replay = []
+            FollowGraph.out_offsets = FollowGraph.out_neighbors = None
+            FollowGraph.in_offsets = FollowGraph.in_neighbors = None
+
+
+    @staticmethod
+    def row(offsets: array, neighbors: array, added: dict, removed: dict, usr: int):
+        """Gets one user's sorted neighbors in one direction, deltas included
+
+        Args:
+            offsets (array): the direction's CSR offsets
+            neighbors (array): the direction's CSR neighbors
+            added (dict): usr -> neighbors added since loading
+            removed (dict): usr -> neighbors removed since loading
+            usr (int): the user id
+
+        Returns:
+            array or list: the neighbor ids
+        """
+        if 0 <= usr < len(offsets) - 1:
+            base = neighbors[offsets[usr]:offsets[usr + 1]]
+        else:
+            base = array(neighbors.typecode)  # joined after loading
+        if usr not in added and usr not in removed:
+            return base
+        gone = removed.get(usr, ())
+        return sorted([other for other in base if other not in gone] + list(added.get(usr, ())))
+
+
+    @staticmethod
+    def followees(usr: int):
+        """Gets who a user follows
+
+        Args:
+            usr (int): the user id
+
+        Returns:
+            array or list: the user ids followed, ascending
+        """
+        FollowGraph.ensure_loaded()
+        with FollowGraph.lock:
+            return FollowGraph.row(FollowGraph.out_offsets, FollowGraph.out_neighbors,
+                                   FollowGraph.added_out, FollowGraph.removed_out, usr)
+
+
+    @staticmethod
+    def followers(usr: int):
+        """Gets who follows a user
+
+        Args:
+            usr (int): the user id
+
+        Returns:
+            array or list: the follower ids, ascending
+        """
+        FollowGraph.ensure_loaded()
+        with FollowGraph.lock:
+            return FollowGraph.row(FollowGraph.in_offsets, FollowGraph.in_neighbors,
+                                   FollowGraph.added_in, FollowGraph.removed_in, usr)
+
+
+    @staticmethod
+    def follows(flwer: int, flwee: int) -> bool:
+        """Determines whether one user follows another, by binary search
+
+        Args:
+            flwer (int): the possible follower
+            flwee (int): the possible followee
+
+        Returns:
+            bool: True if flwer follows flwee
+        """
+        FollowGraph.ensure_loaded()
+        with FollowGraph.lock:
+            if flwee in FollowGraph.added_out.get(flwer, ()):
+                return True
+            if flwee in FollowGraph.removed_out.get(flwer, ()):
+                return False
+            offsets, neighbors = FollowGraph.out_offsets, FollowGraph.out_neighbors
+            if not 0 <= flwer < len(offsets) - 1:
+                return False
+            lo, hi = offsets[flwer], offsets[flwer + 1]
+            idx = bisect.bisect_left(neighbors, flwee, lo, hi)
+            return idx < hi and neighbors[idx] == flwee
+
+
+    @staticmethod
+    def is_mutual(usr: int, other: int) -> bool:
+        """Determines whether two users follow each other
+
+        Args:
+            usr (int): a user id
+            other (int): another user id
+
+        Returns:
+            bool: True if each follows the other
+        """
+        return FollowGraph.follows(usr, other) and FollowGraph.follows(other, usr)
+
+
+    @staticmethod
+    def recommend(usr: int, k: int = 10) -> [(int, int)]:
+        """Ranks the users followed by the people a user follows ("who to follow"),
+            leaving out the user and whoever they already follow
+
+        Args:
+            usr (int): the user id
+            k (int, optional): # of users to recommend. Defaults to 10.
+
+        Returns:
+            list[tuple[int, int]]: user id and # of the user's followees who follow them,
+                most followed first (ties by user id)
+        """
+        followees = FollowGraph.followees(usr)
+        counts = Counter()
+        for followee in followees:
+            counts.update(FollowGraph.followees(followee))
+        for followee in followees:
+            counts.pop(followee, None)
+        counts.pop(usr, None)
+        return heapq.nsmallest(k, counts.items(), key=lambda item: (-item[1], item[0]))
+
+
+    @staticmethod
+    def apply(flwer: int, flwee: int, following: bool) -> bool:
+        """Adds a follow/unfollow to the deltas. Call with the lock held.
+
+        Args:
+            flwer (int): the follower
+            flwee (int): the followee
+            following (bool): True for a new follow, False for an unfollow
+
+        Returns:
+            bool: False if the graph already had it
+        """
+        if FollowGraph.follows(flwer, flwee) == following:
+            return False
+        add, undo = (FollowGraph.added_out, FollowGraph.removed_out) if following else \
+            (FollowGraph.removed_out, FollowGraph.added_out)
+        addIn, undoIn = (FollowGraph.added_in, FollowGraph.removed_in) if following else \
+            (FollowGraph.removed_in, FollowGraph.added_in)
+        if flwee in undo.get(flwer, ()):
+            undo[flwer].discard(flwee)
+            undoIn[flwee].discard(flwer)
+        else:
+            add.setdefault(flwer, set()).add(flwee)
+            addIn.setdefault(flwee, set()).add(flwer)
+        FollowGraph.changes += 1
+        return True
+
+
+    @staticmethod
+    def change(flwer: int, flwee: int, following: bool) -> None:
+        """Applies a follow/unfollow committed by this process, starting a background
+            rebuild once the deltas are too large. Does nothing if the graph has not been loaded.
+
+        Args:
+            flwer (int): the follower
+            flwee (int): the followee
+            following (bool): True for a new follow, False for an unfollow
+        """
+        with FollowGraph.lock:
+            if not FollowGraph.loaded or not FollowGraph.apply(flwer, flwee, following):
+                return
+            if FollowGraph.stale:
+                FollowGraph.replay.append((flwer, flwee, following))
+                return
+            if FollowGraph.changes <= max(FollowGraph.COMPACT_MIN, FollowGraph.edges * FollowGraph.COMPACT_RATIO):
+                return
+
+            assert Connection.is_connected()
+            Connection.cursor.execute(FollowGraph.DB_FILE_QUERY)
+            path = Connection.cursor.fetchone()[0]
+            if path == "":  # in-memory db: nothing else can read it, keep the deltas
+                return
+            FollowGraph.stale = True
+            FollowGraph.replay = []
+            threading.Thread(target=FollowGraph.rebuild, daemon=True, args=(
+                path, Connection.profile or Connection.DEFAULT_PROFILE, FollowGraph.generation)).start()
+
+
+    @staticmethod
+    def recommendation_pager(usr: int, k: int = 50, page_size: int = 5) -> Pager:
+        """Pages through a user's recommendations with their names and cities
+
+        Args:
+            usr (int): the user id
+            k (int, optional): # of users to recommend. Defaults to 50.
+            page_size (int, optional): # of users per page. Defaults to 5.
+
+        Returns:
+            Pager: usr, name, city and followed_by of each user, best first
+        """
+        recommended = json.dumps(FollowGraph.recommend(usr, k))
+        return Pager(FollowGraph.RECOMMENDED_USERS_QUERY, (recommended,),
+                     FollowGraph.RECOMMENDED_USERS_KEYS, page_size, descending=False)
+
+
+    @staticmethod
+    def show_recommendations() -> None:
+        """Shows who the logged-in user might want to follow, in a users activity"""
+        from Search import Search
+        assert Connection.is_connected()
+        pager = FollowGraph.recommendation_pager(Login.userID)
+        Search.interact(pager, ["scrollup", "scrolldown", "select", "follow", "unfollow"], 'user')
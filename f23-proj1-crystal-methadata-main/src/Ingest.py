@@ -0,0 +1,320 @@
+import csv
+import gzip
+import json
+import sqlite3
+import time
+import datetime
+import itertools
+
+from Connection import Connection
+from Setup import Setup
+from Sequence import Sequence
+from ComposeTweet import ComposeTweet
+from Trending import Trending
+from FollowGraph import FollowGraph
+from Thread import Thread
+
+
+class Ingest:
+    """Streams users, follows, tweets and retweets from JSONL or CSV files into the db.
+
+    Records are read lazily and handled batch_size at a time: each batch is validated with
+    one lookup per referenced table (so a bad foreign key rejects just its record), written
+    with executemany in its own transaction, and tweets get their hashtags/mentions
+    extracted the same way as in ComposeTweet. By default triggers and secondary indexes
+    are dropped for the whole load and rebuilt at the end (see Setup.begin_bulk_load).
+    """
+    # fields of each kind of record, in column order; a missing usr/tid is allocated
+    # from the sequences, a missing date is today, and replyto is optional
+    COLUMNS = {
+        "users": ["usr", "pwd", "name", "email", "city", "timezone"],
+        "follows": ["flwer", "flwee", "start_date"],
+        "tweets": ["tid", "writer", "tdate", "text", "replyto"],
+        "retweets": ["usr", "tid", "rdate"],
+    }
+    # files must be loaded after the files of the tables they refer to
+    ORDER = ["users", "follows", "tweets", "retweets"]
+
+    USERS_EXIST_QUERY = "SELECT usr FROM users WHERE usr IN (SELECT value FROM json_each(?))"
+    TWEETS_EXIST_QUERY = "SELECT tid FROM tweets WHERE tid IN (SELECT value FROM json_each(?))"
+
+    @staticmethod
+    def read_records(path: str):
+        """Reads a .jsonl or .csv file (optionally .gz compressed) one record at a time.
+            CSV files need a header row naming the fields.
+
+        Args:
+            path (str): the file
+
+        Yields:
+            tuple[int, dict]: the line number and the record (None if the line is not valid JSON)
+        """
+        name = path[:-3] if path.endswith(".gz") else path
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", newline="", encoding="utf-8") as file:
+            if name.endswith(".csv"):
+                reader = csv.DictReader(file)
+                for record in reader:
+                    # empty cells are missing values
+                    yield reader.line_num, {key: value for key, value in record.items() if value != ""}
+            else:
+                for number, line in enumerate(file, 1):
+                    if line.strip() == "":
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        record = None
+                    yield number, record if isinstance(record, dict) else None
+
+
+    @staticmethod
+    def convert(kind: str, record: dict) -> list:
+        """Turns a record into a row of its table, checking the types but not the foreign keys
+
+        Args:
+            kind (str): the kind of record (a key of COLUMNS)
+            record (dict): the record
+
+        Returns:
+            list: the row, with None for an id to allocate
+
+        Raises:
+            ValueError: if a field is missing or malformed
+        """
+        if record is None:
+            raise ValueError("not a JSON object")
+
+        def integer(field, optional=False):
+            value = record.get(field)
+            if value is None and optional:
+                return None
+            if value is None:
+                raise ValueError(f"missing {field}")
+            return int(value)
+
+        def text(field):
+            value = record.get(field)
+            if value is None:
+                raise ValueError(f"missing {field}")
+            return str(value)
+
+        def date(field):
+            # stored as YYYY-MM-DD like every other date; a time of day is dropped
+            value = record.get(field)
+            if value is None or value == "":
+                return datetime.date.today().isoformat()
+            return datetime.datetime.fromisoformat(str(value)).date().isoformat()
+
+        if kind == "users":
+            timezone = record.get("timezone")
+            return [integer("usr", True), text("pwd"), text("name"), text("email"),
+                    text("city"), None if timezone is None else float(timezone)]
+        elif kind == "follows":
+            return [integer("flwer"), integer("flwee"), date("start_date")]
+        elif kind == "tweets":
+            return [integer("tid", True), integer("writer"), date("tdate"), text("text"),
+                    integer("replyto", True)]
+        else:  # retweets
+            return [integer("usr"), integer("tid"), date("rdate")]
+
+
+    @staticmethod
+    def existing(query: str, ids: set) -> set:
+        """Finds which of some ids are in the db
+
+        Args:
+            query (str): USERS_EXIST_QUERY or TWEETS_EXIST_QUERY
+            ids (set[int]): the ids to look up
+
+        Returns:
+            set[int]: the ids found
+        """
+        if len(ids) == 0:
+            return set()
+        Connection.cursor.execute(query, (json.dumps(list(ids)),))
+        return set(row[0] for row in Connection.cursor.fetchall())
+
+
+    @staticmethod
+    def validate(kind: str, records: [tuple]) -> ([list], [str]):
+        """Converts a batch of records to rows, checking their foreign keys (and that new
+            users/tweets are really new) with one lookup per table for the whole batch
+
+        Args:
+            kind (str): the kind of records
+            records (list[tuple[int, dict]]): line numbers and records
+
+        Returns:
+            tuple: the valid rows (ids allocated), and a message per rejected record
+        """
+        rows, errors = [], []
+        for number, record in records:
+            try:
+                rows.append((number, Ingest.convert(kind, record)))
+            except (ValueError, TypeError) as error:
+                errors.append(f"line {number}: {error}")
+
+        # everything the batch refers to, looked up at once
+        if kind == "users":
+            users = Ingest.existing(Ingest.USERS_EXIST_QUERY, set(row[0] for _, row in rows if row[0] is not None))
+        elif kind == "follows":
+            users = Ingest.existing(Ingest.USERS_EXIST_QUERY, set(row[i] for _, row in rows for i in (0, 1)))
+        else:
+            users = Ingest.existing(Ingest.USERS_EXIST_QUERY, set(row[1 if kind == "tweets" else 0] for _, row in rows))
+        tweets = set()
+        if kind == "tweets":
+            tweets = Ingest.existing(Ingest.TWEETS_EXIST_QUERY,
+                                     set(row[i] for _, row in rows for i in (0, 4) if row[i] is not None))
+        elif kind == "retweets":
+            tweets = Ingest.existing(Ingest.TWEETS_EXIST_QUERY, set(row[1] for _, row in rows))
+
+        # ids are allocated past every explicit id of the batch, so they cannot clash with
+        # one inserted later in the batch (the sequence triggers may be dropped, and only
+        # fire at insert time anyway)
+        missing = sum(1 for _, row in rows if row[0] is None)
+        if missing > 0 and kind in ("users", "tweets"):
+            explicit = [row[0] for _, row in rows if row[0] is not None]
+            if len(explicit) > 0:
+                Sequence.advance(kind, max(explicit))
+            ids = iter(Sequence.reserve(kind, missing))
+
+        valid = []
+        for number, row in rows:
+            if kind == "users":
+                if row[0] in users:
+                    errors.append(f"line {number}: user {row[0]} already exists")
+                    continue
+                row[0] = next(ids) if row[0] is None else row[0]
+                users.add(row[0])
+            elif kind == "follows":
+                unknown = [usr for usr in row[:2] if usr not in users]
+                if len(unknown) > 0 or row[0] == row[1]:
+                    errors.append(f"line {number}: " + (f"unknown user {unknown[0]}" if unknown else "self-follow"))
+                    continue
+            elif kind == "tweets":
+                if row[0] in tweets:
+                    errors.append(f"line {number}: tweet {row[0]} already exists")
+                    continue
+                if row[1] not in users:
+                    errors.append(f"line {number}: unknown writer {row[1]}")
+                    continue
+                if row[4] is not None and row[4] not in tweets:
+                    # replies may point at tweets earlier in the batch, but not later
+                    errors.append(f"line {number}: unknown parent tweet {row[4]}")
+                    continue
+                row[0] = next(ids) if row[0] is None else row[0]
+                tweets.add(row[0])
+            else:  # retweets
+                if row[0] not in users or row[1] not in tweets:
+                    errors.append(f"line {number}: " + (
+                        f"unknown user {row[0]}" if row[0] not in users else f"unknown tweet {row[1]}"))
+                    continue
+            valid.append(row)
+        return valid, errors
+
+
+    @staticmethod
+    def insert(kind: str, rows: [list]) -> int:
+        """Writes a batch of validated rows (and for tweets, their hashtags and mentions).
+            Does not commit.
+
+        Args:
+            kind (str): the kind of rows
+            rows (list[list]): the rows
+
+        Returns:
+            int: # of rows inserted (duplicate follows/retweets are skipped)
+        """
+        placeholders = ", ".join("?" * len(Ingest.COLUMNS[kind]))
+        # new users/tweets must not clash with existing ones (validate made sure), so a
+        # clash raises; duplicate follows/retweets are skipped
+        verb = "INSERT" if kind in ("users", "tweets") else "INSERT OR IGNORE"
+        Connection.cursor.executemany(f"{verb} INTO {kind} VALUES ({placeholders})", rows)
+        inserted = Connection.cursor.rowcount  # not counting the rows the triggers change
+
+        if kind == "tweets":
+            # every row was inserted, so the mentions only point at these tweets
+            mentions, terms = ComposeTweet.extractHashTagsBatch((row[0], row[3]) for row in rows)
+            ComposeTweet.addHashtagsToHashtagsDB(terms)
+            Connection.cursor.executemany("INSERT OR IGNORE INTO mentions (tid, term) VALUES (?, ?)", mentions)
+        return inserted
+
+
+    @staticmethod
+    def ingest_file(kind: str, path: str, batch_size: int = 100000, max_errors: int = 10) -> (int, int):
+        """Loads one file, committing after every batch and printing progress
+
+        Args:
+            kind (str): the kind of records in the file (a key of COLUMNS)
+            path (str): the .jsonl/.csv(.gz) file
+            batch_size (int, optional): # of records per batch/transaction. Defaults to 100000.
+            max_errors (int, optional): # of rejected records to describe. Defaults to 10.
+
+        Returns:
+            tuple[int, int]: # of rows inserted, # of records rejected
+        """
+        assert Connection.is_connected()
+        assert kind in Ingest.COLUMNS
+        records = Ingest.read_records(path)
+        inserted = rejected = read = 0
+        started = time.perf_counter()
+        while True:
+            batch = list(itertools.islice(records, batch_size))
+            if len(batch) == 0:
+                break
+            try:
+                rows, errors = Ingest.validate(kind, batch)
+                inserted += Ingest.insert(kind, rows)
+            except sqlite3.Error:
+                Connection.connection.rollback()  # none of the batch
+                raise
+            Connection.connection.commit()
+
+            shown = errors[:max(max_errors - rejected, 0)]
+            if len(shown) > 0 and read > 0:
+                print()  # end the progress line
+            for error in shown:
+                print(f"{path}: {error}")
+            rejected += len(errors)
+            read += len(batch)
+            elapsed = time.perf_counter() - started
+            print(f"\r{kind}: {read} records, {inserted} inserted, {rejected} rejected "
+                  f"({read / elapsed:.0f} records/sec)", end="", flush=True)
+        print()
+        return inserted, rejected
+
+
+    @staticmethod
+    def ingest(files: [(str, str)], batch_size: int = 100000, defer_indexes: bool = True) -> (int, int):
+        """Loads several files, users first, then follows, tweets and retweets
+
+        Args:
+            files (list[tuple[str, str]]): (kind, path) of each file
+            batch_size (int, optional): # of records per batch/transaction. Defaults to 100000.
+            defer_indexes (bool, optional): drop triggers/secondary indexes during the load
+                and rebuild them (and the derived tables) at the end. Defaults to True.
+
+        Returns:
+            tuple[int, int]: total # of rows inserted, # of records rejected
+        """
+        assert Connection.is_connected()
+        started = time.perf_counter()
+        if defer_indexes:
+            Setup.begin_bulk_load()
+        inserted = rejected = 0
+        try:
+            for kind, path in sorted(files, key=lambda file: Ingest.ORDER.index(file[0])):
+                fileInserted, fileRejected = Ingest.ingest_file(kind, path, batch_size)
+                inserted += fileInserted
+                rejected += fileRejected
+        finally:
+            if defer_indexes:
+                Setup.end_bulk_load()
+            Trending.invalidate()
+            FollowGraph.unload()
+            Thread.invalidate()
+        elapsed = time.perf_counter() - started
+        print(f"Ingested {inserted} rows ({rejected} rejected) in {elapsed:.1f}s "
+              f"({inserted / elapsed if elapsed > 0 else 0:.0f} rows/sec, including index rebuild)")
+        return inserted, rejected
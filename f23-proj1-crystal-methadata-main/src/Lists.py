@@ -0,0 +1,277 @@
+import json
+
+from Connection import Connection
+from Login import Login
+from Search import Search
+from Feed import Feed
+from Pager import Pager
+
+
+class Lists:
+    """Curated lists of users (the lists/includes tables) and their timelines.
+
+    A list timeline has the rows, columns and order of Feed.FEED_QUERY, but for the
+    list's members instead of the users followed. Each page reads about a page worth of
+    index entries per member, from the newest one before the page starts, and only
+    fetches the tweets it shows, so its cost depends on the # of members, not on how
+    much they have ever posted.
+    """
+    LIST_OWNER_QUERY = "SELECT owner FROM lists WHERE lname = ?"
+    USERS_EXIST_QUERY = "SELECT usr FROM users WHERE usr IN (SELECT value FROM json_each(?))"
+
+    # lists of the user (?), with their # of members
+    OWNED_LISTS_QUERY = """
+            SELECT l.lname, (SELECT COUNT(*) FROM includes i WHERE i.lname = l.lname) AS members
+            FROM lists l
+            WHERE l.owner = ?
+            ORDER BY l.lname"""
+    # lists the user (?) is a member of, with their owners
+    MEMBER_OF_QUERY = """
+            SELECT i.lname, l.owner, u.name AS owner_name
+            FROM includes i, lists l, users u
+            WHERE i.member = ?
+                AND l.lname = i.lname
+                AND u.usr = l.owner
+            ORDER BY i.lname"""
+    MEMBERS_QUERY = "SELECT usr, name, city FROM includes i, users u WHERE i.lname = ? AND u.usr = i.member"
+    MEMBERS_KEYS = ["usr"]
+
+    # the tweets and retweets of a list's members, like Feed.FEED_QUERY (bound: the key the
+    # page starts after; then lname, depth - 1, lname, depth - 1, depth). The keys of the
+    # page are picked first from the covering indexes: each member's rows back to the date
+    # of their depth-th newest one before the start (so at most about depth per member),
+    # newest depth of them overall. Only those are joined with the tweets and users.
+    LIST_FEED_QUERY = """
+            WITH start (tdate, tid, retweeter) AS (
+                SELECT IFNULL(?, '9999-12-31'), IFNULL(?, 9223372036854775807), IFNULL(?, 9223372036854775807)),
+            page (tdate, tid, retweeter) AS (
+                SELECT w.tdate, w.tid, 0
+                FROM includes i, tweets w
+                WHERE i.lname = ?
+                    AND w.writer = i.member
+                    AND (w.tdate, w.tid) <= (SELECT tdate, tid FROM start)
+                    AND (w.tdate, w.tid, 0) <= (SELECT tdate, tid, retweeter FROM start)
+                    AND w.tdate >= IFNULL((
+                        SELECT y.tdate FROM tweets y
+                        WHERE y.writer = i.member
+                            AND (y.tdate, y.tid) <= (SELECT tdate, tid FROM start)
+                        ORDER BY y.tdate DESC, y.tid DESC
+                        LIMIT 1 OFFSET ?), '')
+                UNION ALL
+                SELECT r.rdate, r.tid, r.usr
+                FROM includes i, retweets r
+                WHERE i.lname = ?
+                    AND r.usr = i.member
+                    AND (r.rdate, r.tid) <= (SELECT tdate, tid FROM start)
+                    AND (r.rdate, r.tid, r.usr) <= (SELECT tdate, tid, retweeter FROM start)
+                    AND r.rdate >= IFNULL((
+                        SELECT y.rdate FROM retweets y
+                        WHERE y.usr = i.member
+                            AND (y.rdate, y.tid) <= (SELECT tdate, tid FROM start)
+                        ORDER BY y.rdate DESC, y.tid DESC
+                        LIMIT 1 OFFSET ?), '')
+                ORDER BY 1 DESC, 2 DESC, 3 DESC
+                LIMIT ?)
+            SELECT u.name, t.tid, t.writer, page.tdate, t.text, t.replyto, NULLIF(page.retweeter, 0) AS retweeter
+            FROM page, tweets t, users u
+            WHERE t.tid = page.tid
+                AND u.usr = t.writer"""
+
+
+    @staticmethod
+    def owner(lname: str) -> int:
+        """Gets the owner of a list
+
+        Args:
+            lname (str): the name of the list
+
+        Returns:
+            int: the user id of the owner, or None if there is no such list
+        """
+        assert Connection.is_connected()
+        Connection.cursor.execute(Lists.LIST_OWNER_QUERY, (lname,))
+        result = Connection.cursor.fetchone()
+        return None if result is None else result[0]
+
+
+    @staticmethod
+    def create(lname: str) -> bool:
+        """Creates an empty list owned by the currently logged-in user
+
+        Args:
+            lname (str): the name of the new list (list names are unique)
+
+        Returns:
+            bool: True if the list was created, False if the name is taken
+        """
+        assert Connection.is_connected()
+        Connection.cursor.execute("INSERT OR IGNORE INTO lists (lname, owner) VALUES (?, ?)",
+                                  (lname, Login.userID))
+        if Connection.cursor.rowcount == 0:
+            print(f"There is already a list named {lname}.")
+            print()
+            return False
+        Connection.commit()
+        print(f"Created list {lname}.")
+        print()
+        return True
+
+
+    @staticmethod
+    def add_members(lname: str, members: [int]) -> [int]:
+        """Adds users to a list of the currently logged-in user, in one transaction.
+            Unknown users and users already on the list are skipped.
+
+        Args:
+            lname (str): the name of the list
+            members (list[int]): the user ids to add
+
+        Returns:
+            list[int]: the user ids added
+        """
+        assert Connection.is_connected()
+        if Lists.owner(lname) != Login.userID:
+            print(f"You do not have a list named {lname}.")
+            print()
+            return []
+        Connection.cursor.execute(Lists.USERS_EXIST_QUERY, (json.dumps(members),))
+        known = set(row[0] for row in Connection.cursor.fetchall())
+        added = []
+        for member in dict.fromkeys(member for member in members if member in known):
+            Connection.cursor.execute("INSERT OR IGNORE INTO includes (lname, member) VALUES (?, ?)",
+                                      (lname, member))
+            if Connection.cursor.rowcount > 0:
+                added.append(member)
+        Connection.commit()
+        print(f"Added {len(added)} member{'s' if len(added) != 1 else ''} to {lname}.")
+        print()
+        return added
+
+
+    @staticmethod
+    def remove_members(lname: str, members: [int]) -> [int]:
+        """Removes users from a list of the currently logged-in user, in one transaction
+
+        Args:
+            lname (str): the name of the list
+            members (list[int]): the user ids to remove
+
+        Returns:
+            list[int]: the user ids that were on the list
+        """
+        assert Connection.is_connected()
+        if Lists.owner(lname) != Login.userID:
+            print(f"You do not have a list named {lname}.")
+            print()
+            return []
+        removed = []
+        for member in dict.fromkeys(members):
+            Connection.cursor.execute("DELETE FROM includes WHERE lname = ? AND member = ?", (lname, member))
+            if Connection.cursor.rowcount > 0:
+                removed.append(member)
+        Connection.commit()
+        print(f"Removed {len(removed)} member{'s' if len(removed) != 1 else ''} from {lname}.")
+        print()
+        return removed
+
+
+    @staticmethod
+    def list_feed_pager(lname: str, page_size: int = 5) -> Pager:
+        """Opens the timeline of a list, loading its first page
+
+        Args:
+            lname (str): the name of the list
+            page_size (int, optional): # of tweets per page. Defaults to 5.
+
+        Returns:
+            Pager: the list's timeline, with the same rows as Feed.feed_pager
+        """
+        assert Connection.is_connected()
+        depth = page_size + 2  # one more than the pager, plus the row the page starts after
+        return Pager(Lists.LIST_FEED_QUERY, (lname, depth - 1, lname, depth - 1, depth), Feed.FEED_KEYS,
+                     page_size, hydrate=Search.hydrate_tweets, bound=True)
+
+
+    @staticmethod
+    def members_pager(lname: str, page_size: int = 5) -> Pager:
+        """Pages through the members of a list
+
+        Args:
+            lname (str): the name of the list
+            page_size (int, optional): # of users per page. Defaults to 5.
+
+        Returns:
+            Pager: usr, name and city of each member
+        """
+        assert Connection.is_connected()
+        return Pager(Lists.MEMBERS_QUERY, (lname,), Lists.MEMBERS_KEYS, page_size, descending=False)
+
+
+    @staticmethod
+    def get_lists(usr: int) -> ([tuple], [tuple]):
+        """Gets the lists a user owns and the lists they are on
+
+        Args:
+            usr (int): the user id
+
+        Returns:
+            tuple: (lname, # of members) of each list owned, and (lname, owner,
+                owner's name) of each list the user is a member of
+        """
+        assert Connection.is_connected()
+        Connection.cursor.execute(Lists.OWNED_LISTS_QUERY, (usr,))
+        owned = Connection.cursor.fetchall()
+        Connection.cursor.execute(Lists.MEMBER_OF_QUERY, (usr,))
+        return owned, Connection.cursor.fetchall()
+
+
+    @staticmethod
+    def manage_lists() -> None:
+        """Shows the logged-in user's lists and lets them open, create and edit lists"""
+        assert Connection.is_connected()
+        assert Login.userID is not None
+        while True:
+            owned, memberOf = Lists.get_lists(Login.userID)
+            print("="*80)
+            print("Your lists:" if len(owned) > 0 else "You have no lists.")
+            for lname, members in owned:
+                print(f"\t{lname} ({members} member{'s' if members != 1 else ''})")
+            if len(memberOf) > 0:
+                print("Lists you are on:")
+                for lname, owner, ownerName in memberOf:
+                    print(f"\t{lname} (by {ownerName} (+{owner}))")
+            print("="*80)
+            print("open <list> | members <list> | create <list> | add <list> <usr>... | remove <list> <usr>... | back")
+
+            Connection.flush()
+            cmd = input(">>> ").strip().split()
+            if len(cmd) == 0 or cmd[0].lower() == "back":
+                return
+            action = cmd[0].lower()
+            if len(cmd) < 2 or action not in ("open", "members", "create", "add", "remove"):
+                print("INVALID COMMAND -_-")
+                continue
+            lname = cmd[1]
+            if action == "create":
+                Lists.create(lname)
+                continue
+            if Lists.owner(lname) is None:
+                print(f"There is no list named {lname}.")
+                continue
+            if action == "open":
+                Search.interact(Lists.list_feed_pager(lname), [
+                    "scrollup", "scrolldown", "viewinfo", "reply", "retweet", "thread"], 'tweet')
+                return
+            elif action == "members":
+                Search.interact(Lists.members_pager(lname), [
+                    "scrollup", "scrolldown", "select", "follow", "unfollow"], 'user')
+                return
+            try:
+                users = [int(usr) for usr in cmd[2:]]
+            except ValueError:
+                print("INVALID USER ID")
+                continue
+            if action == "add":
+                Lists.add_members(lname, users)
+            else:
+                Lists.remove_members(lname, users)
@@ -1,25 +1,16 @@
 from getpass import getpass
 from Connection import Connection
+from UserCache import UserCache
+from Sequence import Sequence
+from ThreadLocal import ThreadLocal
 
 
-class Login:
-    userID = None
-    name = None
-
-    @staticmethod
-    def get_highest_uid() -> int:
-        """Finds the id of the user with the highest id
-
-        Returns:
-            int: highest user id in the db
-        """
-        assert Connection.is_connected()
-        Connection.cursor.execute("SELECT MAX(usr) FROM users;")
-        result = Connection.cursor.fetchone()
-        if result[0] is None:
-            return 0
-        return int(result[0])
-
+class Login(metaclass=ThreadLocal):
+    # the logged-in user, per thread (the server sets it for each request)
+    THREAD_LOCAL = {
+        "userID": None,
+        "name": None,
+    }
 
     @staticmethod
     def login() -> bool:
@@ -79,6 +70,7 @@ class Login:
         else:
             # authentication successful
             Login.name = result[1]
+            UserCache.put('name', userid, Login.name)
             print(f"Welcome back, {Login.name}.")
             print("Here is your feed:\n")
             return True
@@ -124,7 +116,7 @@ class Login:
                 return False
 
             # create a new user with a unique uid
-            uid = Login.get_highest_uid() + 1
+            uid = Sequence.next_id('users')
             Connection.cursor.execute("""
             INSERT INTO users(usr, pwd, name, email, city, timezone) VALUES
                     (:usr, :pwd, :name, :email, :city, :timezone);
@@ -137,6 +129,7 @@ class Login:
                 "timezone": timezone
             })
             Connection.connection.commit()
+            UserCache.put('name', uid, name)
             print(f"\nWelcome, {name}.")
             print(f"Your new user ID is {uid}. You will need this ID later to log in.\n")
             Login.userID = uid
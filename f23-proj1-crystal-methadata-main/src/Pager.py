@@ -0,0 +1,143 @@
+from Connection import Connection
+
+
+class Pager:
+    """Lazily fetches the results of a query one page at a time.
+
+    Pages are found with a keyset cursor: instead of an OFFSET, each page asks for the
+    rows whose sort key comes after the last row of the previous page, so every page
+    costs one LIMIT-ed, index-friendly query and only the current page is kept in memory.
+    """
+
+    def __init__(self, query: str, params: tuple, keys: [str], page_size: int,
+                 descending: bool = True, hydrate=None, bound: bool = False) -> None:
+        """Creates a pager and loads its first page
+
+        Args:
+            query (str): a SELECT without ORDER BY/LIMIT
+            params (tuple): values to substitute in the query
+            keys (list[str]): expressions over the query's columns that order the rows,
+                most significant first. Together they must be unique and never NULL.
+            page_size (int): # of rows per page
+            descending (bool, optional): order the keys descending. Defaults to True.
+            hydrate (callable, optional): called with the rows of each page as it is
+                loaded, to attach related data in bulk. Defaults to None.
+            bound (bool, optional): the query's first placeholders (one per key) take the key
+                the page starts after (NULLs on the first page), eg. to stop LIMIT-ed
+                subqueries before rows already shown. Defaults to False.
+        """
+        self.query = query
+        self.params = tuple(params)
+        self.keys = keys
+        self.page_size = page_size
+        self.descending = descending
+        self.hydrate = hydrate
+        self.bound = bound
+
+        self.rows = []         # the rows (dicts) of the current page
+        self.has_next = False  # whether there are rows after the current page
+        self.starts = [None]   # the key each visited page starts after (None for page 1)
+        self.load()
+
+
+    @property
+    def page_number(self) -> int:
+        """int: the 1-based number of the current page"""
+        return len(self.starts)
+
+
+    @property
+    def offset(self) -> int:
+        """int: # of rows on the pages before the current one"""
+        return (self.page_number - 1) * self.page_size
+
+
+    def fetch(self, after: tuple) -> ([str], [tuple]):
+        """Runs the page query for the page after a key
+
+        Args:
+            after (tuple): the key of the last row before the page (None for page 1)
+
+        Returns:
+            tuple: the column names, and up to page_size + 1 rows (key columns last)
+        """
+        assert Connection.is_connected()
+        direction = "DESC" if self.descending else "ASC"
+        key_columns = ", ".join(
+            f"{key} AS _key{idx}" for idx, key in enumerate(self.keys))
+        order_clause = ", ".join(f"{key} {direction}" for key in self.keys)
+
+        where_clause = ""
+        params = self.params
+        if self.bound:
+            params = (tuple(after) if after is not None else (None,) * len(self.keys)) + params
+        if after is not None:
+            comparison = "<" if self.descending else ">"
+            placeholders = ", ".join("?" * len(self.keys))
+            where_clause = f"WHERE ({', '.join(self.keys)}) {comparison} ({placeholders})"
+            params = params + tuple(after)
+
+        pageQuery = f"""
+            SELECT *, {key_columns}
+            FROM ({self.query})
+            {where_clause}
+            ORDER BY {order_clause}
+            LIMIT ?"""
+        Connection.cursor.execute(pageQuery, params + (self.page_size + 1,))
+        results = Connection.cursor.fetchall()
+        return [description[0] for description in Connection.cursor.description], results
+
+
+    def load(self) -> None:
+        """Fetches the current page (plus one row, to know if there is a next page)"""
+        column_names, results = self.fetch(self.starts[-1])
+        num_keys = len(self.keys)
+        self.has_next = len(results) > self.page_size
+        self.rows = []
+        self.row_keys = []
+        for row in results[:self.page_size]:
+            self.rows.append(dict(zip(column_names[:-num_keys], row[:-num_keys])))
+            self.row_keys.append(row[-num_keys:])
+
+        if self.hydrate is not None and len(self.rows) > 0:
+            self.hydrate(self.rows)
+
+
+    def next(self) -> bool:
+        """Moves to the next page, if there is one
+
+        Returns:
+            bool: True if the page changed
+        """
+        if not self.has_next:
+            return False
+        self.starts.append(self.row_keys[-1])
+        self.load()
+        return True
+
+
+    def previous(self) -> bool:
+        """Moves to the previous page, if there is one
+
+        Returns:
+            bool: True if the page changed
+        """
+        if len(self.starts) == 1:
+            return False
+        self.starts.pop()
+        self.load()
+        return True
+
+
+    def item(self, index: int) -> dict:
+        """Gets a row of the current page by its list number
+
+        Args:
+            index (int): 1-based position in the whole result list, as printed
+
+        Returns:
+            dict: the row, or None if it is not on the current page
+        """
+        if index <= self.offset or index > self.offset + len(self.rows):
+            return None
+        return self.rows[index - self.offset - 1]
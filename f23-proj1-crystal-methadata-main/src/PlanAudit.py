@@ -0,0 +1,138 @@
+import re
+import sys
+from Connection import Connection
+from Setup import Setup
+from Feed import Feed
+from Search import Search
+from Follow import Follow
+from ComposeTweet import ComposeTweet
+from Timeline import Timeline
+from Ingest import Ingest
+from Trending import Trending
+from FollowGraph import FollowGraph
+from Lists import Lists
+from Thread import Thread
+
+
+class PlanAudit:
+    # every <NAME>_QUERY attribute of these classes is audited
+    # (and of Timeline, when the timeline tables exist)
+    AUDITED_CLASSES = [Feed, Search, Follow, ComposeTweet, Ingest, Trending, FollowGraph, Lists, Thread]
+
+    # sample keyword lists used to build the dynamic tweet search query
+    SEARCH_SAMPLES = [["hello"], ["#hello"], ["hello", "#world"], ["hello world"]]
+
+    # queries whose full scans are known and accepted for now (name -> reason)
+    KNOWN_SCANS = {
+        "Search.USER_SEARCH_SHORT_QUERY": "keywords under 3 characters have no trigrams to look up",
+        "FollowGraph.OUT_DEGREES_QUERY": "reads the whole graph into memory",
+        "FollowGraph.OUT_EDGES_QUERY": "reads the whole graph into memory",
+        "FollowGraph.IN_DEGREES_QUERY": "reads the whole graph into memory",
+        "FollowGraph.IN_EDGES_QUERY": "reads the whole graph into memory",
+    }
+
+    @staticmethod
+    def collect_queries() -> {str: str}:
+        """Gathers every named query of the audited classes, plus samples of the dynamic ones
+
+        Returns:
+            dict[str, str]: query name (eg. Feed.FEED_QUERY) -> query text
+        """
+        queries = {}
+        classes = PlanAudit.AUDITED_CLASSES
+        if Timeline.is_enabled():
+            classes = classes + [Timeline]
+        for cls in classes:
+            for attr, value in vars(cls).items():
+                if attr.endswith("_QUERY") and isinstance(value, str):
+                    queries[f"{cls.__name__}.{attr}"] = value
+        for idx, keywords in enumerate(PlanAudit.SEARCH_SAMPLES):
+            for order in ['date', 'relevance']:
+                query, _, _ = Search.build_tweet_search_query(keywords, order)
+                queries[f"Search.search_for_tweets#{idx+1}-{order}"] = query
+        return queries
+
+
+    @staticmethod
+    def explain(query: str) -> [str]:
+        """Runs EXPLAIN QUERY PLAN on a query, binding NULL to every parameter
+
+        Args:
+            query (str): the query to explain
+
+        Returns:
+            list[str]: the detail column of each plan step
+        """
+        assert Connection.is_connected()
+        named = re.findall(r":(\w+)", query)
+        if named:
+            values = {name: None for name in named}
+        else:
+            values = (None,) * query.count("?")
+        Connection.cursor.execute("EXPLAIN QUERY PLAN " + query, values)
+        return [row[3] for row in Connection.cursor.fetchall()]
+
+
+    @staticmethod
+    def find_scans(plan: [str]) -> [str]:
+        """Picks out the plan steps that read a whole table or index.
+            Scans of subqueries/CTEs the plan materializes itself are not counted.
+
+        Args:
+            plan (list[str]): plan steps as returned by explain()
+
+        Returns:
+            list[str]: the offending plan steps
+        """
+        subqueries = set()
+        for step in plan:
+            if step.startswith("MATERIALIZE ") or step.startswith("CO-ROUTINE "):
+                subqueries.add(step.split()[1])
+        return [step for step in plan
+                if step.startswith("SCAN ")
+                and not step.startswith("SCAN CONSTANT ROW")
+                and step.split()[1] not in subqueries
+                and "VIRTUAL TABLE INDEX" not in step]
+
+
+    @staticmethod
+    def audit(verbose: bool = False) -> bool:
+        """Audits the plans of all collected queries, reporting any full scans
+
+        Args:
+            verbose (bool, optional): print the plan of every query. Defaults to False.
+
+        Returns:
+            bool: True if no query (outside of KNOWN_SCANS) scans a table
+        """
+        passed = True
+        for name, query in PlanAudit.collect_queries().items():
+            plan = PlanAudit.explain(query)
+            scans = PlanAudit.find_scans(plan)
+            known = PlanAudit.KNOWN_SCANS.get(name.split("#")[0])
+            if scans and known is None:
+                passed = False
+                print(f"FAIL {name}: {'; '.join(scans)}")
+            elif scans:
+                print(f"KNOWN {name}: {known}")
+            elif verbose:
+                print(f"OK   {name}")
+            if verbose:
+                for step in plan:
+                    print(f"\t{step}")
+        return passed
+
+
+if __name__ == "__main__":
+    # audits a fresh in-memory schema unless a db is given
+    dbPath = ":memory:"
+    if "--db-path" in sys.argv and sys.argv.index("--db-path") < len(sys.argv) - 1:
+        dbPath = sys.argv[sys.argv.index("--db-path") + 1]
+    Connection.connect(dbPath)
+    Setup.define_tables()
+    if dbPath == ":memory:":
+        Connection.cursor.executescript(Timeline.DEFINE_SCRIPT)
+
+    ok = PlanAudit.audit("--verbose" in sys.argv)
+    Connection.close()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,251 @@
+import re
+import time
+import sqlite3
+from collections import deque
+
+
+class QueryLog:
+    """Optional per-statement timing of everything run through Connection.cursor.
+
+    While enabled, Connection hands out a QueryLog.Cursor, which times each statement
+    (execute plus the fetches that follow it) and adds it to a counter keyed by the shell
+    command that ran it and its normalized SQL (literals replaced by ?, whitespace
+    collapsed). Statements slower than slow_ms are also kept in the slow-query log along
+    with their EXPLAIN QUERY PLAN, and appended to slow_log_path if one is set.
+    """
+    enabled = False
+    slow_ms = 100.0
+    slow_log_path = None
+    max_slow = 50
+
+    command = None  # the shell command the current statements belong to
+    stats = {}      # (command, normalized sql) -> [count, total seconds, max seconds, rows]
+    slow = deque(maxlen=max_slow)  # (command, elapsed ms, sql, plan lines), newest last
+
+    LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+    IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+    class Cursor(sqlite3.Cursor):
+        """A cursor that reports every statement it runs to QueryLog"""
+
+        def __init__(self, *args, **kwargs) -> None:
+            super().__init__(*args, **kwargs)
+            self.current = None  # [sql, params, seconds, rows] of the last statement
+
+        def execute(self, sql, parameters=()):
+            QueryLog.finish(self)
+            start = time.perf_counter()
+            try:
+                return super().execute(sql, parameters)
+            finally:
+                self.current = [sql, parameters, time.perf_counter() - start, 0]
+
+        def executemany(self, sql, seq_of_parameters):
+            QueryLog.finish(self)
+            seq_of_parameters = list(seq_of_parameters)
+            start = time.perf_counter()
+            try:
+                return super().executemany(sql, seq_of_parameters)
+            finally:
+                first = seq_of_parameters[0] if len(seq_of_parameters) > 0 else None
+                self.current = [sql, first, time.perf_counter() - start, 0]
+                QueryLog.finish(self)
+
+        def executescript(self, sql_script):
+            QueryLog.finish(self)
+            start = time.perf_counter()
+            try:
+                return super().executescript(sql_script)
+            finally:
+                self.current = [sql_script, None, time.perf_counter() - start, 0]
+                QueryLog.finish(self)
+
+        def fetchone(self):
+            start = time.perf_counter()
+            row = super().fetchone()
+            self.fetched(time.perf_counter() - start, 0 if row is None else 1, row is None)
+            return row
+
+        def fetchmany(self, size=None):
+            start = time.perf_counter()
+            rows = super().fetchmany(self.arraysize if size is None else size)
+            self.fetched(time.perf_counter() - start, len(rows), len(rows) == 0)
+            return rows
+
+        def fetchall(self):
+            start = time.perf_counter()
+            rows = super().fetchall()
+            self.fetched(time.perf_counter() - start, len(rows), True)
+            return rows
+
+        def __next__(self):
+            start = time.perf_counter()
+            try:
+                row = super().__next__()
+            except StopIteration:
+                self.fetched(time.perf_counter() - start, 0, True)
+                raise
+            self.fetched(time.perf_counter() - start, 1, False)
+            return row
+
+        def close(self):
+            QueryLog.finish(self)  # eg. a cursor abandoned before the end of its rows
+            super().close()
+
+        def fetched(self, elapsed: float, rows: int, done: bool) -> None:
+            """Adds fetch time/rows to the last statement, finishing it once exhausted"""
+            if self.current is not None:
+                self.current[2] += elapsed
+                self.current[3] += rows
+                if done:
+                    QueryLog.finish(self)
+
+
+    @staticmethod
+    def enable(slow_ms: float = None, slow_log_path: str = None) -> None:
+        """Turns the instrumentation on, swapping in an instrumented Connection.cursor
+            if already connected
+
+        Args:
+            slow_ms (float, optional): threshold for the slow-query log. Unchanged if None.
+            slow_log_path (str, optional): file to also append slow queries to. Unchanged if None.
+        """
+        from Connection import Connection
+        QueryLog.enabled = True
+        if slow_ms is not None:
+            QueryLog.slow_ms = slow_ms
+        if slow_log_path is not None:
+            QueryLog.slow_log_path = slow_log_path
+        if Connection.is_connected() and not isinstance(Connection.cursor, QueryLog.Cursor):
+            Connection.cursor = Connection.connection.cursor(QueryLog.Cursor)
+
+
+    @staticmethod
+    def tag(command: str) -> None:
+        """Attributes the statements that follow to a shell command
+
+        Args:
+            command (str): the command, eg. 'feed' or 'viewinfo'
+        """
+        QueryLog.command = command
+
+
+    @staticmethod
+    def normalize(sql: str) -> str:
+        """Reduces a statement to its shape, so calls with different values group together
+
+        Args:
+            sql (str): the statement
+
+        Returns:
+            str: the statement with literals as ?, IN lists as (...) and single spaces
+        """
+        sql = QueryLog.LITERALS.sub("?", sql)
+        sql = QueryLog.IN_LISTS.sub("(...)", sql)
+        return " ".join(sql.split()).rstrip(";")
+
+
+    @staticmethod
+    def finish(cursor) -> None:
+        """Records the last statement of a cursor, if it has not been already
+
+        Args:
+            cursor (QueryLog.Cursor): the cursor
+        """
+        if cursor.current is None:
+            return
+        sql, params, elapsed, rows = cursor.current
+        cursor.current = None
+
+        key = (QueryLog.command, QueryLog.normalize(sql))
+        entry = QueryLog.stats.setdefault(key, [0, 0.0, 0.0, 0])
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] = max(entry[2], elapsed)
+        entry[3] += rows
+
+        if elapsed * 1000 >= QueryLog.slow_ms:
+            QueryLog.log_slow(cursor.connection, sql, params, elapsed)
+
+
+    @staticmethod
+    def log_slow(connection: sqlite3.Connection, sql: str, params, elapsed: float) -> None:
+        """Adds a statement to the slow-query log with its query plan
+
+        Args:
+            connection (sqlite3.Connection): the connection it ran on
+            sql (str): the statement
+            params: the values it was run with (None for a script)
+            elapsed (float): seconds it took
+        """
+        plan = []
+        if params is not None and sql.lstrip().split(None, 1)[0].upper() in (
+                "SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE"):
+            try:
+                # a plain cursor, so explaining is not itself logged
+                rows = sqlite3.Cursor(connection).execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+                plan = [detail for _, _, _, detail in rows]
+            except sqlite3.Error as error:
+                plan = [f"(no plan: {error})"]
+
+        entry = (QueryLog.command, elapsed * 1000, " ".join(sql.split()), plan)
+        QueryLog.slow.append(entry)
+        if QueryLog.slow_log_path is not None:
+            with open(QueryLog.slow_log_path, "a") as file:
+                file.write(QueryLog.format_slow(entry) + "\n")
+
+
+    @staticmethod
+    def format_slow(entry: tuple, max_length: int = None) -> str:
+        """Formats a slow-query log entry
+
+        Args:
+            entry (tuple): (command, elapsed ms, sql, plan lines)
+            max_length (int, optional): # of characters of sql to keep. Defaults to all.
+
+        Returns:
+            str: the entry as printed/written
+        """
+        command, elapsed_ms, sql, plan = entry
+        if max_length is not None and len(sql) > max_length:
+            sql = sql[:max_length - 3] + "..."
+        lines = [f"[{elapsed_ms:.1f} ms, {command or '-'}] {sql}"]
+        lines += [f"    {detail}" for detail in plan]
+        return "\n".join(lines)
+
+
+    @staticmethod
+    def reset() -> None:
+        """Drops every counter and the slow-query log"""
+        QueryLog.stats.clear()
+        QueryLog.slow.clear()
+
+
+    @staticmethod
+    def print_summary(limit: int = 15) -> None:
+        """Prints the statements that took the most total time, and the slow-query log
+
+        Args:
+            limit (int, optional): # of statements to list. Defaults to 15.
+        """
+        if not QueryLog.enabled:
+            print("Query stats are off (start with --query-stats).")
+            return
+        from Connection import Connection
+        if Connection.is_connected():
+            QueryLog.finish(Connection.cursor)
+
+        entries = sorted(QueryLog.stats.items(), key=lambda item: item[1][1], reverse=True)
+        total = sum(entry[1] for _, entry in entries)
+        calls = sum(entry[0] for _, entry in entries)
+        print(f"Query stats: {calls} statements, {total * 1000:.1f} ms total")
+        print(f"{'command':<14} {'calls':>7} {'total ms':>10} {'mean ms':>9} {'max ms':>9} {'rows':>8}  statement")
+        for (command, sql), (count, seconds, longest, rows) in entries[:limit]:
+            text = sql if len(sql) <= 70 else sql[:67] + "..."
+            print(f"{command or '-':<14} {count:7} {seconds * 1000:10.2f} {seconds * 1000 / count:9.3f} "
+                  f"{longest * 1000:9.3f} {rows:8}  {text}")
+
+        print(f"{len(QueryLog.slow)} slow quer{'y' if len(QueryLog.slow) == 1 else 'ies'} "
+              f"(over {QueryLog.slow_ms:g} ms) logged")
+        for entry in QueryLog.slow:
+            print(QueryLog.format_slow(entry, 200))
@@ -1,55 +1,207 @@
-import math
+import json
+import shlex
 from Connection import Connection
 from Setup import Setup
 from Login import Login
 from Follow import Follow
+from Pager import Pager
+from UserCache import UserCache
+from QueryLog import QueryLog
 
 
 class Search:
+    USER_TWEETS_QUERY = """
+            SELECT u.name, t.tid, t.writer, t.tdate, t.text, t.replyto, NULL as retweeter
+            FROM users u, tweets t
+            WHERE u.usr = t.writer
+            AND t.writer = ?"""
+    TWEET_KEYS = ["tdate", "tid"]
+
+    # users whose name match are shown in ascending order of name length first
+    # then, remaining users by ascending order of city length
+    USER_SEARCH_QUERY = """
+            SELECT usr, name, city,
+                (CASE
+                    WHEN LOWER(name) LIKE '%' || LOWER(?) || '%' THEN 1
+                    ELSE 2
+                END) AS match_rank,
+                (CASE
+                    WHEN LOWER(name) LIKE '%' || LOWER(?) || '%' THEN LENGTH(name)
+                    ELSE LENGTH(city)
+                END) AS match_length
+            FROM users
+            WHERE usr IN (SELECT rowid FROM users_fts WHERE users_fts MATCH ?)
+                AND (LOWER(name) LIKE '%' || LOWER(?) || '%'
+                    OR LOWER(city) LIKE '%' || LOWER(?) || '%')"""
+    # keywords under 3 characters have no trigrams to look up, so they scan users
+    USER_SEARCH_SHORT_QUERY = """
+            SELECT usr, name, city,
+                (CASE
+                    WHEN LOWER(name) LIKE '%' || LOWER(?) || '%' THEN 1
+                    ELSE 2
+                END) AS match_rank,
+                (CASE
+                    WHEN LOWER(name) LIKE '%' || LOWER(?) || '%' THEN LENGTH(name)
+                    ELSE LENGTH(city)
+                END) AS match_length
+            FROM users
+            WHERE LOWER(name) LIKE '%' || LOWER(?) || '%' 
+            OR LOWER(city) LIKE '%' || LOWER(?) || '%'"""
+    USER_SEARCH_KEYS = ["match_rank", "match_length", "usr"]
+
+    # users who follow the logged in user in descending date followed
+    FOLLOWERS_QUERY = "SELECT usr, name, city, start_date FROM follows, users WHERE flwee = ? AND flwer = usr"
+    FOLLOWERS_KEYS = ["start_date", "usr"]
+
+    PROFILE_QUERY = "SELECT name, city FROM users WHERE usr = ?"
+
+    # counters kept up to date by the triggers from Setup.define_counters
+    TWEET_STATS_QUERY = "SELECT retweets, replies FROM tweet_stats WHERE tid = ?"
+    USER_STATS_QUERY = "SELECT tweets, followers, following FROM user_stats WHERE usr = ?"
+
+    # parents of replies (with their authors) and retweeter names for a whole page,
+    # each ? being a JSON array of ids
+    HYDRATE_QUERY = """
+            SELECT 'parent', t.tid, u.name, t.writer, t.text
+            FROM tweets t, users u
+            WHERE t.tid IN (SELECT value FROM json_each(?))
+                AND u.usr = t.writer
+            UNION ALL
+            SELECT 'retweeter', u.usr, u.name, u.usr, NULL
+            FROM users u
+            WHERE u.usr IN (SELECT value FROM json_each(?))"""
+
     @staticmethod
     def search_for_tweets() -> None:
         """Prompts for keywords to search tweets by (text+mentions) and displays the results.
             Provides various options for interacting with the results (ie. a tweets activity)
         """
         while True:
-            keywords = input(
-                "Enter keywords to search for (separate multiple keywords with spaces): ").strip().lower().split()
+            line = input(
+                "Enter keywords to search for (separate multiple keywords with spaces): ")
+            keywords, order = Search.parse_keywords(line)
             if len(keywords) == 0:
                 print("Please enter at least one keyword.")
             else:
                 break
 
-        conditions = []
-        params = []
-        tables = set(["tweets t", "users u"])
-        for keyword in keywords:
-            if keyword.startswith("#"):
-                tables.add("mentions m")
-                term = keyword[1:]
-                conditions.append("(LOWER(m.term) = ? AND m.tid = t.tid)")
-                params.append(term)
-            else:
-                conditions.append("(LOWER(t.text) LIKE ?)")
-                params.append('%' + keyword + '%')
+        pager = Search.tweet_search_pager(keywords, order)
+        Search.interact(pager, [
+            "scrollup", "scrolldown", "viewinfo", "reply", "retweet", "thread"], 'tweet')
+
+
+    @staticmethod
+    def parse_keywords(line: str) -> ([str], str):
+        """Splits a tweet search line into its keywords and sort order
+
+        Args:
+            line (str): the keywords as typed, optionally with sort:relevance/sort:date
+
+        Returns:
+            tuple: the lowercase keywords (possibly none) and the order ('date' or 'relevance')
+        """
+        line = line.strip().lower()
+        try:
+            # keep "quoted phrases" together as one keyword
+            keywords = shlex.split(line)
+        except ValueError:
+            keywords = line.split()
+
+        # sort:relevance / sort:date pick the result order
+        order = 'date'
+        for keyword in [kw for kw in keywords if kw.startswith("sort:")]:
+            order = 'relevance' if keyword == "sort:relevance" else 'date'
+            keywords.remove(keyword)
+
+        keywords = [kw for kw in keywords if any(ch.isalnum() for ch in kw)]
+        return keywords, order
+
+
+    @staticmethod
+    def tweet_search_pager(keywords: [str], order: str = 'date', page_size: int = 5) -> Pager:
+        """Searches tweets by keywords, loading the first page of results
+
+        Args:
+            keywords (list[str]): the lowercase keywords (at least one)
+            order (str, optional): 'date' or 'relevance'. Defaults to 'date'.
+            page_size (int, optional): # of tweets per page. Defaults to 5.
 
-        table_clause = ", ".join(tables)
-        where_clause = " OR ".join(conditions)
+        Returns:
+            Pager: the matching tweets
+        """
+        assert Connection.is_connected()
+        query, params, keys = Search.build_tweet_search_query(keywords, order)
+        return Pager(query, params, keys, page_size, hydrate=Search.hydrate_tweets)
+
+
+    @staticmethod
+    def build_tweet_search_query(keywords: [str], order: str = 'date') -> (str, list, [str]):
+        """Builds the tweet search query for a list of lowercase keywords.
+            Keywords starting with '#' match on mentions, the rest go through the
+            tweets_fts full-text index: plain words match as prefixes ("tweet" finds
+            "tweets") and keywords containing spaces match as exact phrases.
+            A tweet matching any keyword is returned.
+
+        Args:
+            keywords (list[str]): the keywords to search for
+            order (str, optional): 'date' (newest first) or 'relevance' (bm25,
+                hashtag-only matches last). Defaults to 'date'.
+
+        Returns:
+            tuple[str, list, list[str]]: the query, the values to substitute in it
+                and the (descending) sort keys to page it with
+        """
+        terms = [kw[1:] for kw in keywords if kw.startswith("#")]
+        phrases = [kw for kw in keywords if not kw.startswith("#")]
+
+        sources = []
+        params = []
+        if len(phrases) > 0:
+            sources.append("""
+                SELECT rowid, bm25(tweets_fts) FROM tweets_fts WHERE tweets_fts MATCH ?""")
+            params.append(Search.to_fts_query(phrases))
+        if len(terms) > 0:
+            # terms are stored lowercase, so the mentions_term index applies
+            sources.append(f"""
+                SELECT tid, NULL FROM mentions WHERE term IN ({", ".join("?" * len(terms))})""")
+            params.extend(terms)
+
+        if order == 'relevance':
+            # bm25 is negative, lower is better; hashtag-only matches (NULL) go last
+            keys = ["IFNULL(-score, -1)", "tdate", "tid"]
+        else:
+            keys = Search.TWEET_KEYS
 
+        union_clause = "\n                UNION ALL".join(sources)
         query = f"""
-            SELECT DISTINCT u.name, t.tid, t.writer, t.tdate, t.text, t.replyto, NULL as retweeter
-            FROM {table_clause}
-            WHERE ({where_clause})
-            AND u.usr = t.writer
-            ORDER BY t.tdate DESC;"""
+            WITH matches(tid, score) AS MATERIALIZED ({union_clause}
+            )
+            SELECT u.name, t.tid, t.writer, t.tdate, t.text, t.replyto, NULL as retweeter, m.score
+            FROM (SELECT tid, MIN(score) AS score FROM matches GROUP BY tid) m, tweets t, users u
+            WHERE t.tid = m.tid
+            AND u.usr = t.writer"""
+        return query, params, keys
 
-        Connection.cursor.execute(query, params)
-        results = Connection.cursor.fetchall()
 
-        column_names = [description[0]
-                        for description in Connection.cursor.description]
+    @staticmethod
+    def to_fts_query(phrases: [str]) -> str:
+        """Converts search keywords into an FTS5 MATCH expression
 
-        Search.parse_results(results, column_names, 5, [
-            "scrollup", "scrolldown", "viewinfo", "reply", "retweet"], 'tweet')
+        Args:
+            phrases (list[str]): keywords; ones containing spaces are matched as phrases,
+                the rest as prefixes (a trailing '*' is accepted but not required)
+
+        Returns:
+            str: the MATCH expression, with the keywords OR-ed together
+        """
+        expressions = []
+        for phrase in phrases:
+            quoted = '"' + phrase.rstrip("*").replace('"', '""') + '"'
+            if " " in phrase.strip():
+                expressions.append(quoted)
+            else:
+                expressions.append(quoted + "*")
+        return " OR ".join(expressions)
 
 
     @staticmethod
@@ -59,22 +211,27 @@ class Search:
         Args:
             usr (int): the user id of the selected user
         """
-        query = f"""
-            SELECT DISTINCT u.name, t.tid, t.writer, t.tdate, t.text, t.replyto, NULL as retweeter
-            FROM users u, tweets t
-            WHERE u.usr = t.writer
-            AND t.writer = ?
-            ORDER BY t.tdate DESC;"""   
-            
-        Connection.cursor.execute(query, (usr,))
-        results = Connection.cursor.fetchall()
-
-        column_names = [description[0]
-                        for description in Connection.cursor.description]
-        Search.parse_results(results, column_names, 3, [
-            "scrollup", "scrolldown", "viewinfo", "reply", "retweet"], 'tweet')   
+        pager = Search.user_tweets_pager(usr)
+        Search.interact(pager, [
+            "scrollup", "scrolldown", "viewinfo", "reply", "retweet", "thread"], 'tweet')   
 
     
+    @staticmethod
+    def user_tweets_pager(usr: int, page_size: int = 3) -> Pager:
+        """Opens the tweets of a user, newest first, loading the first page
+
+        Args:
+            usr (int): the user id of the writer
+            page_size (int, optional): # of tweets per page. Defaults to 3.
+
+        Returns:
+            Pager: the user's tweets
+        """
+        assert Connection.is_connected()
+        return Pager(Search.USER_TWEETS_QUERY, (usr,), Search.TWEET_KEYS, page_size,
+                     hydrate=Search.hydrate_tweets)
+
+
     @staticmethod
     def search_for_users() -> None:
         """Prompts for keywords to search users by (name+city) and displays the results.
@@ -90,89 +247,58 @@ class Search:
             else:
                 break
 
-        # users whose name match are shown in ascending order of name length first
-        # then, remaining users by ascending order of city length
-        query = """
-            SELECT DISTINCT usr, name, city
-            FROM users
-            WHERE LOWER(name) LIKE '%' || LOWER(?) || '%' 
-            OR LOWER(city) LIKE '%' || LOWER(?) || '%'
-            ORDER BY
-                (CASE
-                    WHEN LOWER(name) LIKE '%' || LOWER(?) || '%' THEN 1
-                    ELSE 2
-                END),
-                (CASE
-                    WHEN LOWER(name) LIKE '%' || LOWER(?) || '%' THEN LENGTH(name)
-                    ELSE LENGTH(city)
-                END);"""
-        Connection.cursor.execute(query, (keyword[0], keyword[0], keyword[0], keyword[0]))
-        results = Connection.cursor.fetchall()
+        pager = Search.user_search_pager(keyword[0])
+        Search.interact(pager, ["scrollup", "scrolldown", "select", "follow", "unfollow"], 'user')
 
-        column_names = [description[0]
-                        for description in Connection.cursor.description]
 
-        Search.parse_results(results, column_names, 5,
-                            ["scrollup", "scrolldown", "select", "follow"], 'user')
+    @staticmethod
+    def user_search_pager(keyword: str, page_size: int = 5) -> Pager:
+        """Searches users by a keyword in their name or city, loading the first page of results
 
+        Args:
+            keyword (str): the keyword
+            page_size (int, optional): # of users per page. Defaults to 5.
 
-    @staticmethod
-    def search_for_followers() -> None:
-        """Searches for all followers of currently logged in user,
-            displaying results in a users activity.
+        Returns:
+            Pager: the matching users, best matches first
         """
         assert Connection.is_connected()
-        # users whose follow the logged in user in ordered in descending date followed
-        query = "SELECT DISTINCT usr, name, city FROM follows, users WHERE flwee = ? AND flwer = usr ORDER BY start_date DESC"
-        Connection.cursor.execute(query, (Login.userID,))
-        results = Connection.cursor.fetchall()
-
-        column_names = [description[0]
-                        for description in Connection.cursor.description]
-
-        Search.parse_results(results, column_names, len(results), [
-                             "scrollup", "scrolldown", "select", "follow"], 'user')
+        if len(keyword) < 3:
+            return Pager(Search.USER_SEARCH_SHORT_QUERY, (keyword,) * 4,
+                         Search.USER_SEARCH_KEYS, page_size, descending=False)
+        # the trigram index finds candidates (case-insensitively); LIKE keeps the exact matches
+        match = '"' + keyword.replace('"', '""') + '"'
+        return Pager(Search.USER_SEARCH_QUERY, (keyword, keyword, match, keyword, keyword),
+                     Search.USER_SEARCH_KEYS, page_size, descending=False)
 
 
     @staticmethod
-    def parse_results(query_results: [tuple], column_names: [str], num_display: int, additional_options: [str], item_type: str) -> None:
-        """Parses query results (a list of tuples ie. rows),
-            converting to a list of dictionaries (keys are column names)
-            and passes it to interact()
-
-        Args:
-            query_result (list[tuple]): the query results
-            column_names (list[str]): the names of the columns returned for query results
-            num_display (int): number of tweets/user to display at once
-            additional_options (list[str]): the additional commands after searching tweets/users
-            item_type (str): the type of items being displayed (user/tweet)
+    def search_for_followers() -> None:
+        """Searches for all followers of currently logged in user,
+            displaying results in a users activity.
         """
-        result_list = []
-        for row in query_results:
-            row_dict = dict(zip(column_names, row))
-            result_list.append(row_dict)
-        Search.interact(result_list, num_display,
-                        additional_options, item_type)
+        assert Connection.is_connected()
+        pager = Pager(Search.FOLLOWERS_QUERY, (Login.userID,), Search.FOLLOWERS_KEYS, 5)
+        Search.interact(pager, ["scrollup", "scrolldown", "select", "follow", "unfollow"], 'user')
 
 
     @staticmethod
-    def interact(lst: [dict], num_display: int, additional_options: [str], item_type: str) -> None:
+    def interact(pager: Pager, additional_options: [str], item_type: str) -> None:
         """Provides options for interacting with the results of a search via a phony shell
 
         Args:
-            lst (list[dict]): A list of tweet/user objects
-            num_display (int): The number of tweets/users to display per page
+            pager (Pager): The paged tweet/user results
             additional_options (list[str]): A list of additional commands that can be run by the phony shell
             item_type (string): The type of item being displayed (tweet or user)
         """
-        offset = 0
         print_options = True
 
         # run a dummy shell with updated commands for as long as user is here
         while True:
             if print_options:
-                Search.print_items(lst, num_display, offset, item_type)
+                Search.print_items(pager, item_type)
 
+            Connection.flush()  # never hold writes back while waiting on the user
             cmd = input(">>> ").strip().lower().split()
             if len(cmd) < 1:
                 print("INVALID COMMAND -_-")
@@ -189,21 +315,33 @@ class Search:
                 else:
                     print_options = False
                     continue
-            elif cmd[0] == 'scrolldown' and len(cmd) == 1:
-                if offset + num_display < len(lst):
-                    offset += num_display
+
+            QueryLog.tag(cmd[0])
+            if cmd[0] == 'scrolldown' and len(cmd) == 1:
+                pager.next()
             elif cmd[0] == 'scrollup' and len(cmd) == 1:
-                offset = max(offset - num_display, 0)
+                pager.previous()
             # follow a selected user
             elif cmd[0] == 'follow' and item_type == 'user':
                 try:
-                    index = int(cmd[1])
                     # select user by the position of where they appear in a list
-                    if index > len(lst)+1 or index < 1:
+                    item = pager.item(int(cmd[1]))
+                    if item is None:
                         print("INVALID INDEX")
                         continue
-                    usr = lst[index-1]['usr']
-                    Follow.follow(usr)
+                    Follow.follow(item['usr'])
+                    print_options = False
+                except:
+                    print("INVALID INDEX")
+                    continue
+            # unfollow a selected user
+            elif cmd[0] == 'unfollow' and item_type == 'user':
+                try:
+                    item = pager.item(int(cmd[1]))
+                    if item is None:
+                        print("INVALID INDEX")
+                        continue
+                    Follow.unfollow(item['usr'])
                     print_options = False
                 except:
                     print("INVALID INDEX")
@@ -212,14 +350,13 @@ class Search:
             elif cmd[0] == 'select' and item_type == 'user':
                 print_options = False
                 try:
-                    index = int(cmd[1])
                     # select user by the position of where they appear in a list
-                    if index > len(lst)+1 or index < 1:
+                    item = pager.item(int(cmd[1]))
+                    if item is None:
                         print("INVALID INDEX")
                         continue
-                    usr = lst[index-1]['usr']
-                    Search.get_user_info(usr, lst[index-1]['name']) # displays user info
-                    Search.search_for_user_tweets(usr) # displays tweets of users
+                    Search.get_user_info(item['usr'], item['name']) # displays user info
+                    Search.search_for_user_tweets(item['usr']) # displays tweets of users
                     return
                 except:
                     print("INVALID INDEX")
@@ -227,7 +364,7 @@ class Search:
             # reply to the numbered tweet
             elif cmd[0] == 'reply' and item_type == 'tweet' and len(cmd) == 2:
                 print_options = False
-                tid = Search.listnum_to_tid(lst, cmd[1])
+                tid = Search.listnum_to_tid(pager, cmd[1])
                 if tid is None:
                     print("INVALID INDEX")
                     continue
@@ -236,25 +373,32 @@ class Search:
             # retweet the numbered tweet
             elif cmd[0] == 'retweet' and item_type == 'tweet' and len(cmd) == 2:
                 print_options = False
-                tid = Search.listnum_to_tid(lst, cmd[1])
+                tid = Search.listnum_to_tid(pager, cmd[1])
                 if tid is None:
                     print("INVALID INDEX")
                     continue
                 from ComposeTweet import ComposeTweet
                 ComposeTweet.createRetweet(tid)
+            # show the numbered tweet in its reply thread
+            elif cmd[0] == 'thread' and item_type == 'tweet' and len(cmd) == 2:
+                tid = Search.listnum_to_tid(pager, cmd[1])
+                if tid is None:
+                    print_options = False
+                    print("INVALID INDEX")
+                    continue
+                from Thread import Thread
+                Thread.show_thread(tid)
+                return
             # view info of a tweet
             elif cmd[0] == 'viewinfo' and item_type == 'tweet' and len(cmd) == 2:
                 print_options = False
-                tid = Search.listnum_to_tid(lst, cmd[1])
+                tid = Search.listnum_to_tid(pager, cmd[1])
                 if tid is None:
                     print("INVALID INDEX")
                     continue
-                Connection.cursor.execute(
-                    "SELECT COUNT(*) FROM retweets WHERE tid = ?", (tid,))
-                retweets_count = Connection.cursor.fetchone()[0]
-                Connection.cursor.execute(
-                    "SELECT COUNT(*) FROM tweets WHERE replyto = ?", (tid,))
-                replies_count = Connection.cursor.fetchone()[0]
+                Connection.cursor.execute(Search.TWEET_STATS_QUERY, (tid,))
+                result = Connection.cursor.fetchone()
+                retweets_count, replies_count = result if result is not None else (0, 0)
 
                 print(
                     f"Tweet [{cmd[1]}] has {retweets_count} retweets and {replies_count} replies")
@@ -270,15 +414,35 @@ class Search:
             usr (int): the user id of selected user
             name (str): the name of the selected user
         """
-        tweets = Search.get_number_of_tweets(usr)
-        followers = Search.get_number_of_followers(usr)
-        followees = Search.get_number_of_following(usr)
+        tweets, followers, followees = Search.get_user_stats(usr)
 
         # prints selected followers details
         print(f"\nYou are looking at {name}'s profile.")
         print(f"Tweet Count: {tweets}\t Followers: {followers} \t Following: {followees}")
 
 
+    @staticmethod
+    def get_user_stats(usr: int) -> (int, int, int):
+        """Gets the # of tweets, # of followers and # of following of a given user
+
+        Args:
+            usr (int): user id of the chosen user
+
+        Returns:
+            tuple[int, int, int]: # of tweets, # of followers, # of users being followed
+        """
+        counts = UserCache.get('counts', usr)
+        if counts is not None:
+            return counts
+
+        assert Connection.is_connected()
+        Connection.cursor.execute(Search.USER_STATS_QUERY, (usr,))
+        result = Connection.cursor.fetchone()
+        counts = tuple(result) if result is not None else (0, 0, 0)
+        UserCache.put('counts', usr, counts)
+        return counts
+
+
     @staticmethod
     def get_number_of_tweets(usr: int) -> int:
         """Gets the # of tweets that a given user has posted
@@ -289,15 +453,7 @@ class Search:
         Returns:
             int: # of tweets
         """
-        assert Connection.is_connected()
-        # number of tweets
-        query = "SELECT COUNT(*) FROM tweets WHERE writer = ?"
-        Connection.cursor.execute(query, (usr,))
-        tweetResult = Connection.cursor.fetchone()
-
-        if tweetResult == None:
-            tweetResult[0] = 0
-        return tweetResult[0]
+        return Search.get_user_stats(usr)[0]
 
 
     @staticmethod
@@ -310,14 +466,7 @@ class Search:
         Returns:
             int: # of followers following
         """
-        assert Connection.is_connected()
-        query = "SELECT COUNT(*) FROM follows WHERE flwee = ?"
-        Connection.cursor.execute(query, (usr,))
-        result = Connection.cursor.fetchone()
-        if result == None:
-            return 0
-        else:
-            return result[0]
+        return Search.get_user_stats(usr)[1]
 
 
     @staticmethod
@@ -330,95 +479,108 @@ class Search:
         Returns:
             int: # of users being followed
         """
-        assert Connection.is_connected()
-        query = "SELECT COUNT(*) FROM follows WHERE flwer = ?"
-        Connection.cursor.execute(query, (usr,))
-        result = Connection.cursor.fetchone()
-        if result == None:
-            return 0
-        else:
-            return result[0]
+        return Search.get_user_stats(usr)[2]
 
 
     @staticmethod
-    def listnum_to_tid(lst: [dict], option_id: str) -> int:
+    def listnum_to_tid(pager: Pager, option_id: str) -> int:
         """Converts an index in a list of tweets to the tid of the selected tweet
 
         Args:
-            lst (list[dict]): list of tweet objects
-            option_id (str): index in the list, as a string
+            pager (Pager): the paged tweet objects
+            option_id (str): index in the list (on the current page), as a string
 
         Returns:
             int: tid of the tweet at index option_id, or None if invalid index
         """
         try:
-            index = int(option_id)
-            if index > len(lst)+1 or index < 1:
+            item = pager.item(int(option_id))
+            if item is None:
                 return None
-            return int(lst[index-1]['tid'])
+            return int(item['tid'])
         except:
             return None
 
 
     @staticmethod
-    def print_items(lst: [dict], num_display: int, offset: int, item_type: str) -> None:
-        """Prints a list of tweets or users
+    def hydrate_tweets(rows: [dict]) -> None:
+        """Attaches the parent tweet of every reply ('parent': dict with name, writer, text)
+            and the name of every retweeter ('retweeter_name') to a page of tweets,
+            using a single query for the whole page (retweeter names come from
+            UserCache when possible)
 
         Args:
-            lst (list[dict]): the list of tweet/user objects
-            num_display (int): # of tweets to display per page
-            offset (int): # of tweets to skip
+            rows (list[dict]): the tweet objects of a page, updated in place
+        """
+        assert Connection.is_connected()
+        parent_ids = sorted(set(row['replyto'] for row in rows if row['replyto'] is not None))
+        parents = {}
+        names = {}
+        retweeter_ids = []
+        for usr in set(row['retweeter'] for row in rows if row['retweeter'] is not None):
+            names[usr] = UserCache.get('name', usr)
+            if names[usr] is None:
+                retweeter_ids.append(usr)
+
+        if len(parent_ids) > 0 or len(retweeter_ids) > 0:
+            Connection.cursor.execute(Search.HYDRATE_QUERY,
+                                      (json.dumps(parent_ids), json.dumps(sorted(retweeter_ids))))
+            for kind, key, name, writer, text in Connection.cursor.fetchall():
+                if kind == 'parent':
+                    parents[key] = {'name': name, 'writer': writer, 'text': text}
+                else:
+                    names[key] = name
+                UserCache.put('name', writer, name)
+
+        for row in rows:
+            row['parent'] = parents.get(row['replyto'])
+            row['retweeter_name'] = names.get(row['retweeter'])
+
+
+    @staticmethod
+    def print_items(pager: Pager, item_type: str) -> None:
+        """Prints the current page of tweets or users
+
+        Args:
+            pager (Pager): the paged tweet/user objects
             item_type (str): the type of item being displayed (tweet or user)
         """
         assert Connection.is_connected()
-        if len(lst) == 0:
+        offset = pager.offset
+        if len(pager.rows) == 0:
             print("No results found!")
             print()
             return
 
         print("="*80)
         if item_type == 'tweet':
-            for idx, item in enumerate(lst[offset:offset + num_display]):
+            for idx, item in enumerate(pager.rows):
                 # list index
                 print(f"{idx+offset+1}]")
 
-                if item['replyto'] is not None:
-                    # need to get the usr who wrote the parent
-                    parentQuery = """
-                            SELECT name, writer, text
-                            FROM users u, tweets t
-                            WHERE u.usr = t.writer
-                                AND t.tid = ?"""
-                    Connection.cursor.execute(parentQuery, (item['replyto'],))
-                    parentResult = Connection.cursor.fetchone()
-                    if parentResult[0] is not None:
-                        print(f"\t[Replying to {parentResult[0]} (+{parentResult[1]})]")
-                        print(f"\t >> {parentResult[2]}")
-                        print()
-
-                # tweet body
-                print(f"\t{item['name']} (+{item['writer']})")
-                print(f"\t{item['text']}")
+                parent = item.get('parent')
+                if parent is not None:
+                    print(f"\t[Replying to {parent['name']} (+{parent['writer']})]")
+                    print(f"\t >> {parent['text']}")
+                    print()
+
+                # tweet body (replies in a thread are indented by their depth)
+                indent = "\t" + "  " * (item.get('depth', 1) - 1)
+                print(f"{indent}{item['name']} (+{item['writer']})")
+                print(f"{indent}{item['text']}")
                 print()
 
                 if item['retweeter'] is not None:
-                    # need to get the name of the retweeter
-                    rtQuery = """
-                            SELECT name, usr
-                            FROM users
-                            WHERE usr = ?"""
-                    Connection.cursor.execute(rtQuery, (item['retweeter'],))
-                    rtResult = Connection.cursor.fetchone()
-                    if rtResult[0] is not None:
-                        print(f"\tRetweeted by {rtResult[0]} (+{rtResult[1]}) on", end=" ")
+                    if item.get('retweeter_name') is not None:
+                        print(f"\tRetweeted by {item['retweeter_name']} (+{item['retweeter']}) on", end=" ")
                 else:
-                    print("", end="\t")
+                    print("", end=indent)
                 print(f"{item['tdate']}")
                 print()
                 print("="*80)
 
         elif item_type == 'user':
-            for idx, item in enumerate(lst[offset:offset + num_display]):
+            for idx, item in enumerate(pager.rows):
                 # list index
                 print(f"{idx+offset+1}]")
 
@@ -428,8 +590,11 @@ class Search:
                 print()
                 print("="*80)
 
-        print(
-            f"Showing page {math.ceil(offset / num_display) + 1} of {max(math.ceil(len(lst)/num_display),1)}")
+        # the total is only known once the last page has been reached
+        if pager.has_next:
+            print(f"Showing page {pager.page_number} (scrolldown for more)")
+        else:
+            print(f"Showing page {pager.page_number} of {pager.page_number}")
         print()
 
 
@@ -0,0 +1,56 @@
+from Connection import Connection
+
+
+class Sequence:
+    """Allocates tweet ids and user ids from the sequences table.
+
+    Reserving ids is a single UPDATE ... RETURNING, so it takes the db write lock and
+    runs in the caller's transaction: two processes can never get the same id, and if
+    the transaction rolls back the ids go back with it. Triggers from
+    Setup.define_sequences keep each sequence ahead of ids inserted directly.
+    """
+    RESERVE_QUERY = "UPDATE sequences SET next = next + ? WHERE name = ? RETURNING next - ?"
+    ADVANCE_QUERY = "UPDATE sequences SET next = MAX(next, ? + 1) WHERE name = ?"
+
+    @staticmethod
+    def reserve(name: str, count: int) -> range:
+        """Reserves a block of consecutive ids, eg. for a batch load. Does not commit.
+
+        Args:
+            name (str): the sequence ('tweets' or 'users')
+            count (int): # of ids to reserve
+
+        Returns:
+            range: the reserved ids
+        """
+        assert Connection.is_connected()
+        assert count > 0
+        Connection.cursor.execute(Sequence.RESERVE_QUERY, (count, name, count))
+        first = Connection.cursor.fetchone()[0]
+        return range(first, first + count)
+
+
+    @staticmethod
+    def advance(name: str, past: int) -> None:
+        """Moves a sequence past an id about to be inserted directly (eg. when the
+            triggers are dropped, or before the insert). Does not commit.
+
+        Args:
+            name (str): the sequence ('tweets' or 'users')
+            past (int): the id that must never be handed out
+        """
+        assert Connection.is_connected()
+        Connection.cursor.execute(Sequence.ADVANCE_QUERY, (past, name))
+
+
+    @staticmethod
+    def next_id(name: str) -> int:
+        """Reserves the next id of a sequence. Does not commit.
+
+        Args:
+            name (str): the sequence ('tweets' or 'users')
+
+        Returns:
+            int: the new id
+        """
+        return Sequence.reserve(name, 1)[0]
@@ -0,0 +1,251 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import secrets
+import sqlite3
+import http
+import urllib.parse
+import concurrent.futures
+
+from ConnectionPool import ConnectionPool
+from Login import Login
+from Batch import Batch
+
+
+class Server:
+    """Serves the Batch commands as a JSON API over HTTP on localhost.
+
+    The event loop only parses requests and keeps the sessions; every command runs on a
+    worker thread, on a connection checked out of the ConnectionPool (the writer for
+    commands that write), with Login.userID set from the request's session for the
+    duration of the command (Connection and Login are per-thread).
+    Sessions are opened by POST /login and sent back as "Authorization: Bearer <token>".
+    """
+    SESSION_TTL = 3600.0  # seconds a session stays valid after its last use
+    MAX_BODY = 1 << 20    # bytes
+
+    # (method, path) -> Batch command; GET parameters come from the query string,
+    # POST parameters from a JSON object body
+    ROUTES = {
+        ("POST", "/login"): "login",
+        ("POST", "/logout"): "logout",
+        ("GET", "/feed"): "feed",
+        ("GET", "/search/tweets"): "searchtweets",
+        ("GET", "/search/users"): "searchusers",
+        ("GET", "/profile"): "profile",
+        ("GET", "/trending"): "trending",
+        ("GET", "/recommend"): "recommend",
+        ("GET", "/lists"): "lists",
+        ("GET", "/lists/feed"): "listfeed",
+        ("GET", "/thread"): "thread",
+        ("POST", "/compose"): "compose",
+        ("POST", "/retweet"): "retweet",
+        ("POST", "/follow"): "follow",
+        ("POST", "/unfollow"): "unfollow",
+        ("POST", "/follow/many"): "followmany",
+        ("POST", "/follow/list"): "followlist",
+        ("POST", "/lists"): "createlist",
+        ("POST", "/lists/add"): "listadd",
+        ("POST", "/lists/remove"): "listremove",
+    }
+
+    WRITE_COMMANDS = {"compose", "retweet", "follow", "unfollow", "followmany", "followlist",
+                      "createlist", "listadd", "listremove"}
+
+    sessions = {}  # token -> [usr, name, expiry time]; only used on the event loop
+    executor = None
+
+    @staticmethod
+    def run_command(session: list, command: dict) -> dict:
+        """Runs a command on a worker thread as the session's user, committing right away
+
+        Args:
+            session (list): [usr, name, expiry] of the session, or None
+            command (dict): the parsed command
+
+        Returns:
+            dict: the result of the command
+        """
+        Login.userID, Login.name = (session[0], session[1]) if session is not None else (None, None)
+        checkout = ConnectionPool.writer if command["cmd"] in Server.WRITE_COMMANDS else ConnectionPool.reader
+        try:
+            with checkout():
+                return Batch.execute(command)
+        finally:
+            Login.userID = None
+            Login.name = None
+
+
+    @staticmethod
+    def find_session(headers: dict) -> (str, list):
+        """Looks up the session of a request, dropping it if expired
+
+        Args:
+            headers (dict): the request headers (lowercase names)
+
+        Returns:
+            tuple: the token and its session ([usr, name, expiry]), or (None, None)
+        """
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        session = Server.sessions.get(token) if scheme.lower() == "bearer" else None
+        if session is None:
+            return None, None
+        if session[2] < time.monotonic():
+            del Server.sessions[token]
+            return None, None
+        session[2] = time.monotonic() + Server.SESSION_TTL
+        return token, session
+
+
+    @staticmethod
+    async def dispatch(method: str, target: str, headers: dict, body: bytes) -> (int, dict):
+        """Handles one request
+
+        Args:
+            method (str): the HTTP method
+            target (str): the path and query string
+            headers (dict): the request headers (lowercase names)
+            body (bytes): the request body
+
+        Returns:
+            tuple: the HTTP status and the JSON response
+        """
+        url = urllib.parse.urlsplit(target)
+        name = Server.ROUTES.get((method, url.path))
+        if name is None:
+            if any(path == url.path for _, path in Server.ROUTES):
+                return http.HTTPStatus.METHOD_NOT_ALLOWED, {"error": "method not allowed"}
+            return http.HTTPStatus.NOT_FOUND, {"error": "not found"}
+
+        try:
+            if method == "GET":
+                command = dict(urllib.parse.parse_qsl(url.query))
+            else:
+                command = json.loads(body) if len(body) > 0 else {}
+                if not isinstance(command, dict):
+                    raise ValueError("expected a JSON object")
+        except ValueError as error:
+            return http.HTTPStatus.BAD_REQUEST, {"error": f"bad request: {error}"}
+        command["cmd"] = name
+
+        token, session = Server.find_session(headers)
+        if name == "logout":
+            Server.sessions.pop(token, None)
+            return http.HTTPStatus.OK, {}
+        if name == "login":
+            session = None
+
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(Server.executor, Server.run_command, session, command)
+        except PermissionError as error:
+            return http.HTTPStatus.UNAUTHORIZED, {"error": str(error)}
+        except TimeoutError as error:
+            return http.HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(error)}
+        except (ValueError, TypeError, KeyError) as error:
+            return http.HTTPStatus.BAD_REQUEST, {"error": str(error) or type(error).__name__}
+        except sqlite3.Error as error:
+            return http.HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"database error: {error}"}
+
+        if name == "login":
+            token = secrets.token_urlsafe(24)
+            Server.sessions[token] = [result["usr"], result["name"], time.monotonic() + Server.SESSION_TTL]
+            result["token"] = token
+        return http.HTTPStatus.OK, result
+
+
+    @staticmethod
+    async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serves the requests of one (keep-alive) client connection
+
+        Args:
+            reader (asyncio.StreamReader): the client's request stream
+            writer (asyncio.StreamWriter): the client's response stream
+        """
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if requestLine == b"":
+                    break
+                method, target, version = requestLine.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if length > Server.MAX_BODY:
+                    status, response = http.HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "body too large"}
+                    headers["connection"] = "close"
+                else:
+                    body = await reader.readexactly(length)
+                    status, response = await Server.dispatch(method.upper(), target, headers, body)
+
+                keepAlive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                payload = json.dumps(response, default=str).encode()
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keepAlive else 'close'}\r\n\r\n".encode() + payload)
+                await writer.drain()
+                if not keepAlive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass  # malformed request or client went away
+        finally:
+            writer.close()
+
+
+    @staticmethod
+    async def serve(path: str, port: int, workers: int = 8, profile: str = None,
+                    pool_size: int = None, host: str = "127.0.0.1") -> None:
+        """Runs the server until cancelled
+
+        Args:
+            path (str): filepath to the db
+            port (int): the port to listen on
+            workers (int, optional): # of worker threads. Defaults to 8.
+            profile (str, optional): connection profile. Defaults to Connection.DEFAULT_PROFILE.
+            pool_size (int, optional): # of read-only connections. Defaults to workers.
+            host (str, optional): the address to listen on. Defaults to localhost only.
+        """
+        ConnectionPool.open(path, profile, pool_size or workers)
+        Server.executor = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="db")
+        server = await asyncio.start_server(Server.handle_client, host, port)
+        print(f"Serving on http://{host}:{port} with {workers} workers", file=sys.stderr)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            Server.executor.shutdown(wait=True)
+            ConnectionPool.print_stats(sys.stderr)
+            ConnectionPool.close()
+
+
+    @staticmethod
+    def run(path: str, port: int, workers: int = 8, profile: str = None, pool_size: int = None) -> None:
+        """Runs the server in the foreground until interrupted (Ctrl-C).
+            The shell's own messages are discarded while serving.
+
+        Args:
+            path (str): filepath to the db
+            port (int): the port to listen on
+            workers (int, optional): # of worker threads. Defaults to 8.
+            profile (str, optional): connection profile. Defaults to Connection.DEFAULT_PROFILE.
+            pool_size (int, optional): # of read-only connections. Defaults to workers.
+        """
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        try:
+            asyncio.run(Server.serve(path, port, workers, profile, pool_size))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
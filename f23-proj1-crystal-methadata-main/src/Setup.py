@@ -8,9 +8,17 @@ class Setup:
         assert Connection.is_connected()
 
         dropQuery = """
+        DROP TABLE IF EXISTS timeline;
+        DROP TABLE IF EXISTS timeline_pull;
+        DROP TABLE IF EXISTS tweets_fts;
+        DROP TABLE IF EXISTS users_fts;
+        DROP TABLE IF EXISTS tweet_stats;
+        DROP TABLE IF EXISTS user_stats;
+        DROP TABLE IF EXISTS sequences;
         DROP TABLE IF EXISTS includes;
         DROP TABLE IF EXISTS lists;
         DROP TABLE IF EXISTS retweets;
+        DROP TABLE IF EXISTS hashtag_counts;
         DROP TABLE IF EXISTS mentions;
         DROP TABLE IF EXISTS hashtags;
         DROP TABLE IF EXISTS tweets;
@@ -84,6 +92,305 @@ class Setup:
             FOREIGN KEY (lname) REFERENCES lists,
             FOREIGN KEY (member) REFERENCES users
         );
+
+        -- secondary indexes for the feed/search/profile hot paths
+        -- (ties on the date are ordered by tid, so newest-first reads can stop at a LIMIT;
+        -- older dbs have the indexes without it)
+        DROP INDEX IF EXISTS tweets_writer_tdate;
+        DROP INDEX IF EXISTS retweets_usr_rdate;
+        DROP INDEX IF EXISTS tweets_replyto;
+        CREATE INDEX IF NOT EXISTS tweets_writer_tdate_tid ON tweets (writer, tdate DESC, tid DESC);
+        CREATE INDEX IF NOT EXISTS tweets_replyto_tid ON tweets (replyto, tid);
+        CREATE INDEX IF NOT EXISTS retweets_tid ON retweets (tid);
+        CREATE INDEX IF NOT EXISTS retweets_usr_rdate_tid ON retweets (usr, rdate DESC, tid DESC);
+        CREATE INDEX IF NOT EXISTS follows_flwee ON follows (flwee, start_date, flwer);
+        CREATE INDEX IF NOT EXISTS mentions_term ON mentions (term, tid);
+        CREATE INDEX IF NOT EXISTS lists_owner ON lists (owner, lname);
+        CREATE INDEX IF NOT EXISTS includes_member ON includes (member, lname);
         """
         Connection.cursor.executescript(defineQuery)
+        Setup.define_search_index()
+        Setup.define_counters()
+        Setup.define_trending()
+        Setup.define_sequences()
+        Connection.connection.commit()
+
+
+    @staticmethod
+    def define_search_index() -> None:
+        """Creates the tweets_fts full-text index over tweets.text, the users_fts trigram
+            index over users.name/city, and the triggers keeping them in sync.
+            Backfills each from its table if it was just created.
+        """
+        assert Connection.is_connected()
+
+        exists = Connection.contains(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'tweets_fts';", ())
+        usersExists = Connection.contains(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'users_fts';", ())
+
+        # contentless: rowid is the tid, text is only kept in tweets
+        searchQuery = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS tweets_fts USING fts5 (text, content='');
+        CREATE TRIGGER IF NOT EXISTS tweets_fts_insert AFTER INSERT ON tweets BEGIN
+            INSERT INTO tweets_fts (rowid, text) VALUES (new.tid, new.text);
+        END;
+        CREATE TRIGGER IF NOT EXISTS tweets_fts_delete AFTER DELETE ON tweets BEGIN
+            INSERT INTO tweets_fts (tweets_fts, rowid, text) VALUES ('delete', old.tid, old.text);
+        END;
+        CREATE TRIGGER IF NOT EXISTS tweets_fts_update AFTER UPDATE OF tid, text ON tweets BEGIN
+            INSERT INTO tweets_fts (tweets_fts, rowid, text) VALUES ('delete', old.tid, old.text);
+            INSERT INTO tweets_fts (rowid, text) VALUES (new.tid, new.text);
+        END;
+
+        -- every 3-character substring of name/city, for substring user search; rowid is the usr
+        CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5 (name, city, content='', tokenize='trigram');
+        CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts (rowid, name, city) VALUES (new.usr, new.name, new.city);
+        END;
+        CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, name, city) VALUES ('delete', old.usr, old.name, old.city);
+        END;
+        CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF usr, name, city ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, name, city) VALUES ('delete', old.usr, old.name, old.city);
+            INSERT INTO users_fts (rowid, name, city) VALUES (new.usr, new.name, new.city);
+        END;
+        """
+        Connection.cursor.executescript(searchQuery)
+
+        if not exists:
+            Connection.cursor.execute(
+                "INSERT INTO tweets_fts (rowid, text) SELECT tid, text FROM tweets WHERE text IS NOT NULL;")
+        if not usersExists:
+            Connection.cursor.execute(
+                "INSERT INTO users_fts (rowid, name, city) SELECT usr, name, city FROM users;")
+
+
+    @staticmethod
+    def define_counters() -> None:
+        """Creates the tweet_stats/user_stats counter tables and the triggers keeping them
+            up to date as tweets, retweets and follows are inserted/deleted.
+            Fills them from the live tables if they were just created.
+        """
+        assert Connection.is_connected()
+
+        exists = Connection.contains(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'user_stats';", ())
+
+        countersQuery = """
+        CREATE TABLE IF NOT EXISTS tweet_stats (
+            tid         INT,
+            retweets    INT DEFAULT 0,
+            replies     INT DEFAULT 0,
+            PRIMARY KEY (tid)
+        );
+        CREATE TABLE IF NOT EXISTS user_stats (
+            usr         INT,
+            tweets      INT DEFAULT 0,
+            followers   INT DEFAULT 0,
+            following   INT DEFAULT 0,
+            PRIMARY KEY (usr)
+        );
+
+        CREATE TRIGGER IF NOT EXISTS tweets_count_insert AFTER INSERT ON tweets BEGIN
+            INSERT INTO user_stats (usr, tweets) VALUES (new.writer, 1)
+                ON CONFLICT (usr) DO UPDATE SET tweets = tweets + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS tweets_count_delete AFTER DELETE ON tweets BEGIN
+            UPDATE user_stats SET tweets = tweets - 1 WHERE usr = old.writer;
+        END;
+        CREATE TRIGGER IF NOT EXISTS replies_count_insert AFTER INSERT ON tweets
+        WHEN new.replyto IS NOT NULL BEGIN
+            INSERT INTO tweet_stats (tid, replies) VALUES (new.replyto, 1)
+                ON CONFLICT (tid) DO UPDATE SET replies = replies + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS replies_count_delete AFTER DELETE ON tweets
+        WHEN old.replyto IS NOT NULL BEGIN
+            UPDATE tweet_stats SET replies = replies - 1 WHERE tid = old.replyto;
+        END;
+        CREATE TRIGGER IF NOT EXISTS retweets_count_insert AFTER INSERT ON retweets BEGIN
+            INSERT INTO tweet_stats (tid, retweets) VALUES (new.tid, 1)
+                ON CONFLICT (tid) DO UPDATE SET retweets = retweets + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS retweets_count_delete AFTER DELETE ON retweets BEGIN
+            UPDATE tweet_stats SET retweets = retweets - 1 WHERE tid = old.tid;
+        END;
+        CREATE TRIGGER IF NOT EXISTS follows_count_insert AFTER INSERT ON follows BEGIN
+            INSERT INTO user_stats (usr, following) VALUES (new.flwer, 1)
+                ON CONFLICT (usr) DO UPDATE SET following = following + 1;
+            INSERT INTO user_stats (usr, followers) VALUES (new.flwee, 1)
+                ON CONFLICT (usr) DO UPDATE SET followers = followers + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS follows_count_delete AFTER DELETE ON follows BEGIN
+            UPDATE user_stats SET following = following - 1 WHERE usr = old.flwer;
+            UPDATE user_stats SET followers = followers - 1 WHERE usr = old.flwee;
+        END;
+        """
+        Connection.cursor.executescript(countersQuery)
+
+        if not exists:
+            Setup.repair_counters()
+
+
+    @staticmethod
+    def define_trending() -> None:
+        """Creates the hashtag_counts table used by Trending and the trigger keeping it up
+            to date as mentions are inserted: every mention counts towards the day of its
+            tweet, and, if the tweet is from today, towards the current hour. Hour counts
+            older than two days are pruned as new ones come in.
+            Fills in the day counts from the live tables if it was just created.
+        """
+        assert Connection.is_connected()
+
+        exists = Connection.contains(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'hashtag_counts';", ())
+
+        # buckets are local hours/days since 1970-01-01 (2440587.5 is its julian day)
+        trendingQuery = """
+        CREATE TABLE IF NOT EXISTS hashtag_counts (
+            period      TEXT,
+            bucket      INT,
+            term        TEXT,
+            count       INT,
+            PRIMARY KEY (period, bucket, term)
+        ) WITHOUT ROWID;
+
+        CREATE TRIGGER IF NOT EXISTS mentions_trending_insert AFTER INSERT ON mentions BEGIN
+            INSERT INTO hashtag_counts (period, bucket, term, count)
+            SELECT 'day', CAST(julianday(date(tdate)) - 2440587.5 AS INT), new.term, 1
+            FROM tweets WHERE tid = new.tid AND tdate IS NOT NULL
+                ON CONFLICT (period, bucket, term) DO UPDATE SET count = count + 1;
+            INSERT INTO hashtag_counts (period, bucket, term, count)
+            SELECT 'hour', CAST((julianday('now', 'localtime') - 2440587.5) * 24 AS INT), new.term, 1
+            FROM tweets WHERE tid = new.tid AND date(tdate) = date('now', 'localtime')
+                ON CONFLICT (period, bucket, term) DO UPDATE SET count = count + 1;
+            DELETE FROM hashtag_counts WHERE period = 'hour'
+                AND bucket < CAST((julianday('now', 'localtime') - 2440587.5) * 24 AS INT) - 48;
+        END;
+        """
+        Connection.cursor.executescript(trendingQuery)
+
+        if not exists:
+            Setup.repair_trending()
+
+
+    @staticmethod
+    def define_sequences() -> None:
+        """Creates the sequences table used by Sequence to allocate tweet/user ids,
+            seeding it from the existing ids, and the triggers keeping each sequence
+            ahead of ids inserted directly (eg. by Test.insert_test_data)
+        """
+        assert Connection.is_connected()
+
+        sequencesQuery = """
+        CREATE TABLE IF NOT EXISTS sequences (
+            name        TEXT,
+            next        INT,
+            PRIMARY KEY (name)
+        );
+        INSERT OR IGNORE INTO sequences (name, next) SELECT 'tweets', IFNULL(MAX(tid), 0) + 1 FROM tweets;
+        INSERT OR IGNORE INTO sequences (name, next) SELECT 'users', IFNULL(MAX(usr), 0) + 1 FROM users;
+        CREATE TRIGGER IF NOT EXISTS sequences_tweets AFTER INSERT ON tweets BEGIN
+            UPDATE sequences SET next = new.tid + 1 WHERE name = 'tweets' AND next <= new.tid;
+        END;
+        CREATE TRIGGER IF NOT EXISTS sequences_users AFTER INSERT ON users BEGIN
+            UPDATE sequences SET next = new.usr + 1 WHERE name = 'users' AND next <= new.usr;
+        END;
+        """
+        Connection.cursor.executescript(sequencesQuery)
+
+
+    @staticmethod
+    def repair_counters() -> None:
+        """Recomputes every counter in tweet_stats/user_stats from the live tables,
+            in one batch pass (one transaction)
+        """
+        assert Connection.is_connected()
+
+        repairQuery = """
+        BEGIN;
+        DELETE FROM tweet_stats;
+        DELETE FROM user_stats;
+        INSERT INTO tweet_stats (tid, retweets, replies)
+        SELECT tid, SUM(retweets), SUM(replies)
+        FROM (
+            SELECT tid, COUNT(*) AS retweets, 0 AS replies FROM retweets GROUP BY tid
+            UNION ALL
+            SELECT replyto, 0, COUNT(*) FROM tweets WHERE replyto IS NOT NULL GROUP BY replyto
+        )
+        GROUP BY tid;
+        INSERT INTO user_stats (usr, tweets, followers, following)
+        SELECT usr, SUM(tweets), SUM(followers), SUM(following)
+        FROM (
+            SELECT writer AS usr, COUNT(*) AS tweets, 0 AS followers, 0 AS following
+            FROM tweets GROUP BY writer
+            UNION ALL
+            SELECT flwee, 0, COUNT(*), 0 FROM follows GROUP BY flwee
+            UNION ALL
+            SELECT flwer, 0, 0, COUNT(*) FROM follows GROUP BY flwer
+        )
+        GROUP BY usr;
+        COMMIT;
+        """
+        Connection.cursor.executescript(repairQuery)
+
+
+    @staticmethod
+    def repair_trending() -> None:
+        """Recomputes the day counts in hashtag_counts from mentions and tweets, in one
+            batch pass. Hour counts are kept, as the tables do not record the time of day.
+        """
+        assert Connection.is_connected()
+
+        repairQuery = """
+        BEGIN;
+        DELETE FROM hashtag_counts WHERE period = 'day';
+        INSERT INTO hashtag_counts (period, bucket, term, count)
+        SELECT 'day', CAST(julianday(date(t.tdate)) - 2440587.5 AS INT) AS day, m.term, COUNT(*)
+        FROM mentions m, tweets t
+        WHERE t.tid = m.tid AND t.tdate IS NOT NULL
+        GROUP BY day, m.term;
+        COMMIT;
+        """
+        Connection.cursor.executescript(repairQuery)
+
+
+    @staticmethod
+    def begin_bulk_load() -> None:
+        """Drops every trigger and secondary index so that large loads only write the
+            base tables. end_bulk_load() must be called afterwards.
+        """
+        assert Connection.is_connected()
+        Connection.connection.commit()
+        Connection.cursor.execute(
+            "SELECT type, name FROM sqlite_master WHERE type IN ('trigger', 'index') AND sql IS NOT NULL;")
+        for kind, name in Connection.cursor.fetchall():
+            Connection.cursor.execute(f"DROP {kind.upper()} IF EXISTS {name};")
         Connection.connection.commit()
+
+
+    @staticmethod
+    def end_bulk_load() -> None:
+        """Recreates the triggers and indexes dropped by begin_bulk_load(), then rebuilds
+            everything they would have maintained: the search index, the counters, the
+            trending hashtag counts, the sequences and (if enabled) the timeline
+        """
+        from Timeline import Timeline
+        assert Connection.is_connected()
+
+        Setup.define_tables()
+        rebuildQuery = """
+        BEGIN;
+        INSERT INTO tweets_fts (tweets_fts) VALUES ('delete-all');
+        INSERT INTO tweets_fts (rowid, text) SELECT tid, text FROM tweets WHERE text IS NOT NULL;
+        INSERT INTO users_fts (users_fts) VALUES ('delete-all');
+        INSERT INTO users_fts (rowid, name, city) SELECT usr, name, city FROM users;
+        UPDATE sequences SET next = MAX(next, (SELECT IFNULL(MAX(tid), 0) + 1 FROM tweets)) WHERE name = 'tweets';
+        UPDATE sequences SET next = MAX(next, (SELECT IFNULL(MAX(usr), 0) + 1 FROM users)) WHERE name = 'users';
+        COMMIT;
+        """
+        Connection.cursor.executescript(rebuildQuery)
+        Setup.repair_counters()
+        Setup.repair_trending()
+        if Timeline.is_enabled():
+            Timeline.rebuild()
@@ -1,9 +1,15 @@
 import os
+import sys
 from Connection import Connection
 from Login import Login
 from Feed import Feed
 from Search import Search
 from ComposeTweet import ComposeTweet
+from Trending import Trending
+from FollowGraph import FollowGraph
+from Lists import Lists
+from UserCache import UserCache
+from QueryLog import QueryLog
 
 
 class Shell:
@@ -33,7 +39,11 @@ class Shell:
             options.append("compose")
             options.append("searchusers")
             options.append("followers")
+            options.append("trending")
+            options.append("whotofollow")
+            options.append("lists")
             options.append("logout")
+        options.append("querystats")
         options.append("help")
         options.append("clear")
         options.append("exit")
@@ -52,6 +62,7 @@ class Shell:
         """
         options = Shell.get_main_options()
         if cmd in options:
+            QueryLog.tag(cmd)
             if cmd == "login":
                 if Login.login():
                     Feed.show_feed()
@@ -67,12 +78,24 @@ class Shell:
                 Search.search_for_users()
             elif cmd == "followers":
                 Search.search_for_followers()
+            elif cmd == "trending":
+                Trending.show_trending()
+            elif cmd == "whotofollow":
+                FollowGraph.show_recommendations()
+            elif cmd == "lists":
+                Lists.manage_lists()
             elif cmd == "logout":
                 Login.logout()
+            elif cmd == "querystats":
+                QueryLog.print_summary()
             elif cmd == "help":
                 Shell.print_menu(additional_options)
             elif cmd == "exit":
                 print("Closing Program :(")
+                if "--cache-stats" in sys.argv:
+                    UserCache.print_stats()
+                if QueryLog.enabled:
+                    QueryLog.print_summary()
                 Connection.close()
                 os._exit(0)
             elif cmd == "clear":
@@ -1,4 +1,12 @@
 import os
+import sys
+import time
+import random
+import datetime
+import itertools
+import tempfile
+import contextlib
+import multiprocessing
 from Connection import Connection
 from Setup import Setup
 
@@ -91,7 +99,351 @@ class Test:
         Connection.connection.commit()
 
 
+    # vocabulary for generated data
+    WORDS = ("the a to and of in is it for on with this that my at be so just "
+             "love today new day time good great people game music news work life "
+             "happy best night world first week city team show vote coffee rain "
+             "weekend morning learning data code python update launch lol wow yes "
+             "really think know want need going back still never always").split()
+    CITIES = ["Edmonton", "Calgary", "Toronto", "Vancouver", "Montreal", "Ottawa",
+              "Winnipeg", "Halifax", "Regina", "Victoria", "Seattle", "Chicago",
+              "New York", "London", "Paris", "Berlin", "Tokyo", "Sydney", "Lagos", "Mumbai"]
+    SYLLABLES = ["ka", "ri", "to", "mo", "sa", "li", "na", "ve", "jo", "an", "el", "ur", "dan", "mi"]
+
+    @staticmethod
+    def zipf_weights(n: int, exponent: float = 1.0) -> [float]:
+        """Builds cumulative weights for drawing ranks 0..n-1 with a power-law (Zipf) bias
+
+        Args:
+            n (int): # of ranks
+            exponent (float, optional): skew; higher is more skewed. Defaults to 1.0.
+
+        Returns:
+            list[float]: cumulative weights, for random.choices(cum_weights=...)
+        """
+        return list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(n)))
+
+
+    @staticmethod
+    def generate_data(num_users: int, num_tweets: int, seed: int = 0,
+                      follows_per_user: int = 20, reply_ratio: float = 0.15,
+                      retweet_ratio: float = 0.2, list_ratio: float = 0.01,
+                      num_hashtags: int = None, chunk_size: int = 200000) -> None:
+        """Bulk-loads a reproducible synthetic dataset into all eight tables: users with a
+            power-law follow graph, Zipf-distributed authors and hashtags, reply chains,
+            retweets of popular tweets, and lists with members. Ids are reserved from the
+            sequences, so it can be run on a non-empty db. Rows are written with
+            executemany, committing every chunk_size rows, with triggers and secondary
+            indexes dropped until the end (see Setup.begin_bulk_load).
+
+        Args:
+            num_users (int): # of users to create
+            num_tweets (int): # of tweets to create
+            seed (int, optional): random seed. Defaults to 0.
+            follows_per_user (int, optional): average out-degree. Defaults to 20.
+            reply_ratio (float, optional): fraction of tweets that are replies. Defaults to 0.15.
+            retweet_ratio (float, optional): # of retweets per tweet. Defaults to 0.2.
+            list_ratio (float, optional): # of lists per user. Defaults to 0.01.
+            num_hashtags (int, optional): hashtag vocabulary size. Defaults to ~sqrt(num_tweets).
+            chunk_size (int, optional): rows per executemany/commit. Defaults to 200000.
+        """
+        from Sequence import Sequence
+        assert Connection.is_connected()
+        assert num_users > 0
+        rng = random.Random(seed)
+        started = time.perf_counter()
+        Setup.begin_bulk_load()
+
+        def load(table: str, query: str, rows, after_chunk=None) -> None:
+            count = 0
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if len(chunk) == 0:
+                    break
+                Connection.cursor.executemany(query, chunk)
+                if after_chunk is not None:
+                    after_chunk()
+                Connection.connection.commit()
+                count += len(chunk)
+                elapsed = time.perf_counter() - started
+                print(f"\r{table}: {count} rows ({elapsed:.1f}s)", end="", flush=True)
+            print()
+
+        # users (their popularity follows the order of a random permutation)
+        usrs = Sequence.reserve('users', num_users)
+        Connection.connection.commit()
+        by_popularity = list(usrs)
+        rng.shuffle(by_popularity)
+        popular = Test.zipf_weights(num_users)
+
+        def users():
+            for usr in usrs:
+                name = "".join(rng.choices(Test.SYLLABLES, k=rng.randint(2, 4))).capitalize()
+                yield (usr, f"password{usr}", name, f"{name.lower()}{usr}@example.com",
+                       rng.choice(Test.CITIES), float(rng.randint(-12, 12)))
+        load("users", "INSERT INTO users VALUES (?,?,?,?,?,?)", users())
+
+        # dates spread over ~8 years, tweets dated in tid order
+        first_day = datetime.date(2016, 1, 1)
+        dates = [str(first_day + datetime.timedelta(days=d)) for d in range(3000)]
+
+        def follows():
+            scale = follows_per_user / 3  # mean of paretovariate(1.5) is 3
+            for flwer in usrs:
+                degree = min(int(rng.paretovariate(1.5) * scale), num_users - 1)
+                for flwee in rng.choices(by_popularity, cum_weights=popular, k=degree):
+                    if flwee != flwer:
+                        yield (flwer, flwee, rng.choice(dates))
+        load("follows", "INSERT OR IGNORE INTO follows VALUES (?,?,?)", follows())
+
+        # hashtags, drawn with a Zipf bias
+        if num_hashtags is None:
+            num_hashtags = max(int(num_tweets ** 0.5), 10)
+        terms = [f"{rng.choice(Test.WORDS)}{idx}" for idx in range(num_hashtags)]
+        trending = Test.zipf_weights(num_hashtags, 1.1)
+        load("hashtags", "INSERT OR IGNORE INTO hashtags VALUES (?)", ((term,) for term in terms))
+
+        # tweets (+ mentions); replies point at a recent earlier tweet, forming chains
+        tids = Sequence.reserve('tweets', num_tweets) if num_tweets > 0 else range(0)
+        Connection.connection.commit()
+        mentions = []
+
+        def tweets():
+            for idx, tid in enumerate(tids):
+                words = rng.choices(Test.WORDS, k=rng.randint(3, 12))
+                tags = set(rng.choices(terms, cum_weights=trending, k=rng.choice([0, 0, 1, 1, 2, 3])))
+                for term in tags:
+                    words.insert(rng.randint(0, len(words)), "#" + term)
+                    mentions.append((tid, term))
+                replyto = None
+                if idx > 0 and rng.random() < reply_ratio:
+                    replyto = tid - 1 - min(int(rng.expovariate(1 / 50)), idx - 1)
+                writer = rng.choices(by_popularity, cum_weights=popular)[0]
+                yield (tid, writer, dates[idx * len(dates) // num_tweets], " ".join(words), replyto)
+
+        def insert_mentions():
+            # the mentions of each chunk go in once its tweets are in
+            Connection.cursor.executemany("INSERT OR IGNORE INTO mentions VALUES (?,?)", mentions)
+            mentions.clear()
+        load("tweets", "INSERT INTO tweets VALUES (?,?,?,?,?)", tweets(), insert_mentions)
+
+        # retweets of popular tweets, a few days after the tweet
+        viral = Test.zipf_weights(num_tweets, 0.8)
+        num_retweets = int(num_tweets * retweet_ratio) if num_tweets > 0 else 0
+        by_virality = list(tids)
+        rng.shuffle(by_virality)
+
+        def retweets():
+            for _ in range(num_retweets):
+                tid = rng.choices(by_virality, cum_weights=viral)[0]
+                day = min((tid - tids[0]) * len(dates) // num_tweets + rng.randint(0, 30), len(dates) - 1)
+                yield (rng.choice(usrs), tid, dates[day])
+        load("retweets", "INSERT OR IGNORE INTO retweets VALUES (?,?,?)", retweets())
+
+        # lists of popular members
+        num_lists = int(num_users * list_ratio)
+        owners = [rng.choice(usrs) for _ in range(num_lists)]
+        lnames = [f"list{usrs[0]}_{idx}" for idx in range(num_lists)]
+        load("lists", "INSERT OR IGNORE INTO lists VALUES (?,?)", zip(lnames, owners))
+
+        def includes():
+            for lname in lnames:
+                for member in set(rng.choices(by_popularity, cum_weights=popular, k=rng.randint(5, 50))):
+                    yield (lname, member)
+        load("includes", "INSERT OR IGNORE INTO includes VALUES (?,?)", includes())
+
+        Setup.end_bulk_load()
+        print(f"Rebuilt indexes and derived tables ({time.perf_counter() - started:.1f}s)")
+
+
+    @staticmethod
+    def concurrent_writer(path: str, usr: int, num_tweets: int) -> int:
+        """Publishes tweets as a given user, as one of several processes sharing a db
+
+        Args:
+            path (str): filepath to the shared db
+            usr (int): user id to tweet as
+            num_tweets (int): # of tweets to publish
+
+        Returns:
+            int: # of tweets that failed to publish
+        """
+        from Login import Login
+        from Sequence import Sequence
+        from ComposeTweet import ComposeTweet
+
+        Connection.connect(path)
+        Login.userID = usr
+        failures = 0
+        with contextlib.redirect_stdout(None):
+            for i in range(num_tweets):
+                try:
+                    tid = Sequence.next_id('tweets')
+                    ComposeTweet.addTweetToTweetsDB(tid, f"tweet {i} from {usr} #concurrent", None)
+                except Exception:
+                    Connection.connection.rollback()
+                    failures += 1
+        Connection.close()
+        return failures
+
+
+    @staticmethod
+    def concurrent_writers(num_processes: int = 8, num_tweets: int = 200) -> bool:
+        """Runs several writer processes against one db file at once, then checks that
+            every tweet was published exactly once with a unique tid
+
+        Args:
+            num_processes (int, optional): # of writer processes. Defaults to 8.
+            num_tweets (int, optional): # of tweets per process. Defaults to 200.
+
+        Returns:
+            bool: True if no publish failed and no tweet is missing
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "concurrent.db")
+            Connection.connect(path)
+            Setup.define_tables()
+            Test.insert_test_data()
+            Connection.cursor.execute("SELECT COUNT(*) FROM tweets")
+            before = Connection.cursor.fetchone()[0]
+            Connection.close()
+
+            # each process tweets as one of the 3 test users
+            jobs = [(path, i % 3 + 1, num_tweets) for i in range(num_processes)]
+            with multiprocessing.Pool(num_processes) as pool:
+                failures = sum(pool.starmap(Test.concurrent_writer, jobs))
+
+            Connection.connect(path)
+            Connection.cursor.execute("SELECT COUNT(*), COUNT(DISTINCT tid) FROM tweets")
+            total, distinct = Connection.cursor.fetchone()
+            Connection.close()
+
+        expected = before + num_processes * num_tweets
+        print(f"{num_processes} writers: {total - before} tweets published, "
+              f"{failures} failures, {expected - total} missing")
+        return failures == 0 and total == expected and distinct == total
+
+
+
+    @staticmethod
+    def ingest_ids() -> bool:
+        """Ingests users and tweets with and without ids into an empty db, deferring the
+            indexes and not, then checks that the allocated ids did not clash with the
+            explicit ones and that the hashtags went to the right tweet
+
+        Returns:
+            bool: True if every record was inserted with a distinct id both ways
+        """
+        import json
+        from Ingest import Ingest
+
+        ok = True
+        with tempfile.TemporaryDirectory() as tmp:
+            files = []
+            for kind, records in [
+                    ("users", [{"usr": usr, "pwd": "pwd", "name": f"user {usr}", "email": "e", "city": "c"}
+                               for usr in (1, 2)] + [{"pwd": "pwd", "name": "new", "email": "e", "city": "c"}]),
+                    ("tweets", [{"tid": tid, "writer": 1, "text": f"tweet {tid}"} for tid in (1, 2)]
+                               + [{"writer": 2, "text": "new #oops"}])]:
+                path = os.path.join(tmp, f"{kind}.jsonl")
+                with open(path, "w") as file:
+                    file.writelines(json.dumps(record) + "\n" for record in records)
+                files.append((kind, path))
+
+            for defer in (True, False):
+                Connection.connect(os.path.join(tmp, f"ingest-{defer}.db"))
+                Setup.define_tables()
+                with contextlib.redirect_stdout(None):
+                    inserted, rejected = Ingest.ingest(files, defer_indexes=defer)
+                Connection.cursor.execute("SELECT COUNT(DISTINCT usr) FROM users")
+                users = Connection.cursor.fetchone()[0]
+                Connection.cursor.execute("SELECT COUNT(DISTINCT tid) FROM tweets")
+                tweets = Connection.cursor.fetchone()[0]
+                Connection.cursor.execute("""
+                        SELECT t.text, m.term FROM mentions m, tweets t WHERE t.tid = m.tid""")
+                mentions = Connection.cursor.fetchall()
+                Connection.close()
+
+                print(f"{'deferred' if defer else 'kept indexes'}: {inserted} inserted, "
+                      f"{rejected} rejected, {users} users, {tweets} tweets, mentions {mentions}")
+                ok = ok and (inserted, rejected, users, tweets) == (6, 0, 3, 3) \
+                    and mentions == [("new #oops", "oops")]
+        return ok
+
+
+
+    @staticmethod
+    def batch_rollback() -> bool:
+        """Runs batch commands with group commit on until one fails with a database
+            error, then checks that every command still reported ok was committed, and
+            that the ones rolled back were reported as such
+
+        Returns:
+            bool: True if the results match what the db kept
+        """
+        import io
+        import json
+        from Batch import Batch
+
+        with tempfile.TemporaryDirectory() as tmp:
+            Connection.connect(os.path.join(tmp, "batch.db"))
+            Setup.define_tables()
+            Test.insert_test_data()
+            Connection.cursor.execute("SELECT MAX(tid) FROM tweets")
+            before = Connection.cursor.fetchone()[0]
+            Connection.cursor.execute("""
+                    CREATE TRIGGER follows_fail BEFORE INSERT ON follows
+                    BEGIN SELECT RAISE(ABORT, 'follows are failing'); END""")
+            Connection.connection.commit()
+
+            lines = ["login 1 password1", "compose one", "compose two", "follow 3", "compose three"]
+            output = io.StringIO()
+            groupSize, groupDelay = Connection.group_size, Connection.group_delay
+            Connection.set_group_commit(100, float("inf"))
+            with contextlib.redirect_stderr(io.StringIO()):
+                Batch.run(lines, output)
+            Connection.set_group_commit(groupSize, groupDelay)
+
+            results = {}  # line -> its last result
+            for result in map(json.loads, output.getvalue().splitlines()):
+                results[result["line"]] = result
+            reported = set(result["result"]["tid"] for result in results.values()
+                           if result["ok"] and result["cmd"] == "compose")
+            Connection.cursor.execute("SELECT tid FROM tweets WHERE tid > ?", (before,))
+            kept = set(row[0] for row in Connection.cursor.fetchall())
+            Connection.close()
+
+        print(f"group commit: tweets reported ok {sorted(reported)}, kept {sorted(kept)}, "
+              f"rolled back lines {[n for n, result in results.items() if 'rolled back' in result.get('error', '')]}")
+        return reported == kept and len(kept) == 1
+
+
 if __name__ == "__main__":
+    if "--concurrent-writers" in sys.argv:
+        sys.exit(0 if Test.concurrent_writers() else 1)
+
+    if "--ingest-ids" in sys.argv:
+        sys.exit(0 if Test.ingest_ids() else 1)
+
+    if "--batch-rollback" in sys.argv:
+        sys.exit(0 if Test.batch_rollback() else 1)
+
+    # compare the merged feed with the feed query, on a db or a generated one
+    if "--feed-merge" in sys.argv:
+        from Feed import Feed
+        with tempfile.TemporaryDirectory() as tmp:
+            if "--db-path" in sys.argv and sys.argv.index("--db-path") < len(sys.argv) - 1:
+                Connection.connect(sys.argv[sys.argv.index("--db-path") + 1])
+                Setup.define_tables()
+            else:
+                Connection.connect(os.path.join(tmp, "feed.db"))
+                Setup.define_tables()
+                with contextlib.redirect_stdout(None):
+                    Test.generate_data(1000, 10000, seed=1)
+            ok = Feed.check_merge()
+            Connection.close()
+        sys.exit(0 if ok else 1)
+
     path = os.path.dirname(os.path.realpath(__file__)) + "/data.db"
     Connection.connect(path)
 
@@ -0,0 +1,227 @@
+import time
+import threading
+from collections import OrderedDict
+
+from Connection import Connection
+from Pager import Pager
+
+
+class ThreadPager(Pager):
+    """A Pager over the replies under a tweet that keeps the pages it fetches in
+    Thread's cache, so hot threads are served from memory until they change."""
+
+    def __init__(self, tid: int, page_size: int) -> None:
+        """Opens the replies under a tweet, loading the first page
+
+        Args:
+            tid (int): the tweet at the top of the subtree
+            page_size (int): # of replies per page
+        """
+        self.tid = tid
+        # a page needs at most page_size + 1 replies to one tweet, plus the one on the
+        # path to where it starts
+        super().__init__(Thread.DESCENDANTS_QUERY, (tid, page_size + 2, page_size + 2),
+                         Thread.DESCENDANTS_KEYS, page_size, descending=False, bound=True)
+
+
+    def fetch(self, after: tuple) -> ([str], [tuple]):
+        """Gets a page from the cache, or from the db (caching it)
+
+        Args:
+            after (tuple): the key of the last row before the page (None for page 1)
+
+        Returns:
+            tuple: the column names, and up to page_size + 1 rows (key columns last)
+        """
+        key = (after, self.page_size)
+        page = Thread.cached(self.tid, key)
+        if page is None:
+            page = super().fetch(after)
+            Thread.cache(self.tid, key, page)
+        return page
+
+
+class Thread:
+    """Reply threads: the chain of tweets a tweet replies to and the tree of replies under it.
+
+    Both directions are one recursive CTE over tweets.replyto. The replies are walked
+    depth first, each tweet's replies in tid (posting) order, and paged by their path
+    from the top tweet (the zero-padded tids on the way down), so a page only expands
+    the tweets on the path to where it starts and at most a page of replies per tweet,
+    however large the thread. Pages are kept in an LRU cache per top tweet for `ttl`
+    seconds; replies posted by this process drop the cached pages of every tweet above them.
+    """
+    size = 1000  # max # of top tweets with cached pages
+    ttl = 60.0   # seconds a cached page stays valid
+
+    # the tweet (?) and every tweet above it (with the # of replies in between), top first
+    ANCESTORS_QUERY = """
+            WITH RECURSIVE chain (tid, depth) AS (
+                SELECT ?, 0
+                UNION ALL
+                SELECT t.replyto, chain.depth + 1
+                FROM chain, tweets t
+                WHERE t.tid = chain.tid
+                    AND t.replyto IS NOT NULL)
+            SELECT u.name, t.tid, t.writer, t.tdate, t.text, t.replyto, NULL AS retweeter, chain.depth AS distance
+            FROM chain, tweets t, users u
+            WHERE t.tid = chain.tid
+                AND u.usr = t.writer
+            ORDER BY chain.depth DESC"""
+
+    # the replies under a tweet, depth first (bound: the path the page starts after; then
+    # the top tweet, the # of replies to expand per tweet and the # of rows to walk). Only
+    # the tweets on the start path and after it are expanded, from the start path's tid on.
+    DESCENDANTS_QUERY = """
+            WITH RECURSIVE start (path) AS (
+                SELECT IFNULL(?, '')),
+            tree (tid, depth, path) AS (
+                SELECT ?, 0, ''
+                UNION ALL
+                SELECT r.tid, tree.depth + 1, tree.path || printf('%020d', r.tid)
+                FROM tree, tweets r
+                WHERE r.tid IN (
+                    SELECT c.tid FROM tweets c
+                    WHERE c.replyto = tree.tid
+                        AND c.tid >= CASE
+                            WHEN substr((SELECT path FROM start), 1, length(tree.path)) = tree.path
+                            THEN IFNULL(CAST(substr((SELECT path FROM start), length(tree.path) + 1, 20) AS INT), 0)
+                            ELSE 0 END
+                    ORDER BY c.tid
+                    LIMIT ?)
+                ORDER BY 3
+                LIMIT (SELECT length(path) / 20 FROM start) + ?)
+            SELECT u.name, t.tid, t.writer, t.tdate, t.text, t.replyto, NULL AS retweeter, tree.depth, tree.path
+            FROM tree, tweets t, users u
+            WHERE tree.depth > 0
+                AND t.tid = tree.tid
+                AND u.usr = t.writer"""
+    DESCENDANTS_KEYS = ["path"]
+
+    pages = OrderedDict()  # top tid -> (expiry time, {(after, page_size): page}), oldest first
+    lock = threading.RLock()
+
+    @staticmethod
+    def ancestors(tid: int) -> [dict]:
+        """Gets a tweet and the chain of tweets it replies to
+
+        Args:
+            tid (int): the tweet id
+
+        Returns:
+            list[dict]: the tweets, the top of the thread first and the tweet itself last
+                (none if it does not exist)
+        """
+        assert Connection.is_connected()
+        Connection.cursor.execute(Thread.ANCESTORS_QUERY, (tid,))
+        column_names = [description[0] for description in Connection.cursor.description]
+        return [dict(zip(column_names, row)) for row in Connection.cursor.fetchall()]
+
+
+    @staticmethod
+    def replies_pager(tid: int, page_size: int = 5) -> Pager:
+        """Pages through the replies under a tweet, depth first
+
+        Args:
+            tid (int): the tweet id
+            page_size (int, optional): # of replies per page. Defaults to 5.
+
+        Returns:
+            Pager: the replies, like Feed.feed_pager's rows plus their depth below the
+                tweet (1 for direct replies) and path
+        """
+        assert Connection.is_connected()
+        return ThreadPager(tid, page_size)
+
+
+    @staticmethod
+    def cached(tid: int, key: tuple):
+        """Looks up a cached page of the replies under a tweet
+
+        Args:
+            tid (int): the top tweet
+            key (tuple): the key the page starts after and the page size
+
+        Returns:
+            the page, or None if missing/expired
+        """
+        with Thread.lock:
+            entry = Thread.pages.get(tid)
+            if entry is None or entry[0] < time.monotonic():
+                Thread.pages.pop(tid, None)
+                return None
+            Thread.pages.move_to_end(tid)
+            return entry[1].get(key)
+
+
+    @staticmethod
+    def cache(tid: int, key: tuple, page) -> None:
+        """Stores a page of the replies under a tweet, evicting the least recently used
+            threads if full
+
+        Args:
+            tid (int): the top tweet
+            key (tuple): the key the page starts after and the page size
+            page: the page
+        """
+        if Thread.size <= 0:
+            return
+        with Thread.lock:
+            entry = Thread.pages.get(tid)
+            if entry is None or entry[0] < time.monotonic():
+                entry = (time.monotonic() + Thread.ttl, {})
+                Thread.pages[tid] = entry
+            entry[1][key] = page
+            Thread.pages.move_to_end(tid)
+            while len(Thread.pages) > Thread.size:
+                Thread.pages.popitem(last=False)
+
+
+    @staticmethod
+    def reply_posted(replyTo: int) -> None:
+        """Drops the cached pages of every thread a new reply shows up in
+
+        Args:
+            replyTo (int): the tweet replied to
+        """
+        with Thread.lock:
+            if len(Thread.pages) == 0:
+                return
+            for tweet in Thread.ancestors(replyTo):
+                Thread.pages.pop(tweet['tid'], None)
+
+
+    @staticmethod
+    def invalidate() -> None:
+        """Drops every cached page, eg. after a bulk load"""
+        with Thread.lock:
+            Thread.pages.clear()
+
+
+    @staticmethod
+    def show_thread(tid: int) -> None:
+        """Shows a tweet below the tweets it replies to, then pages through its replies
+            in a tweets activity
+
+        Args:
+            tid (int): the tweet id
+        """
+        from Search import Search
+        chain = Thread.ancestors(tid)
+        if len(chain) == 0:
+            print("Tweet does not exist.")
+            print()
+            return
+
+        print("="*80)
+        for depth, tweet in enumerate(chain):
+            indent = "\t" + "  " * depth
+            if depth > 0:
+                print(f"{indent}^ in reply to the tweet above")
+            print(f"{indent}{tweet['name']} (+{tweet['writer']})")
+            print(f"{indent}{tweet['text']}")
+            print(f"{indent}{tweet['tdate']}")
+            print()
+        print("Replies:")
+        Search.interact(Thread.replies_pager(tid), [
+            "scrollup", "scrolldown", "viewinfo", "reply", "retweet", "thread"], 'tweet')
@@ -0,0 +1,31 @@
+import threading
+
+
+class ThreadLocal(type):
+    """Metaclass giving each thread its own value of some class attributes.
+
+    A class using it lists those attributes and their defaults in THREAD_LOCAL instead of
+    defining them; `Cls.attr` and `Cls.attr = value` then read/write the current thread's
+    copy, so code written against class-level state (Connection.cursor, Login.userID)
+    works unchanged from several threads at once.
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        cls = super().__new__(mcs, name, bases, namespace)
+        type.__setattr__(cls, "_local", threading.local())
+        return cls
+
+
+    def __getattr__(cls, name):
+        # only called for attributes not found on the class itself
+        defaults = type.__getattribute__(cls, "THREAD_LOCAL")
+        if name not in defaults:
+            raise AttributeError(f"type object '{cls.__name__}' has no attribute '{name}'")
+        return getattr(type.__getattribute__(cls, "_local"), name, defaults[name])
+
+
+    def __setattr__(cls, name, value):
+        if name in type.__getattribute__(cls, "THREAD_LOCAL"):
+            setattr(type.__getattribute__(cls, "_local"), name, value)
+        else:
+            type.__setattr__(cls, name, value)
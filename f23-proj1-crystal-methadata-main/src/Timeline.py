@@ -0,0 +1,250 @@
+from Connection import Connection
+
+
+class Timeline:
+    """Optional fan-out-on-write copy of every user's feed.
+
+    When the timeline table exists, each new tweet/retweet is copied into the timeline of
+    every follower of its author, so reading a feed is a range scan over one owner.
+    Accounts with more than FANOUT_LIMIT followers are listed in timeline_pull instead:
+    their tweets are never copied, and feeds pull them from the live tables on read.
+    Retweeter 0 in the table marks an original tweet (the feed shows it as NULL).
+    """
+    FANOUT_LIMIT = 10000
+
+    DEFINE_SCRIPT = """
+        CREATE TABLE IF NOT EXISTS timeline (
+            owner       INT,
+            sort_date   DATE,
+            tid         INT,
+            retweeter   INT,
+            PRIMARY KEY (owner, sort_date, tid, retweeter)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS timeline_pull (
+            usr         INT,
+            PRIMARY KEY (usr)
+        );
+        """
+
+    # same rows and columns as Feed.FEED_QUERY, for owner ? (bound 3 times)
+    TIMELINE_QUERY = """
+            SELECT u.name, t.tid, t.writer, tl.sort_date AS tdate, t.text, t.replyto,
+                NULLIF(tl.retweeter, 0) AS retweeter
+            FROM timeline tl, tweets t, users u
+            WHERE tl.owner = ?
+                AND t.tid = tl.tid
+                AND u.usr = t.writer
+            UNION ALL
+            SELECT name, tid, writer, tdate, text, replyto, NULL as retweeter
+            FROM users u, tweets t, follows f, timeline_pull p
+            WHERE u.usr = t.writer
+                AND t.writer = f.flwee
+                AND f.flwer = ?
+                AND p.usr = f.flwee
+            UNION ALL
+            SELECT u.name, rt.tid, t.writer, rt.rdate, t.text, t.replyto, rt.usr
+            FROM users u, retweets rt, tweets t, follows f, timeline_pull p
+            WHERE u.usr = t.writer
+                AND t.tid = rt.tid
+                AND rt.usr = f.flwee
+                AND f.flwer = ?
+                AND p.usr = f.flwee"""
+
+    FAN_OUT_TWEET_QUERY = """
+            INSERT OR IGNORE INTO timeline (owner, sort_date, tid, retweeter)
+            SELECT flwer, ?, ?, 0 FROM follows WHERE flwee = ?"""
+    FAN_OUT_RETWEET_QUERY = """
+            INSERT OR IGNORE INTO timeline (owner, sort_date, tid, retweeter)
+            SELECT flwer, ?, ?, ? FROM follows WHERE flwee = ?"""
+
+    # copies everything :flwee has tweeted/retweeted into the timeline of :owner
+    BACKFILL_QUERY = """
+            INSERT OR IGNORE INTO timeline (owner, sort_date, tid, retweeter)
+            SELECT :owner, tdate, tid, 0 FROM tweets WHERE writer = :flwee
+            UNION ALL
+            SELECT :owner, rdate, tid, usr FROM retweets WHERE usr = :flwee"""
+
+    # removes everything :flwee has tweeted/retweeted from the timeline of :owner
+    UNFOLLOW_QUERY = """
+            DELETE FROM timeline
+            WHERE owner = :owner
+                AND (retweeter = :flwee
+                    OR (retweeter = 0 AND tid IN (SELECT tid FROM tweets WHERE writer = :flwee)))"""
+
+    PULL_EXISTS_QUERY = "SELECT usr FROM timeline_pull WHERE usr = ?"
+    FOLLOWER_COUNT_QUERY = "SELECT followers FROM user_stats WHERE usr = ?"
+
+    @staticmethod
+    def is_enabled() -> bool:
+        """Determines whether the timeline table has been built in this db
+
+        Returns:
+            bool: True if feeds should be read from/written to the timeline
+        """
+        assert Connection.is_connected()
+        return Connection.contains(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'timeline';", ())
+
+
+    @staticmethod
+    def is_pull(usr: int) -> bool:
+        """Determines whether a user's tweets are pulled on read instead of fanned out
+
+        Args:
+            usr (int): the user id of the author
+
+        Returns:
+            bool: True if the user has too many followers to fan out to
+        """
+        return Connection.contains(Timeline.PULL_EXISTS_QUERY, (usr,))
+
+
+    @staticmethod
+    def fan_out_tweet(tid: int, writer: int, tdate) -> None:
+        """Copies a new tweet into the timelines of its writer's followers.
+            Does not commit; meant to run in the transaction inserting the tweet.
+
+        Args:
+            tid (int): the new tweet id
+            writer (int): the user id of the writer
+            tdate (date): the date of the tweet
+        """
+        if not Timeline.is_enabled() or Timeline.is_pull(writer):
+            return
+        Connection.cursor.execute(Timeline.FAN_OUT_TWEET_QUERY, (tdate, tid, writer))
+
+
+    @staticmethod
+    def fan_out_retweet(usr: int, tid: int, rdate) -> None:
+        """Copies a new retweet into the timelines of the retweeter's followers.
+            Does not commit; meant to run in the transaction inserting the retweet.
+
+        Args:
+            usr (int): the user id of the retweeter
+            tid (int): the tweet id retweeted
+            rdate (date): the date of the retweet
+        """
+        if not Timeline.is_enabled() or Timeline.is_pull(usr):
+            return
+        Connection.cursor.execute(Timeline.FAN_OUT_RETWEET_QUERY, (rdate, tid, usr, usr))
+
+
+    @staticmethod
+    def add_follow(flwer: int, flwee: int) -> None:
+        """Updates the timelines after flwer starts following flwee: backfills flwer's
+            timeline, or switches flwee to the pull path once it passes FANOUT_LIMIT.
+            Does not commit; meant to run in the transaction inserting the follow.
+
+        Args:
+            flwer (int): the user id of the follower
+            flwee (int): the user id of the user being followed
+        """
+        if not Timeline.is_enabled() or Timeline.is_pull(flwee):
+            return
+
+        Connection.cursor.execute(Timeline.FOLLOWER_COUNT_QUERY, (flwee,))
+        result = Connection.cursor.fetchone()
+        if result is not None and result[0] > Timeline.FANOUT_LIMIT:
+            Timeline.switch_to_pull(flwee)
+        else:
+            Connection.cursor.execute(Timeline.BACKFILL_QUERY, {"owner": flwer, "flwee": flwee})
+
+
+    @staticmethod
+    def remove_follow(flwer: int, flwee: int) -> None:
+        """Updates the timelines after flwer stops following flwee: removes flwee's tweets
+            and retweets from flwer's timeline (pulled accounts have none there).
+            Does not commit; meant to run in the transaction deleting the follow.
+
+        Args:
+            flwer (int): the user id of the follower
+            flwee (int): the user id of the user no longer followed
+        """
+        if not Timeline.is_enabled() or Timeline.is_pull(flwee):
+            return
+        Connection.cursor.execute(Timeline.UNFOLLOW_QUERY, {"owner": flwer, "flwee": flwee})
+
+
+    @staticmethod
+    def switch_to_pull(usr: int) -> None:
+        """Moves a user to the pull path, removing their fanned-out rows from all timelines.
+            This scans the timeline table, but only happens once per account.
+
+        Args:
+            usr (int): the user id of the (now high-follower) account
+        """
+        Connection.cursor.execute("INSERT OR IGNORE INTO timeline_pull (usr) VALUES (?)", (usr,))
+        Connection.cursor.execute("""
+            DELETE FROM timeline
+            WHERE retweeter = :usr
+                OR (retweeter = 0 AND tid IN (SELECT tid FROM tweets WHERE writer = :usr))""",
+            {"usr": usr})
+
+
+    @staticmethod
+    def rebuild() -> None:
+        """Creates (if needed) and refills the timeline tables from the live tables"""
+        assert Connection.is_connected()
+        Connection.cursor.executescript(Timeline.DEFINE_SCRIPT)
+        Connection.cursor.execute("DELETE FROM timeline")
+        Connection.cursor.execute("DELETE FROM timeline_pull")
+        Connection.cursor.execute("""
+            INSERT INTO timeline_pull (usr)
+            SELECT flwee FROM follows GROUP BY flwee HAVING COUNT(*) > ?""",
+            (Timeline.FANOUT_LIMIT,))
+        Connection.cursor.execute("""
+            INSERT OR IGNORE INTO timeline (owner, sort_date, tid, retweeter)
+            SELECT f.flwer, t.tdate, t.tid, 0
+            FROM follows f, tweets t
+            WHERE t.writer = f.flwee
+                AND f.flwee NOT IN (SELECT usr FROM timeline_pull)
+            UNION ALL
+            SELECT f.flwer, rt.rdate, rt.tid, rt.usr
+            FROM follows f, retweets rt
+            WHERE rt.usr = f.flwee
+                AND f.flwee NOT IN (SELECT usr FROM timeline_pull)""")
+        Connection.connection.commit()
+
+
+    @staticmethod
+    def drop() -> None:
+        """Drops the timeline tables, returning feeds to the live query"""
+        assert Connection.is_connected()
+        Connection.cursor.executescript("""
+        DROP TABLE IF EXISTS timeline;
+        DROP TABLE IF EXISTS timeline_pull;
+        """)
+
+
+    @staticmethod
+    def check(max_reported: int = 10) -> bool:
+        """Compares every user's timeline against the live feed query, printing mismatches
+
+        Args:
+            max_reported (int, optional): # of mismatched users to print. Defaults to 10.
+
+        Returns:
+            bool: True if every timeline matches the live feed
+        """
+        assert Connection.is_connected()
+        assert Timeline.is_enabled()
+        from Feed import Feed
+        Connection.cursor.execute("SELECT usr FROM users")
+        users = [row[0] for row in Connection.cursor.fetchall()]
+
+        mismatched = 0
+        for usr in users:
+            Connection.cursor.execute(Feed.FEED_QUERY, (usr, usr))
+            live = set((row[1], row[3], row[6]) for row in Connection.cursor.fetchall())
+            Connection.cursor.execute(Timeline.TIMELINE_QUERY, (usr, usr, usr))
+            stored = [(row[1], row[3], row[6]) for row in Connection.cursor.fetchall()]
+
+            if len(stored) != len(set(stored)) or set(stored) != live:
+                mismatched += 1
+                if mismatched <= max_reported:
+                    print(f"User {usr}: {len(live - set(stored))} missing, "
+                          f"{len(set(stored) - live)} extra, "
+                          f"{len(stored) - len(set(stored))} duplicated")
+
+        print(f"{len(users) - mismatched} of {len(users)} timelines match the live feed.")
+        return mismatched == 0
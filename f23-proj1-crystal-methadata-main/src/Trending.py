@@ -0,0 +1,138 @@
+import time
+import heapq
+import datetime
+import threading
+
+from Connection import Connection
+
+
+class Trending:
+    """Top hashtags over a sliding window of recent hours or days.
+
+    hashtag_counts (see Setup.define_trending) keeps the # of mentions of each term per
+    local hour and per day, so a window only reads its last few buckets. Each mention
+    counts for less the older its bucket is (halving every half-life), and the decayed
+    scores of a window are kept in memory for REFRESH seconds, so changes made by other
+    processes show up eventually; hashtags posted by this process are added right away.
+    """
+    # period -> (# of buckets in the window, half-life in buckets)
+    WINDOWS = {"hour": (24, 6.0), "day": (7, 2.0)}
+    REFRESH = 60.0  # seconds
+
+    WINDOW_QUERY = """
+            SELECT bucket, term, count FROM hashtag_counts
+            WHERE period = ? AND bucket > ? AND bucket <= ?"""
+
+    scores = {}  # period -> (current bucket, expiry time, {term: [score, mentions]})
+    lock = threading.RLock()
+
+    @staticmethod
+    def current_bucket(period: str, now: datetime.datetime = None) -> int:
+        """Gets the bucket a mention made now counts towards
+
+        Args:
+            period (str): 'hour' or 'day'
+            now (datetime, optional): the local time. Defaults to now.
+
+        Returns:
+            int: local hours/days since 1970-01-01
+        """
+        now = now or datetime.datetime.now()
+        day = (now.date() - datetime.date(1970, 1, 1)).days
+        return day if period == "day" else day * 24 + now.hour
+
+
+    @staticmethod
+    def load(period: str, bucket: int) -> {str: list}:
+        """Reads the counts of a window from the db and decays them
+
+        Args:
+            period (str): 'hour' or 'day'
+            bucket (int): the current (newest) bucket of the window
+
+        Returns:
+            dict[str, list]: term -> [decayed score, # of mentions in the window]
+        """
+        assert Connection.is_connected()
+        size, halfLife = Trending.WINDOWS[period]
+        Connection.cursor.execute(Trending.WINDOW_QUERY, (period, bucket - size, bucket))
+        scores = {}
+        for rowBucket, term, count in Connection.cursor.fetchall():
+            entry = scores.setdefault(term, [0.0, 0])
+            entry[0] += count * 0.5 ** ((bucket - rowBucket) / halfLife)
+            entry[1] += count
+        return scores
+
+
+    @staticmethod
+    def top(period: str = "day", k: int = 10, now: datetime.datetime = None) -> [(str, float, int)]:
+        """Gets the top trending hashtags
+
+        Args:
+            period (str, optional): 'hour' (last 24 hours) or 'day' (last 7 days). Defaults to 'day'.
+            k (int, optional): # of hashtags. Defaults to 10.
+            now (datetime, optional): the local time. Defaults to now.
+
+        Returns:
+            list[tuple[str, float, int]]: term, decayed score and # of mentions in the
+                window, highest score first (ties by term)
+
+        Raises:
+            ValueError: if the period is unknown
+        """
+        if period not in Trending.WINDOWS:
+            raise ValueError(f"unknown period '{period}'")
+        bucket = Trending.current_bucket(period, now)
+        with Trending.lock:
+            entry = Trending.scores.get(period)
+            if entry is None or entry[0] != bucket or entry[1] < time.monotonic():
+                entry = (bucket, time.monotonic() + Trending.REFRESH, Trending.load(period, bucket))
+                Trending.scores[period] = entry
+            best = heapq.nsmallest(k, entry[2].items(), key=lambda item: (-item[1][0], item[0]))
+        return [(term, score, mentions) for term, (score, mentions) in best]
+
+
+    @staticmethod
+    def record(terms: [str], tdate: datetime.date) -> None:
+        """Adds the hashtags of a tweet just posted by this process to the in-memory scores
+            (the db counts are updated by a trigger)
+
+        Args:
+            terms (list[str]): the distinct hashtag terms of the tweet
+            tdate (date): the date of the tweet
+        """
+        now = datetime.datetime.now()
+        if tdate != now.date():
+            return
+        with Trending.lock:
+            for period, (bucket, _, scores) in Trending.scores.items():
+                if bucket != Trending.current_bucket(period, now):
+                    continue  # stale, reloaded on the next read
+                for term in terms:
+                    entry = scores.setdefault(term, [0.0, 0])
+                    entry[0] += 1.0
+                    entry[1] += 1
+
+
+    @staticmethod
+    def invalidate() -> None:
+        """Drops the in-memory scores, eg. after a bulk load"""
+        with Trending.lock:
+            Trending.scores.clear()
+
+
+    @staticmethod
+    def show_trending(k: int = 10) -> None:
+        """Prints the top hashtags of the last 24 hours and of the last 7 days
+
+        Args:
+            k (int, optional): # of hashtags per list. Defaults to 10.
+        """
+        for period, title in (("hour", "last 24 hours"), ("day", "last 7 days")):
+            trending = Trending.top(period, k)
+            print(f"Trending in the {title}:")
+            if len(trending) == 0:
+                print("  No hashtags.")
+            for rank, (term, score, mentions) in enumerate(trending, 1):
+                print(f"  {rank:>2}. #{term:<30} {mentions:>6} mentions (score {score:.1f})")
+            print()
@@ -0,0 +1,134 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class UserCache:
+    """Process-wide LRU cache of user names and profile counters.
+
+    Entries are keyed by (kind, usr) and expire after `ttl` seconds, so changes made by
+    other processes show up eventually; writes made by this process update or
+    invalidate the affected entries right away. It is shared by all threads.
+    """
+    size = 10000
+    ttl = 300.0
+
+    entries = OrderedDict()  # (kind, usr) -> (expiry time, value), oldest first
+    hits = 0
+    misses = 0
+    evictions = 0
+    lock = threading.RLock()
+
+    @staticmethod
+    def configure(size: int = None, ttl: float = None) -> None:
+        """Changes the cache limits, dropping any entries over the new size
+
+        Args:
+            size (int, optional): max # of entries. Unchanged if None.
+            ttl (float, optional): seconds an entry stays valid. Unchanged if None.
+        """
+        if size is not None:
+            UserCache.size = size
+        if ttl is not None:
+            UserCache.ttl = ttl
+        UserCache.evict()
+
+
+    @staticmethod
+    def get(kind: str, usr: int):
+        """Looks up a cached value, counting the hit/miss
+
+        Args:
+            kind (str): the kind of value ('name' or 'counts')
+            usr (int): the user id
+
+        Returns:
+            the cached value, or None if missing/expired
+        """
+        with UserCache.lock:
+            key = (kind, usr)
+            entry = UserCache.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del UserCache.entries[key]
+                UserCache.misses += 1
+                return None
+            UserCache.entries.move_to_end(key)
+            UserCache.hits += 1
+            return entry[1]
+
+
+    @staticmethod
+    def put(kind: str, usr: int, value) -> None:
+        """Stores a value, evicting the least recently used entries if full
+
+        Args:
+            kind (str): the kind of value ('name' or 'counts')
+            usr (int): the user id
+            value: the value to cache (not None)
+        """
+        if UserCache.size <= 0:
+            return
+        with UserCache.lock:
+            key = (kind, usr)
+            UserCache.entries[key] = (time.monotonic() + UserCache.ttl, value)
+            UserCache.entries.move_to_end(key)
+            UserCache.evict()
+
+
+    @staticmethod
+    def invalidate(kind: str, *users: int) -> None:
+        """Drops the cached values of some users
+
+        Args:
+            kind (str): the kind of value ('name' or 'counts')
+            users (int): the user ids
+        """
+        with UserCache.lock:
+            for usr in users:
+                UserCache.entries.pop((kind, usr), None)
+
+
+    @staticmethod
+    def evict() -> None:
+        """Drops least recently used entries until the cache fits its size"""
+        with UserCache.lock:
+            while len(UserCache.entries) > max(UserCache.size, 0):
+                UserCache.entries.popitem(last=False)
+                UserCache.evictions += 1
+
+
+    @staticmethod
+    def clear() -> None:
+        """Drops every entry and resets the statistics"""
+        with UserCache.lock:
+            UserCache.entries.clear()
+            UserCache.hits = 0
+            UserCache.misses = 0
+            UserCache.evictions = 0
+
+
+    @staticmethod
+    def stats() -> {str: int}:
+        """Gets the cache statistics
+
+        Returns:
+            dict[str, int]: entries, hits, misses and evictions so far
+        """
+        return {
+            "entries": len(UserCache.entries),
+            "hits": UserCache.hits,
+            "misses": UserCache.misses,
+            "evictions": UserCache.evictions,
+        }
+
+
+    @staticmethod
+    def print_stats() -> None:
+        """Prints the cache statistics"""
+        stats = UserCache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        hit_rate = 100 * stats["hits"] / lookups if lookups > 0 else 0
+        print(f"User cache: {stats['entries']}/{UserCache.size} entries, "
+              f"{stats['hits']} hits, {stats['misses']} misses ({hit_rate:.1f}% hit rate), "
+              f"{stats['evictions']} evictions")
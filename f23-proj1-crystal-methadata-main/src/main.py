@@ -3,10 +3,17 @@
 
 import os
 import sys
+import contextlib
 from Connection import Connection
+from Batch import Batch
+from Server import Server
+from Ingest import Ingest
 from Setup import Setup
 from Shell import Shell
 from Test import Test
+from Timeline import Timeline
+from UserCache import UserCache
+from QueryLog import QueryLog
 
 
 def main():
@@ -20,7 +27,49 @@ def main():
         dbPath = sys.argv[sys.argv.index("--db-path") + 1]
     else:
         dbPath = os.path.dirname(os.path.realpath(__file__)) + "/data.db"
-    Connection.connect(dbPath)
+    profile = None
+    if "--profile" in sys.argv:
+        if sys.argv.index("--profile") == argc-1 or \
+                sys.argv[sys.argv.index("--profile") + 1] not in Connection.PROFILES:
+            print("Invalid command-line arguments!")
+            print(f"Profiles: {', '.join(Connection.PROFILES)}")
+            os._exit(1)
+        profile = sys.argv[sys.argv.index("--profile") + 1]
+
+    # time every statement, logging those over --slow-query-ms (default 100) with their plans
+    if "--query-stats" in sys.argv or "--slow-query-ms" in sys.argv or "--slow-query-log" in sys.argv:
+        try:
+            slowMs = float(sys.argv[sys.argv.index("--slow-query-ms") + 1]) \
+                if "--slow-query-ms" in sys.argv else None
+            slowLog = sys.argv[sys.argv.index("--slow-query-log") + 1] \
+                if "--slow-query-log" in sys.argv else None
+        except (IndexError, ValueError):
+            print("Invalid command-line arguments!")
+            os._exit(1)
+        QueryLog.enable(slowMs, slowLog)
+    QueryLog.tag("startup")
+    Connection.connect(dbPath, profile)
+
+    # batch tweet/retweet commits into groups of n
+    if "--group-commit" in sys.argv:
+        try:
+            Connection.set_group_commit(int(sys.argv[sys.argv.index("--group-commit") + 1]))
+        except (IndexError, ValueError):
+            print("Invalid command-line arguments!")
+            os._exit(1)
+
+    # size the user name/profile cache
+    for flag in ["--cache-size", "--cache-ttl"]:
+        if flag in sys.argv:
+            try:
+                value = float(sys.argv[sys.argv.index(flag) + 1])
+            except (IndexError, ValueError):
+                print("Invalid command-line arguments!")
+                os._exit(1)
+            if flag == "--cache-size":
+                UserCache.configure(size=int(value))
+            else:
+                UserCache.configure(ttl=value)
 
     # provide an option to drop all tables (fresh start)
     if "--reset" in sys.argv or "--test-mode" in sys.argv:
@@ -30,16 +79,97 @@ def main():
     # (does nothing if the tables already exist/have been provided)
     Setup.define_tables()
 
+    # recompute the denormalized tweet/user counters from scratch
+    if "--repair-counters" in sys.argv:
+        Setup.repair_counters()
+
     # insert mock data for testing
     if "--test-mode" in sys.argv:
         Test.insert_test_data()
 
+    # bulk-load a synthetic dataset of the given size
+    if "--generate" in sys.argv:
+        try:
+            idx = sys.argv.index("--generate")
+            numUsers, numTweets = int(sys.argv[idx + 1]), int(sys.argv[idx + 2])
+            seed = int(sys.argv[sys.argv.index("--seed") + 1]) if "--seed" in sys.argv else 0
+        except (IndexError, ValueError):
+            print("Invalid command-line arguments!")
+            os._exit(1)
+        Test.generate_data(numUsers, numTweets, seed)
+
+    # load users/follows/tweets/retweets from JSONL or CSV files (--ingest kind path, repeatable)
+    if "--ingest" in sys.argv:
+        try:
+            files = [(sys.argv[idx + 1], sys.argv[idx + 2])
+                     for idx, arg in enumerate(sys.argv) if arg == "--ingest"]
+            batchSize = int(sys.argv[sys.argv.index("--ingest-batch") + 1]) if "--ingest-batch" in sys.argv else 100000
+        except (IndexError, ValueError):
+            print("Invalid command-line arguments!")
+            os._exit(1)
+        if any(kind not in Ingest.COLUMNS or not os.path.isfile(path) for kind, path in files):
+            print("Invalid command-line arguments!")
+            print(f"Kinds: {', '.join(Ingest.COLUMNS)}")
+            os._exit(1)
+        Ingest.ingest(files, batchSize, "--keep-indexes" not in sys.argv)
+
+    # manage the materialized timeline (rebuild/drop, or check it and exit)
+    if "--timeline" in sys.argv:
+        if sys.argv.index("--timeline") == argc-1:
+            print("Invalid command-line arguments!")
+            os._exit(1)
+        action = sys.argv[sys.argv.index("--timeline") + 1]
+        if action == "rebuild":
+            Timeline.rebuild()
+        elif action == "drop":
+            Timeline.drop()
+        elif action == "check":
+            ok = True
+            if Timeline.is_enabled():
+                ok = Timeline.check()
+            else:
+                print("The timeline is not enabled, nothing to check.")
+            Connection.close()
+            os._exit(0 if ok else 1)
+        else:
+            print("Invalid command-line arguments!")
+            os._exit(1)
+
+    # serve the commands as a JSON API on localhost until interrupted, then exit
+    if "--serve" in sys.argv:
+        try:
+            port = int(sys.argv[sys.argv.index("--serve") + 1])
+            workers = int(sys.argv[sys.argv.index("--workers") + 1]) if "--workers" in sys.argv else 8
+            poolSize = int(sys.argv[sys.argv.index("--pool-size") + 1]) if "--pool-size" in sys.argv else None
+        except (IndexError, ValueError):
+            print("Invalid command-line arguments!")
+            os._exit(1)
+        Connection.close()
+        Server.run(dbPath, port, workers, profile, poolSize)
+        os._exit(0)
+
+    # run commands from a script/JSONL file (- for stdin) instead of the shell, then exit
+    if "--batch" in sys.argv:
+        if sys.argv.index("--batch") == argc-1:
+            print("Invalid command-line arguments!")
+            os._exit(1)
+        ok = Batch.run_file(sys.argv[sys.argv.index("--batch") + 1],
+                            "--batch-transaction" in sys.argv)
+        if QueryLog.enabled:
+            with contextlib.redirect_stdout(sys.stderr):
+                QueryLog.print_summary()
+        Connection.close()
+        os._exit(0 if ok else 1)
+
     # welcome message, present infinite shell
     Shell.clear()
     print("Welcome to Shell Twitter!")
     print("Type 'help' at any shell prompt (>>>) to see a list of available commands")
+    settings = ", ".join(f"{k}={v}" for k, v in Connection.settings().items())
+    print(f"[db profile '{Connection.profile}': {settings}]")
     print()
     while True:
+        Connection.flush()  # never hold writes back while waiting on the user
         cmd = input(">>> ").strip().lower()
         Shell.main_menu_do(cmd)
 